@@ -0,0 +1,69 @@
+import argparse
+import sys
+
+from image_resizer.backfill import (
+    DEFAULT_SIZES,
+    list_keys,
+    parse_sizes,
+    read_manifest,
+    run,
+)
+from image_resizer.storage import add_client_arguments, open_client_from
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Create derivatives of the originals in advance"
+    )
+    parser.add_argument("bucket", help="bucket of the originals")
+    keys = parser.add_mutually_exclusive_group(required=True)
+    keys.add_argument("--prefix", help="resize all originals under the prefix")
+    keys.add_argument("--manifest", help="file of the keys to resize, one per line")
+    parser.add_argument(
+        "--sizes",
+        type=parse_sizes,
+        default=DEFAULT_SIZES,
+        help="comma separated sizes like 100,200x200,x300 (default: widths of the hints)",
+    )
+    parser.add_argument("--quality", type=int, default=None)
+    parser.add_argument(
+        "--profile",
+        choices=("fast", "small"),
+        default=None,
+        help="encoder profile, as the profile query parameter (default: by image size)",
+    )
+    parser.add_argument("--derivative-bucket", default=None)
+    parser.add_argument("--derivative-prefix", default=None)
+    parser.add_argument(
+        "--progress", default=None, help="file recording done keys to resume from"
+    )
+    parser.add_argument("--threads", type=int, default=8, help="download and upload")
+    parser.add_argument("--processes", type=int, default=None, help="decode and encode")
+    add_client_arguments(parser)
+    args = parser.parse_args(argv)
+
+    client = open_client_from(args)
+
+    if args.manifest is not None:
+        keys = read_manifest(args.manifest)
+    else:
+        keys = list_keys(client, args.bucket, args.prefix)
+
+    report = run(
+        client,
+        args.bucket,
+        keys,
+        sizes=args.sizes,
+        quality=args.quality,
+        profile=args.profile,
+        derivative_bucket=args.derivative_bucket,
+        derivative_prefix=args.derivative_prefix,
+        progress_path=args.progress,
+        threads=args.threads,
+        processes=args.processes,
+    )
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_resizer.image import ImageFormat  # noqa: E402
+from image_resizer.request import RESIZING_HINT_SIZES  # noqa: E402
+from resize import _generate_original  # noqa: E402
+
+# Originals generated if the bucket directory is empty, in formats and megapixels
+CORPUS_FORMATS = (ImageFormat.JPEG, ImageFormat.PNG, ImageFormat.WEBP)
+CORPUS_MEGAPIXELS = (2.0, 12.0)
+# Seconds to wait for the server to accept connections
+STARTUP_TIMEOUT = 10.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure throughput and latency of the HTTP server over originals "
+        "in a local directory requested in all hint widths"
+    )
+    parser.add_argument(
+        "--root",
+        default=os.path.join(tempfile.gettempdir(), "image-resizer-load"),
+        help="directory whose subdirectories are buckets",
+    )
+    parser.add_argument(
+        "--bucket",
+        default="originals",
+        help="bucket of the originals, generated if it's empty",
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--workers", type=int, default=None, help="of the server")
+    args = parser.parse_args()
+
+    keys = _prepare_originals(os.path.join(args.root, args.bucket))
+    targets = [
+        f"/{key}?w={width}"
+        for key, (width, _) in itertools.product(keys, RESIZING_HINT_SIZES)
+    ]
+
+    port = _free_port()
+    command = [
+        sys.executable,
+        os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py"
+        ),
+        args.bucket,
+        "--local-root",
+        args.root,
+        "--port",
+        str(port),
+    ]
+    if args.workers is not None:
+        command += ["--workers", str(args.workers)]
+    server = subprocess.Popen(command)
+    try:
+        results = asyncio.run(_run(port, targets, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+    _print_results(results, args.duration)
+    sys.exit(1 if results["errors"] else 0)
+
+
+def _prepare_originals(bucket_dir: str) -> list[str]:
+    if not os.path.isdir(bucket_dir) or not os.listdir(bucket_dir):
+        for fmt, megapixels in itertools.product(CORPUS_FORMATS, CORPUS_MEGAPIXELS):
+            _generate_original(bucket_dir, fmt, megapixels)
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), bucket_dir).replace(os.sep, "/")
+        for directory, _, names in os.walk(bucket_dir)
+        for name in names
+        if not name.startswith(".")
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _run(
+    port: int, targets: list[str], concurrency: int, duration: float
+) -> dict:
+    await _wait_until_ready(port)
+    results = {"latencies": [], "statuses": Counter(), "bytes": 0, "errors": 0}
+    # Requests are spread over the connections in order, so all targets are requested
+    targets = itertools.cycle(targets)
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *(_request_until(port, targets, deadline, results) for _ in range(concurrency))
+    )
+    return results
+
+
+async def _wait_until_ready(port: int) -> None:
+    deadline = time.perf_counter() + STARTUP_TIMEOUT
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except ConnectionError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def _request_until(port: int, targets, deadline: float, results: dict) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.perf_counter() < deadline:
+            target = next(targets)
+            started_at = time.perf_counter()
+            try:
+                status, length = await _request(reader, writer, target)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                results["errors"] += 1
+                writer.close()
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                continue
+            results["latencies"].append((time.perf_counter() - started_at) * 1000)
+            results["statuses"][status] += 1
+            results["bytes"] += length
+    finally:
+        writer.close()
+
+
+async def _request(reader, writer, target: str) -> tuple[int, int]:
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ")[1])
+    headers = dict(line.split(": ", 1) for line in head[1:] if line)
+    length = int(headers.get("Content-Length", "0"))
+    await reader.readexactly(length)
+    return status, length
+
+
+def _print_results(results: dict, duration: float) -> None:
+    latencies = results["latencies"]
+    print(f"requests {len(latencies)}, {len(latencies) / duration:.1f} per second")
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(
+            f"latency p50 {percentiles[49]:.1f} ms, p90 {percentiles[89]:.1f} ms, "
+            f"p99 {percentiles[98]:.1f} ms"
+        )
+    if latencies:
+        print(f"output {results['bytes'] / len(latencies):.0f} bytes on average")
+    print("statuses", dict(results["statuses"]), "errors", results["errors"])
+
+
+if __name__ == "__main__":
+    main()
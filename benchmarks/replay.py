@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_resizer import storage  # noqa: E402
+
+# Time limit of Lambda@Edge for origin events, from which the remaining time is given
+DEFAULT_TIME_LIMIT_MS = 30000
+# Percentiles reported for each stage
+PERCENTILES = (50, 95, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay CloudFront events to main.handle in worker processes like "
+        "warm Lambda containers, and report throughput, latency of the stages, "
+        "statuses and peak memory"
+    )
+    parser.add_argument(
+        "events",
+        nargs="+",
+        help="JSON file of an event like tests/sample_request.json, "
+        "or JSONL file of events in a line each",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="worker processes handling events"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the events")
+    parser.add_argument(
+        "--fill",
+        default=os.path.join(ROOT, "tests", "sample_image.jpg"),
+        help="image stored in the memory backend for every original of the events",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="clear the in-memory cache before each event, like cold containers",
+    )
+    parser.add_argument(
+        "--time-limit-ms",
+        type=int,
+        default=DEFAULT_TIME_LIMIT_MS,
+        help="time limit of Lambda given to the handler by its context",
+    )
+    # Originals are read from the memory backend filled by --fill unless given
+    storage.add_client_arguments(parser, default_backend="memory")
+    args = parser.parse_args()
+
+    events = [event for path in args.events for event in _read_events(path)]
+    if not events:
+        parser.error("No events are found")
+    events = events * args.repeat
+    # Events are dealt to the workers in turn, keeping their order in each worker
+    shares = [events[index :: args.concurrency] for index in range(args.concurrency)]
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.concurrency, mp_context=context) as executor:
+        futures = [executor.submit(_replay, share, args) for share in shares if share]
+        results = [future.result() for future in futures]
+
+    _print_results(results)
+    errors = sum(r["errors"] for r in results)
+    sys.exit(1 if errors else 0)
+
+
+def _read_events(path: str) -> list[dict]:
+    with open(path) as file:
+        text = file.read()
+    try:
+        return [json.loads(text)]
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _replay(events: list[dict], args: argparse.Namespace) -> dict:
+    # Imported in the worker, so that each worker pays the imports like a container
+    import main
+    from image_resizer.cache import cache
+    from image_resizer.local import MemoryClient
+    from image_resizer.request import parse
+
+    # The handler reads the originals by the client of the options in every region
+    client = storage.open_client_from(args)
+    storage.use_client(client)
+    if isinstance(client, MemoryClient):
+        with open(args.fill, "rb") as file:
+            original = file.read()
+        for event in events:
+            try:
+                bucket, path, *_ = parse(event["Records"][0]["cf"]["request"])
+            except Exception:
+                continue
+            client.put_object(Bucket=bucket, Key=path, Body=original)
+
+    results = {"stages": {}, "statuses": Counter(), "errors": 0}
+    # Monotonic clock is shared by the processes, so the workers are timed together
+    # from the first event, excluding the imports and filling the backend
+    results["started_at"] = time.monotonic()
+    for event in events:
+        if args.clear_cache:
+            cache.clear()
+        # Events are modified by the handler, so each one is handled in its copy
+        event = json.loads(json.dumps(event))
+        event_type = event["Records"][0]["cf"]["config"]["eventType"]
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                response = main.handle(event, _Context(args.time_limit_ms))
+        except Exception as exception:
+            print("An error occurred:", exception)
+            results["errors"] += 1
+            results["statuses"]["exception"] += 1
+            continue
+        if event_type.endswith("request"):
+            results["statuses"][event_type] += 1
+        else:
+            status = str(response.get("status"))
+            results["statuses"][status] += 1
+            results["errors"] += int(status.startswith("5"))
+        for name, value in _metrics_of(log.getvalue()).items():
+            results["stages"].setdefault(name, []).append(value)
+
+    results["finished_at"] = time.monotonic()
+    # Peak RSS of this worker, in KiB on Linux
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+class _Context:
+    # Context of Lambda, whose remaining time counts down from the event arrival
+    def __init__(self, time_limit_ms: int):
+        self.deadline = time.monotonic() + time_limit_ms / 1000
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def _metrics_of(log: str) -> dict[str, float]:
+    # Stage timings are taken from the line of Embedded Metric Format by the handler
+    for line in reversed(log.splitlines()):
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "_aws" in record:
+            return {
+                name: value
+                for name, value in record.items()
+                if name.endswith("_ms") and isinstance(value, (int, float))
+            }
+    return {}
+
+
+def _print_results(results: list[dict]) -> None:
+    statuses = Counter()
+    stages = {}
+    for result in results:
+        statuses.update(result["statuses"])
+        for name, values in result["stages"].items():
+            stages.setdefault(name, []).extend(values)
+    handled = sum(statuses.values())
+    elapsed = max(r["finished_at"] for r in results) - min(
+        r["started_at"] for r in results
+    )
+
+    print(f"events {handled} in {elapsed:.1f} s, {handled / elapsed:.1f} per second")
+    print(
+        f"{'stage':<16} {'count':>7} "
+        + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES)
+    )
+    for name in sorted(stages, key=lambda n: (n == "total_ms", n)):
+        values = stages[name]
+        percentiles = _percentiles(values)
+        print(
+            f"{name.removesuffix('_ms'):<16} {len(values):>7} "
+            + " ".join(f"{percentiles[p]:>9.1f}" for p in PERCENTILES)
+        )
+    for status, count in sorted(statuses.items()):
+        print(f"status {status}: {count} ({count / handled:.1%})")
+    peaks = [result["peak_rss_mb"] for result in results]
+    print(
+        f"peak RSS of workers: max {max(peaks):.1f} MB, "
+        f"median {statistics.median(peaks):.1f} MB"
+    )
+
+
+def _percentiles(values: list[float]) -> dict[int, float]:
+    if len(values) == 1:
+        return {p: values[0] for p in PERCENTILES}
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return {p: quantiles[p - 1] for p in PERCENTILES}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from image_resizer.image import (  # noqa: E402
+    ImageFormat,
+    ImageTooLargeError,
+    _is_encodable,
+    resize,
+)
+from image_resizer.request import RESIZING_HINT_SIZES  # noqa: E402
+
+# Resolutions of the originals in megapixels, from a thumbnail to a camera photo
+DEFAULT_MEGAPIXELS = (0.3, 2.0, 12.0, 50.0)
+# Aspect ratio of the originals, which is of the most common camera photos
+ASPECT_RATIO = 4 / 3
+# Memory size in MB of the budgets, which lets the largest default original be decoded
+DEFAULT_MEMORY_SIZE_MB = 2048
+# Regression allowed against the baseline before the run fails
+DEFAULT_MAX_LATENCY_REGRESSION = 0.2
+DEFAULT_MAX_BYTES_REGRESSION = 0.05
+# Latency is regarded as regressed only if it's also slower by this, as short runs are noisy
+LATENCY_SLACK_MS = 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure latency and output of image.resize over generated originals "
+        "of all formats and resolutions in all hint widths"
+    )
+    parser.add_argument(
+        "--formats",
+        default=",".join(f.name for f in ImageFormat),
+        help="comma separated formats of the originals",
+    )
+    parser.add_argument(
+        "--megapixels",
+        default=",".join(str(m) for m in DEFAULT_MEGAPIXELS),
+        help="comma separated resolutions of the originals",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each case")
+    parser.add_argument(
+        "--profile",
+        choices=("fast", "small"),
+        default=None,
+        help="encoder profile (default: chosen by the size of the output)",
+    )
+    parser.add_argument(
+        "--filter",
+        default=None,
+        help="resampling filter like nearest, bilinear and lanczos (default: lanczos)",
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        default=os.path.join(tempfile.gettempdir(), "image-resizer-corpus"),
+        help="directory where the generated originals are kept for the next runs",
+    )
+    parser.add_argument(
+        "--memory-size-mb",
+        type=int,
+        default=DEFAULT_MEMORY_SIZE_MB,
+        help="memory size from which the decoding budget is taken, "
+        f"over which originals are rejected (default: {DEFAULT_MEMORY_SIZE_MB})",
+    )
+    parser.add_argument("--baseline", default=None, help="baseline JSON to compare")
+    parser.add_argument(
+        "--save-baseline", default=None, help="save the results as baseline JSON"
+    )
+    parser.add_argument(
+        "--max-latency-regression", type=float, default=DEFAULT_MAX_LATENCY_REGRESSION
+    )
+    parser.add_argument(
+        "--max-bytes-regression", type=float, default=DEFAULT_MAX_BYTES_REGRESSION
+    )
+    args = parser.parse_args()
+
+    formats = [ImageFormat[name.strip().upper()] for name in args.formats.split(",")]
+    megapixels = [float(m) for m in args.megapixels.split(",")]
+    # Inherited by the processes measuring the originals, where config is imported again
+    os.environ["IMAGE_RESIZER_MEMORY_SIZE_MB"] = str(args.memory_size_mb)
+
+    results = {}
+    for fmt in formats:
+        if not _is_encodable(fmt.name):
+            print(f"Skip {fmt.name}: not supported by this build of Pillow")
+            continue
+        for mp in megapixels:
+            path = _generate_original(args.corpus_dir, fmt, mp)
+            # Each original is measured in a fresh process to get its own peak RSS
+            results.update(
+                _run_isolated(path, fmt, args.repeat, args.profile, args.filter)
+            )
+
+    _print_results(results)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baseline is saved: {args.save_baseline}")
+
+    failures = []
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        failures = _compare(
+            results,
+            baseline,
+            args.max_latency_regression,
+            args.max_bytes_regression,
+        )
+    for failure in failures:
+        print("Regression:", failure)
+    sys.exit(1 if failures else 0)
+
+
+def _generate_original(corpus_dir: str, fmt: ImageFormat, megapixels: float) -> str:
+    # Smooth noise over a fractal is compressed like photos, unlike solid colors
+    # Generated from a fixed seed, so that the output length is comparable across runs
+    width = round(math.sqrt(megapixels * 1_000_000 * ASPECT_RATIO))
+    height = round(width / ASPECT_RATIO)
+    path = os.path.join(corpus_dir, f"{megapixels}mp.{fmt.name.lower()}")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    seeded = random.Random(f"{width}x{height}")
+    noise = Image.frombytes("RGB", (64, 48), seeded.randbytes(64 * 48 * 3))
+    noise = noise.resize((width, height), Image.Resampling.BICUBIC)
+    fractal = Image.effect_mandelbrot(
+        (width, height), (-2.0, -1.2, 1.0, 1.2), 100
+    ).convert("RGB")
+    image = Image.blend(noise, fractal, 0.5)
+    if fmt is ImageFormat.GIF:
+        image = image.quantize(256)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    image.save(temporary_path, format=fmt.name)
+    os.replace(temporary_path, path)
+    return path
+
+
+def _run_isolated(
+    path: str,
+    fmt: ImageFormat,
+    repeat: int,
+    profile: str | None,
+    resample: str | None,
+) -> dict:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(_measure, path, fmt, repeat, profile, resample).result()
+
+
+def _measure(
+    path: str,
+    fmt: ImageFormat,
+    repeat: int,
+    profile: str | None,
+    resample: str | None,
+) -> dict:
+    with open(path, "rb") as file:
+        original = file.read()
+    megapixels = os.path.basename(path).split("mp.")[0]
+
+    results = {}
+    for width, _ in RESIZING_HINT_SIZES:
+        # Proportional mode keeps the ratio by width, and exact mode fills the square
+        for mode, height in (("proportional", None), ("exact", width)):
+            latencies = []
+            try:
+                for _ in range(repeat):
+                    started_at = time.perf_counter()
+                    stream, output_fmt = resize(
+                        BytesIO(original),
+                        fmt,
+                        width,
+                        height,
+                        None,
+                        profile=profile,
+                        resample=resample,
+                    )
+                    latencies.append((time.perf_counter() - started_at) * 1000)
+            except ImageTooLargeError as error:
+                # Lambda answers these with the original, so there's nothing to measure
+                print(f"Skip {fmt.name}/{megapixels}mp: {error}")
+                return {}
+            output_bytes = stream.getbuffer().nbytes
+            with Image.open(stream) as output:
+                pixel_bytes = output.width * output.height * len(output.getbands())
+            results[f"{fmt.name}/{megapixels}mp/{mode}/w{width}"] = {
+                "p50_ms": _percentile(latencies, 50),
+                "p90_ms": _percentile(latencies, 90),
+                "p99_ms": _percentile(latencies, 99),
+                "output_bytes": output_bytes,
+                "compression_ratio": pixel_bytes / output_bytes,
+                "output_format": output_fmt.name,
+            }
+
+    # Peak RSS of this process, in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for result in results.values():
+        result["peak_rss_mb"] = peak_rss_mb
+    return results
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def _print_results(results: dict) -> None:
+    print(
+        f"{'case':<36} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+        f"{'bytes':>9} {'ratio':>7} {'rss MB':>8}"
+    )
+    for case, result in results.items():
+        print(
+            f"{case:<36} {result['p50_ms']:>9.1f} {result['p90_ms']:>9.1f} "
+            f"{result['p99_ms']:>9.1f} {result['output_bytes']:>9} "
+            f"{result['compression_ratio']:>7.1f} {result['peak_rss_mb']:>8.1f}"
+        )
+
+
+def _compare(
+    results: dict,
+    baseline: dict,
+    max_latency_regression: float,
+    max_bytes_regression: float,
+) -> list[str]:
+    # Median latency is compared, as higher percentiles of a few runs are noisy
+    failures = []
+    for case, result in results.items():
+        expected = baseline.get(case)
+        if expected is None:
+            continue
+        max_ms = max(
+            expected["p50_ms"] * (1 + max_latency_regression),
+            expected["p50_ms"] + LATENCY_SLACK_MS,
+        )
+        if result["p50_ms"] > max_ms:
+            failures.append(f"{case} p50 {result['p50_ms']:.1f} ms > {max_ms:.1f} ms")
+        max_bytes = expected["output_bytes"] * (1 + max_bytes_regression)
+        if result["output_bytes"] > max_bytes:
+            failures.append(
+                f"{case} output {result['output_bytes']} bytes > {max_bytes:.0f} bytes"
+            )
+    return failures
+
+
+if __name__ == "__main__":
+    main()
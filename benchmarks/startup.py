@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Code run in a fresh interpreter to measure a cold start.
+# S3 is stubbed with the sample image, so that the first event is handled offline.
+_COLD_START = """
+import json
+import time
+
+with open("tests/sample_request.json") as file:
+    event = json.load(file)
+with open("tests/sample_image.jpg", "rb") as file:
+    original = file.read()
+
+started_at = time.perf_counter()
+import main
+
+imported_at = time.perf_counter()
+
+# Creating the stubbed client is a part of the first event, as boto3 is imported lazily
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from io import BytesIO
+
+from image_resizer.storage import get_client
+
+stubber = Stubber(get_client("ap-northeast-2"))
+stubber.add_response(
+    "get_object",
+    {"ContentType": "image/jpeg", "Body": StreamingBody(BytesIO(original), len(original))},
+)
+stubber.activate()
+
+response = main.handle(event, None)
+assert response["status"] == 200, response["status"]
+finished_at = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported_at - started_at) * 1000,
+    "first_event_ms": (finished_at - imported_at) * 1000,
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure import time and time to the first handled event "
+        "of the Lambda handler in fresh interpreters"
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-event-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    results = [_run_cold_start() for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    first_event_ms = statistics.median(r["first_event_ms"] for r in results)
+    print(f"runs: {args.runs}")
+    print(f"import main (median): {import_ms:.1f} ms")
+    print(f"first origin-response event (median): {first_event_ms:.1f} ms")
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import {import_ms:.1f} ms > {args.max_import_ms} ms")
+    if args.max_first_event_ms is not None and first_event_ms > args.max_first_event_ms:
+        failures.append(
+            f"first event {first_event_ms:.1f} ms > {args.max_first_event_ms} ms"
+        )
+    for failure in failures:
+        print("Regression:", failure)
+    sys.exit(1 if failures else 0)
+
+
+def _run_cold_start() -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {
+        **os.environ,
+        "PYTHONPATH": root,
+        "IMAGE_RESIZER_DERIVATIVE_ENABLED": "0",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+    }
+    completed = subprocess.run(
+        [sys.executable, "-c", _COLD_START],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
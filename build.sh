@@ -8,7 +8,12 @@ zip -r ../artifact.zip .
 cd ../..
 zip ./deploy/artifact.zip main.py
 zip -g ./deploy/artifact.zip image_resizer/__init__.py
+zip -g ./deploy/artifact.zip image_resizer/cache.py
+zip -g ./deploy/artifact.zip image_resizer/config.py
+zip -g ./deploy/artifact.zip image_resizer/derivative.py
 zip -g ./deploy/artifact.zip image_resizer/image.py
+zip -g ./deploy/artifact.zip image_resizer/local.py
+zip -g ./deploy/artifact.zip image_resizer/metrics.py
 zip -g ./deploy/artifact.zip image_resizer/request.py
 zip -g ./deploy/artifact.zip image_resizer/response.py
 zip -g ./deploy/artifact.zip image_resizer/storage.py
@@ -0,0 +1,313 @@
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+
+from . import config, derivative
+from .image import ImageFormat, needs_resize, resize_many
+from .request import RESIZING_HINT_SIZES
+from .response import body_budget
+from .storage import ObjectNotModifiedError, load_remaining, probe, save
+
+# Widths of the resizing hints, which are the most requested sizes
+DEFAULT_SIZES = RESIZING_HINT_SIZES
+# Interval in seconds of printing progress
+REPORT_INTERVAL = 10.0
+
+
+@dataclass
+class Report:
+    originals: int = 0
+    skipped: int = 0
+    failed: list[str] = field(default_factory=list)
+    derivatives: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"{self.originals} originals ({self.originals / elapsed:.1f}/s), "
+            f"{self.derivatives} derivatives ({self.derivatives / elapsed:.1f}/s), "
+            f"{self.bytes_read / elapsed / 1024 / 1024:.2f} MiB/s read, "
+            f"{self.bytes_written / elapsed / 1024 / 1024:.2f} MiB/s written, "
+            f"{self.skipped} skipped, {len(self.failed)} failed in {elapsed:.1f}s"
+        )
+
+
+def list_keys(client, bucket: str, prefix: str) -> Iterator[str]:
+    # Keys are listed page by page, so that processing starts before listing ends
+    token = ""
+    while True:
+        kwargs = {"ContinuationToken": token} if token else {}
+        response = client.list_objects_v2(Bucket=bucket, Prefix=prefix, **kwargs)
+        for content in response.get("Contents", []):
+            yield content["Key"]
+        token = response.get("NextContinuationToken", "")
+        if not response.get("IsTruncated") or not token:
+            return
+
+
+def read_manifest(path: str | Path) -> Iterator[str]:
+    # One key per line, and empty lines and lines starting with "#" are ignored
+    with open(path) as manifest:
+        for line in manifest:
+            key = line.strip()
+            if key and not key.startswith("#"):
+                yield key
+
+
+def parse_sizes(text: str) -> tuple[tuple[int | None, int | None], ...]:
+    # ((100, None), (200, 200), (None, 300)) <- "100,200x200,x300"
+    sizes = []
+    for size in text.split(","):
+        width, _, height = size.strip().partition("x")
+        sizes.append((int(width) if width else None, int(height) if height else None))
+    return tuple(sizes)
+
+
+def run(
+    client,
+    bucket: str,
+    keys: Iterable[str],
+    sizes: Iterable[tuple[int | None, int | None]] = DEFAULT_SIZES,
+    quality: int | None = None,
+    profile: str | None = None,
+    derivative_bucket: str | None = None,
+    derivative_prefix: str | None = None,
+    progress_path: str | Path | None = None,
+    threads: int = 8,
+    processes: int | None = None,
+    max_in_flight: int | None = None,
+) -> Report:
+    # Originals flow through three stages running at the same time
+    # Downloading and uploading wait for network in threads,
+    # while decoding and encoding hold GIL and run in processes
+    sizes = tuple(sizes)
+    derivative_bucket = derivative_bucket or config.DERIVATIVE_BUCKET or bucket
+    if derivative_prefix is None:
+        derivative_prefix = config.DERIVATIVE_PREFIX
+    # Derivatives stored in the same bucket are listed with originals, but not resized again
+    derivatives_root = (
+        f"{derivative_prefix.strip('/')}/" if derivative_bucket == bucket else None
+    )
+    # Number of originals in the stages is bounded, so that fast downloading
+    # doesn't pile up originals in memory in front of slow resizing
+    max_in_flight = max_in_flight or threads * 2
+    # Lambda@Edge rejects the response larger than its limit even if it comes from derivatives
+    max_bytes = body_budget({"headers": {}})
+
+    report = Report()
+    done = _load_progress(progress_path)
+    keys = iter(keys)
+    # Stage and key of each running task, and ETag and remaining uploads of each original
+    pending: dict[Future, tuple[str, str]] = {}
+    originals: dict[str, list] = {}
+    reported_at = time.monotonic()
+
+    with (
+        ThreadPoolExecutor(threads) as io_executor,
+        ProcessPoolExecutor(processes) as cpu_executor,
+        _open_progress(progress_path) as progress,
+    ):
+
+        def submit(executor: Executor, stage: str, key: str, fn, *args):
+            pending[executor.submit(fn, *args)] = (stage, key)
+
+        def finish(key: str, exception: Exception | None = None):
+            originals_etag, _ = originals.pop(key)
+            if exception is not None:
+                print(f"Failed to backfill {bucket}/{key}:", exception)
+                report.failed.append(key)
+                return
+            report.originals += 1
+            if progress is not None:
+                progress.write(f"{key}\t{originals_etag}\n")
+                progress.flush()
+
+        while True:
+            # Start downloading next originals as long as the stages have room
+            while len(originals) < max_in_flight:
+                key = next(keys, None)
+                if key is None:
+                    break
+                if key in originals or (
+                    derivatives_root and key.startswith(derivatives_root)
+                ):
+                    report.skipped += 1
+                    continue
+                # The original done by the previous run is loaded only if it's updated
+                originals[key] = ["", 0]
+                submit(
+                    io_executor,
+                    "download",
+                    key,
+                    _download,
+                    client,
+                    bucket,
+                    key,
+                    sizes,
+                    done.get(key),
+                )
+            if not pending:
+                break
+
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                stage, key = pending.pop(future)
+                if key not in originals:
+                    # Another task of the same original has already failed
+                    continue
+                try:
+                    result = future.result()
+                except Exception as exception:
+                    finish(key, exception)
+                    continue
+
+                match stage:
+                    case "download" if result is None:
+                        del originals[key]
+                        report.skipped += 1
+                    case "download":
+                        data, fmt, etag = result
+                        report.bytes_read += len(data)
+                        originals[key][0] = etag
+                        submit(
+                            cpu_executor,
+                            "resize",
+                            key,
+                            _resize_all,
+                            data,
+                            fmt,
+                            sizes,
+                            quality,
+                            max_bytes,
+                            profile,
+                        )
+                    case "resize":
+                        etag = originals[key][0]
+                        for (width, height), resized in zip(sizes, result):
+                            if resized is None:
+                                continue
+                            derivative_key = derivative.build_key(
+                                derivative_prefix,
+                                key,
+                                etag,
+                                derivative.Variant(
+                                    width, height, quality, profile=profile
+                                ),
+                            )
+                            originals[key][1] += 1
+                            submit(
+                                io_executor,
+                                "upload",
+                                key,
+                                _upload,
+                                client,
+                                derivative_bucket,
+                                derivative_key,
+                                *resized,
+                            )
+                        if not originals[key][1]:
+                            finish(key)
+                    case "upload":
+                        report.derivatives += 1
+                        report.bytes_written += result
+                        originals[key][1] -= 1
+                        if not originals[key][1]:
+                            finish(key)
+
+            if time.monotonic() - reported_at >= REPORT_INTERVAL:
+                reported_at = time.monotonic()
+                print("Backfill in progress:", report.summary())
+
+    print("Backfill finished:", report.summary())
+    return report
+
+
+def _download(
+    client,
+    bucket: str,
+    key: str,
+    sizes: tuple[tuple[int | None, int | None], ...],
+    done_etag: str | None,
+) -> tuple[bytes, ImageFormat, str] | None:
+    # The original is loaded in the same way as the handler to get the same ETag
+    # None is returned if the original is not updated since the previous run
+    try:
+        stream, fmt, size, etag = probe(
+            client, bucket, key, config.S3_PROBE_BYTES, done_etag
+        )
+    except ObjectNotModifiedError:
+        return None
+    if not any(needs_resize(stream, fmt, width, height) for width, height in sizes):
+        # The handler returns the original as is for all sizes, so the rest isn't loaded
+        stream.close()
+        return b"", fmt, etag
+    stream = load_remaining(client, bucket, key, stream, size, etag)
+    # Bytes are sent to the process resizing the image
+    data = stream.getvalue()
+    stream.close()
+    return data, fmt, etag
+
+
+def _resize_all(
+    data: bytes,
+    fmt: ImageFormat,
+    sizes: tuple[tuple[int | None, int | None], ...],
+    quality: int | None,
+    max_bytes: int,
+    profile: str | None = None,
+) -> list[tuple[bytes, ImageFormat] | None]:
+    # Run in a worker process, so only bytes and picklable values cross the boundary
+    # None is returned for the size which the handler serves the original as is
+    if not data:
+        return [None] * len(sizes)
+    results = []
+    for resized in resize_many(
+        BytesIO(data), fmt, list(sizes), quality, max_bytes, profile=profile
+    ):
+        if resized is None:
+            results.append(None)
+            continue
+        stream, resized_fmt = resized
+        results.append((stream.getvalue(), resized_fmt))
+        stream.close()
+    return results
+
+
+def _upload(client, bucket: str, key: str, data: bytes, fmt: ImageFormat) -> int:
+    with BytesIO(data) as stream:
+        save(client, bucket, key, stream, fmt)
+    return len(data)
+
+
+def _load_progress(path: str | Path | None) -> dict[str, str]:
+    # Keys and ETags of the originals done by the previous run, which is resumed
+    # by skipping the originals not updated since then
+    # {"path/to/file.jpg": "\"0563e39b\""} <- "path/to/file.jpg\t\"0563e39b\""
+    if path is None or not Path(path).exists():
+        return {}
+    with open(path) as progress:
+        lines = [line.rstrip("\n") for line in progress if line.strip()]
+    return dict(line.rsplit("\t", 1) for line in lines)
+
+
+def _open_progress(path: str | Path | None):
+    # Keys are appended as soon as all derivatives of the original are uploaded
+    return nullcontext() if path is None else open(path, "a")
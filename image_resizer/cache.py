@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from . import config
+
+
+class ByteCache:
+    # Least recently used entries are evicted once the total length of values exceeds
+    # the budget, and the hits and misses are counted by the kind of entry,
+    # which is the first element of the key
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[bytes, object]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {}
+
+    def get(self, key: tuple) -> tuple[bytes, object] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(f"{key[0]}_misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count(f"{key[0]}_hits")
+            return entry
+
+    def put(self, key: tuple, data: bytes, metadata: object = None) -> None:
+        # A value larger than the budget would evict everything and be evicted itself
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (data, metadata)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._count("evictions")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counters.clear()
+
+    def _count(self, name: str) -> None:
+        self._counters[name] = self._counters.get(name, 0) + 1
+
+
+def _budget() -> int:
+    return int(config.MEMORY_SIZE_MB * 1024 * 1024 * config.CACHE_MEMORY_FRACTION)
+
+
+# Kept in module scope to be reused across warm invocations like S3 clients
+# Originals are keyed by ("original", bucket, path, ETag),
+# and derivatives by ("derivative", bucket, key of the derivative including ETag)
+cache = ByteCache(_budget())
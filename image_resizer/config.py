@@ -0,0 +1,118 @@
+import os
+
+# Lambda@Edge doesn't support environment variables, so the defaults below are deployed.
+# Environment variables are only for other runtimes like local tools and tests.
+
+# Whether resized images are stored in S3 and reused by later requests
+DERIVATIVE_ENABLED = os.environ.get("IMAGE_RESIZER_DERIVATIVE_ENABLED", "1") == "1"
+# Bucket of resized images, or the bucket of the original image if empty
+DERIVATIVE_BUCKET = os.environ.get("IMAGE_RESIZER_DERIVATIVE_BUCKET", "")
+# Key prefix of resized images
+DERIVATIVE_PREFIX = os.environ.get("IMAGE_RESIZER_DERIVATIVE_PREFIX", "_derivatives")
+
+# Storage of originals and derivatives, which is one of "s3", "local" and "memory"
+# "local" uses directories under the root as buckets, and maps files into memory
+STORAGE_BACKEND = os.environ.get("IMAGE_RESIZER_STORAGE_BACKEND", "s3")
+STORAGE_LOCAL_ROOT = os.environ.get("IMAGE_RESIZER_STORAGE_LOCAL_ROOT", "")
+
+# Region of S3 used if it is not found in the origin domain of the request
+S3_DEFAULT_REGION = os.environ.get("IMAGE_RESIZER_S3_DEFAULT_REGION", "ap-northeast-2")
+# Timeouts in seconds of connecting to and reading from S3,
+# which should be short enough to fit in the time limit of Lambda@Edge
+S3_CONNECT_TIMEOUT = float(os.environ.get("IMAGE_RESIZER_S3_CONNECT_TIMEOUT", "1"))
+S3_READ_TIMEOUT = float(os.environ.get("IMAGE_RESIZER_S3_READ_TIMEOUT", "5"))
+# Number of connections kept alive in the pool of S3 client
+S3_MAX_POOL_CONNECTIONS = int(
+    os.environ.get("IMAGE_RESIZER_S3_MAX_POOL_CONNECTIONS", "10")
+)
+# Reads of the origin response event give up this many seconds before the time limit
+# of Lambda, leaving the time to resize the image or pass the original response through
+S3_DEADLINE_MARGIN = float(os.environ.get("IMAGE_RESIZER_S3_DEADLINE_MARGIN", "3"))
+# A read with a deadline is hedged by the second request if the first doesn't respond
+# within this percentile of the recent reads up to 99, or never if 0
+S3_HEDGE_PERCENTILE = int(os.environ.get("IMAGE_RESIZER_S3_HEDGE_PERCENTILE", "95"))
+# Seconds to wait before hedging until enough reads are observed for the percentile
+S3_HEDGE_INITIAL_DELAY = float(
+    os.environ.get("IMAGE_RESIZER_S3_HEDGE_INITIAL_DELAY", "0.2")
+)
+# Number of the first bytes of the original loaded to read the image header,
+# which decides whether the original should be resized before loading the rest
+S3_PROBE_BYTES = int(os.environ.get("IMAGE_RESIZER_S3_PROBE_BYTES", "16384"))
+
+# Quality of JPEG, WEBP and AVIF if it's not requested, which is also set explicitly
+# to the query string of the origin request, so that requests with and without it match
+DEFAULT_QUALITY = int(os.environ.get("IMAGE_RESIZER_DEFAULT_QUALITY", "80"))
+# Longest width and height which can be requested
+MAX_WIDTH = int(os.environ.get("IMAGE_RESIZER_MAX_WIDTH", "2000"))
+MAX_HEIGHT = int(os.environ.get("IMAGE_RESIZER_MAX_HEIGHT", "5000"))
+# Widths (and heights requested alone) are rounded up to the nearest of these, so that
+# nearby sizes share the object cached by CloudFront and the derivative,
+# or not rounded if empty. Widths of the resizing hints should be kept in it
+SIZE_LADDER = tuple(
+    sorted(
+        int(size)
+        for size in os.environ.get(
+            "IMAGE_RESIZER_SIZE_LADDER", "100,200,300,400,600,800,1000,1200,1600,2000"
+        ).split(",")
+        if size.strip()
+    )
+)
+
+# Resampling filters which the viewer is allowed to request by the query string
+RESAMPLING_FILTERS = tuple(
+    name.strip()
+    for name in os.environ.get(
+        "IMAGE_RESIZER_RESAMPLING_FILTERS", "nearest,bilinear,lanczos"
+    ).split(",")
+    if name.strip()
+)
+
+# Whether ICC profile of the original is kept in the output, while the other metadata
+# like EXIF and XMP is always removed
+KEEP_ICC_PROFILE = os.environ.get("IMAGE_RESIZER_KEEP_ICC_PROFILE", "0") == "1"
+
+# Limits of animated GIF and WEBP resized with all frames, over which only the first
+# frame is resized, in number of frames and in pixels of all frames of the original
+ANIMATION_MAX_FRAMES = int(os.environ.get("IMAGE_RESIZER_ANIMATION_MAX_FRAMES", "1000"))
+ANIMATION_MAX_PIXELS = int(
+    os.environ.get("IMAGE_RESIZER_ANIMATION_MAX_PIXELS", str(200_000_000))
+)
+# Number of frames kept in the resized animation, over which frames are skipped evenly
+ANIMATION_FRAME_BUDGET = int(
+    os.environ.get("IMAGE_RESIZER_ANIMATION_FRAME_BUDGET", "100")
+)
+
+
+def _host_memory_mb() -> int:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, OSError, ValueError):
+        return 128
+
+
+# Memory size in MB which the budgets of decoding and caching are taken from
+# Lambda sets it to its reserved environment variable, available even in Lambda@Edge,
+# and the other runtimes like the local server and backfill take the memory of the host
+MEMORY_SIZE_MB = int(
+    os.environ.get("IMAGE_RESIZER_MEMORY_SIZE_MB")
+    or os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    or _host_memory_mb()
+)
+
+# Fraction of the memory of Lambda which the decoded pixels of an original may take,
+# over which JPEG is decoded at the smallest scale enough for the output and the others
+# are rejected before decoding, so that a huge image doesn't kill the container
+DECODE_MEMORY_FRACTION = float(
+    os.environ.get("IMAGE_RESIZER_DECODE_MEMORY_FRACTION", "0.4")
+)
+
+# Fraction of the memory of Lambda used to keep originals and derivatives in memory
+# across warm invocations, or 0 to disable it
+CACHE_MEMORY_FRACTION = float(
+    os.environ.get("IMAGE_RESIZER_CACHE_MEMORY_FRACTION", "0.25")
+)
+
+# Whether timings and sizes of the stages are logged in CloudWatch Embedded Metric Format
+METRICS_ENABLED = os.environ.get("IMAGE_RESIZER_METRICS_ENABLED", "1") == "1"
+# Namespace of the metrics in CloudWatch
+METRICS_NAMESPACE = os.environ.get("IMAGE_RESIZER_METRICS_NAMESPACE", "ImageResizer")
@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+from io import BytesIO
+
+from .image import DEFAULT_QUALITY, ImageFormat
+from .storage import (
+    ObjectNotFoundError,
+    StorageOperationError,
+    load,
+    save,
+    save_many,
+)
+
+
+@dataclass(frozen=True)
+class Variant:
+    # What the original is turned into, which tells a derivative apart from the others
+    # of the same original
+    width: int | None
+    height: int | None
+    quality: int | None = None
+    output_fmt: ImageFormat | None = None
+    profile: str | None = None
+    resample: str | None = None
+    fit: str | None = None
+
+    def keeps_original(self) -> bool:
+        # The original is returned as is without length and conversion
+        return self.width is None and self.height is None and self.output_fmt is None
+
+
+def build_key(prefix: str, path: str, etag: str, variant: Variant) -> str:
+    # ETag of the original is a part of key, so the derivatives of updated original are never reused
+    # "_derivatives/path/to/file.jpg/0563e39b/w100_hauto_q80" <- "path/to/file.jpg", "\"0563e39b\"", ...
+    etag = etag.strip('"')
+    parts = (prefix.strip("/"), path, etag, _format_variant(variant))
+    return "/".join(part for part in parts if part)
+
+
+def build_etag(etag: str, variant: Variant) -> str:
+    # Strong ETag of the derivative, which differs by the variant of the same original
+    # and can be turned back into ETag of the original by request.restore_original_etag
+    # "\"0563e39b-w100_hauto_q80\"" <- "\"0563e39b\"", Variant(100, None)
+    etag = etag.strip('"')
+    return f'"{etag}-{_format_variant(variant)}"'
+
+
+def lookup(
+    client, bucket: str, key: str, deadline: float | None = None
+) -> tuple[BytesIO, ImageFormat] | None:
+    # Missing or unreadable derivative is just a cache miss, and the original will be resized
+    # DeadlineExceededError is propagated, as there is no time to resize the original
+    try:
+        return load(client, bucket, key, deadline=deadline)
+    except ObjectNotFoundError:
+        return None
+    except StorageOperationError as exception:
+        print("Failed to look up derivative:", exception)
+        return None
+
+
+def store(client, bucket: str, key: str, stream: BytesIO, fmt: ImageFormat) -> None:
+    # Failure to store is not propagated because the resized image can be served anyway
+    try:
+        save(client, bucket, key, stream, fmt)
+    except StorageOperationError as exception:
+        print("Failed to store derivative:", exception)
+
+
+def store_many(
+    client,
+    bucket: str,
+    derivatives: list[tuple[str, BytesIO, ImageFormat]],
+    deadline: float | None = None,
+) -> None:
+    # Derivatives are stored concurrently, and those not stored by the deadline are
+    # skipped, as the response shouldn't wait for derivatives which may not be requested
+    # Any failure is only logged, as the resized image can be served anyway
+    objects = [(bucket, key, stream, fmt) for key, stream, fmt in derivatives]
+    for error in save_many(client, objects, deadline):
+        if error is not None:
+            print("Failed to store derivative:", error)
+
+
+def _format_variant(variant: Variant) -> str:
+    # Quality is filled with the default to share the same key with the request without quality
+    quality = DEFAULT_QUALITY if variant.quality is None else variant.quality
+    width, height = _format_length(variant.width), _format_length(variant.height)
+    formatted = f"w{width}_h{height}_q{quality}"
+    # Converted format, requested profile, filter and fit are parts of variant,
+    # while the variant without them is kept
+    if variant.output_fmt is not None:
+        formatted = f"{formatted}_f{variant.output_fmt.name.lower()}"
+    if variant.profile is not None:
+        formatted = f"{formatted}_p{variant.profile}"
+    if variant.resample is not None:
+        formatted = f"{formatted}_r{variant.resample}"
+    if variant.fit is not None:
+        formatted = f"{formatted}_m{variant.fit}"
+    return formatted
+
+
+def _format_length(length: int | None) -> str:
+    return "auto" if length is None else str(length)
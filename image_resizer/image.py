@@ -1,13 +1,116 @@
 from __future__ import annotations
 
+import importlib
+import math
+from dataclasses import dataclass, field
 from enum import Enum
 from io import BytesIO
 
-from PIL import Image
+from PIL import ExifTags, Image, UnidentifiedImageError
 
-DEFAULT_QUALITY = 80
-MAX_WIDTH = 2000
-MAX_HEIGHT = 5000
+from . import config, metrics
+from .request import PROFILES
+
+DEFAULT_QUALITY = config.DEFAULT_QUALITY
+MAX_WIDTH = config.MAX_WIDTH
+MAX_HEIGHT = config.MAX_HEIGHT
+# JPEG is decoded with DCT scaling (1/2 to 1/8) only if the decoded image is still
+# larger than the target by this factor, so that the final resampling has enough pixels
+DRAFT_REDUCING_GAP = 2.0
+# Resampling filters by the name requested in the query string, which are allowed
+# only if listed in config.RESAMPLING_FILTERS
+RESAMPLING_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "bilinear": Image.Resampling.BILINEAR,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+DEFAULT_FILTER = "lanczos"
+# How the image is fitted in the box if both width and height are requested
+# "fill" stretches the image to the box, "cover" crops the center of the image to the
+# ratio of the box and fills it, and "contain" keeps the ratio within the box
+FITS = ("cover", "contain", "fill")
+# Image downscaled by more than this factor is reduced by an integer factor with
+# Image.reduce at first, and then resampled by the filter for the rest of the factor
+# The result of 3.0 is hardly distinguishable from the one of a single resampling
+REDUCING_GAP = 3.0
+# Lowest quality and step of quality searched to fit the output in the byte budget
+MIN_QUALITY = 10
+QUALITY_STEP = 5
+# Number of pixels of the downsampled image encoded to estimate the output length
+BUDGET_PROBE_PIXELS = 256 * 256
+# Formats tried in order if the output doesn't fit the byte budget in its own format
+_FALLBACK_FORMATS = ("WEBP", "JPEG")
+
+# Pillow plugins of the supported formats, which are imported on demand.
+# Otherwise, Pillow imports all of its plugins to find an unknown format at first.
+_PLUGINS = {
+    "JPEG": "PIL.JpegImagePlugin",
+    "PNG": "PIL.PngImagePlugin",
+    "GIF": "PIL.GifImagePlugin",
+    "WEBP": "PIL.WebPImagePlugin",
+    "TIFF": "PIL.TiffImagePlugin",
+    "AVIF": "PIL.AvifImagePlugin",
+}
+# Output formats chosen in order by fmt=auto if accepted by the viewer, smaller first
+_AUTO_FORMATS = ("AVIF", "WEBP")
+# Transposition of the stored image by EXIF orientation, as ImageOps.exif_transpose,
+# and orientations whose width and height are swapped by the transposition
+_ORIENTATIONS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_SWAPPING_ORIENTATIONS = (5, 6, 7, 8)
+# Metadata removed from the output, which is a large part of small thumbnails
+# ICC profile is kept only if config.KEEP_ICC_PROFILE is set
+_METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "photoshop", "comment")
+# Bytes per pixel of the decoded image by mode, as Pillow stores the other modes
+# including RGB in 4 bytes per pixel
+_PIXEL_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2, "I;16N": 2}
+# Formats whose animation is kept if both the original and the output are in them
+_ANIMATED_FORMATS = ("GIF", "WEBP")
+
+# Options of encoders by format name and profile, trading CPU time for bytes on purpose
+# "fast" encodes in a single pass, and "small" spends more passes for smaller output
+ENCODER_PROFILES = {
+    "JPEG": {
+        "fast": {"optimize": False, "progressive": False, "subsampling": "4:2:0"},
+        "small": {"optimize": True, "progressive": True, "subsampling": "4:2:0"},
+    },
+    "PNG": {
+        "fast": {"compress_level": 1},
+        "small": {"compress_level": 9, "optimize": True},
+    },
+    "GIF": {
+        "fast": {"optimize": False},
+        "small": {"optimize": True},
+    },
+    "WEBP": {
+        "fast": {"method": 2},
+        "small": {"method": 6},
+    },
+    "TIFF": {
+        "fast": {"compression": "tiff_lzw"},
+        "small": {"compression": "tiff_adobe_deflate"},
+    },
+    "AVIF": {
+        "fast": {"speed": 8},
+        "small": {"speed": 4},
+    },
+}
+_PROFILES = PROFILES
+# Profile chosen by the number of output pixels unless requested, as thumbnails are
+# cheap to compress harder, while large outputs take long even in a single pass
+PROFILE_TIERS = ((512 * 512, "small"), (None, "fast"))
+# Profile used to search smaller settings, as the output exceeded the byte budget
+_BUDGET_PROFILE = "small"
+# Formats encoded in the given quality
+_QUALITY_FORMATS = ("JPEG", "WEBP", "AVIF")
 
 
 def resize(
@@ -16,33 +119,227 @@ def resize(
     width: int | None,
     height: int | None,
     quality: int | None,
-) -> BytesIO:
+    max_bytes: int | None = None,
+    output_fmt: ImageFormat | None = None,
+    profile: str | None = None,
+    resample: str | None = None,
+    fit: str | None = None,
+) -> tuple[BytesIO, ImageFormat]:
     _check_negative_length(width, height)
     _check_too_long_length(width, height)
+    _check_profile(profile)
+    _check_filter(resample)
+    _check_fit(fit)
 
     # Set default quality as 80
     quality = DEFAULT_QUALITY if quality is None else quality
+    resample = DEFAULT_FILTER if resample is None else resample
+
+    # Keep the format of the original unless another format is requested
+    output_fmt = fmt if output_fmt is None else output_fmt
+
+    # If both width and height are None and the format is kept, return the original image
+    if width is None and height is None and output_fmt is fmt:
+        return stream, fmt
 
-    # If both width and height are None, return the original image
+    # Animated GIF and WEBP are resized frame by frame to keep the animation
+    image = _open_animation(stream, fmt, output_fmt)
+    if image is not None:
+        target = (
+            _target_size(image.width, image.height, width, height, fit) or image.size
+        )
+        box = _crop_box(image.width, image.height, *target) if fit == "cover" else None
+        animation = _resize_frames(image, [target], resample, box)
+        resized = _encode_animation(
+            animation, target, output_fmt, quality, max_bytes, profile
+        )
+        stream.close()
+        return resized
+
+    # If both width and height are None, only convert the format without resizing
     if width is None and height is None:
-        return stream
+        image = _open(stream, fmt)
+        orientation = _orientation(image)
+        _decode(image)
+        image = _transpose(image, orientation)
+        converted = _encode(image, output_fmt, quality, max_bytes, profile)
+        stream.close()
+        return converted
+
+    # If both width and height are not None and the fit is cover, crop the image
+    # to the ratio and resize the cropped region only
+    if width is not None and height is not None and fit == "cover":
+        image = _resize_to_cover(stream, fmt, width, height, resample)
+        resized = _encode(image, output_fmt, quality, max_bytes, profile)
+        stream.close()
+        return resized
 
     # If both width and height are not None, resize the image exactly and ignore the ratio
-    if width is not None and height is not None:
-        resized_stream = _resize_exactly(stream, fmt, width, height, quality)
+    # unless the fit is contain
+    if width is not None and height is not None and fit != "contain":
+        image = _resize_exactly(stream, fmt, width, height, resample)
+        resized = _encode(image, output_fmt, quality, max_bytes, profile)
         stream.close()
-        return resized_stream
+        return resized
 
-    # If one of width and height is None, resize the image keeping the ratio
+    # If one of width and height is None or the fit is contain, resize the image
+    # keeping the ratio
     if width is not None or height is not None:
-        resized_stream = _resize_proportionally(stream, fmt, width, height, quality)
+        image = _resize_proportionally(stream, fmt, width, height, resample, fit)
+        resized = _encode(image, output_fmt, quality, max_bytes, profile)
         stream.close()
-        return resized_stream
+        return resized
 
     # Control should not be reached here
     raise RuntimeError("Unexpected image resize request")
 
 
+def resize_many(
+    stream: BytesIO,
+    fmt: ImageFormat,
+    sizes: list[tuple[int | None, int | None]],
+    quality: int | None,
+    max_bytes: int | None = None,
+    output_fmt: ImageFormat | None = None,
+    profile: str | None = None,
+    resample: str | None = None,
+) -> list[tuple[BytesIO, ImageFormat] | None]:
+    # Resize the image to all sizes decoding it only once
+    # None is returned for the size which the original is returned as is for,
+    # while the original is converted in its size if another format is requested
+    for width, height in sizes:
+        _check_negative_length(width, height)
+        _check_too_long_length(width, height)
+    _check_profile(profile)
+    _check_filter(resample)
+
+    quality = DEFAULT_QUALITY if quality is None else quality
+    resample = DEFAULT_FILTER if resample is None else resample
+    output_fmt = fmt if output_fmt is None else output_fmt
+
+    image = _open(stream, fmt)
+    metrics.put("input_pixels", image.width * image.height)
+    # Sizes are requested for the image shown in EXIF orientation, while the pixels
+    # are decoded and resampled as stored, and transposed only after being resized
+    animated = _is_animation(image, output_fmt)
+    orientation = 1 if animated else _orientation(image)
+    image_size = _oriented(image.size, orientation)
+    targets = [_target_size(*image_size, width, height) for width, height in sizes]
+    if output_fmt is not fmt:
+        targets = [target or image_size for target in targets]
+    needed = [target for target in targets if target is not None]
+    if not needed:
+        stream.close()
+        return [None] * len(sizes)
+
+    # Animated GIF and WEBP are resized frame by frame to keep the animation
+    if animated:
+        animation = _resize_frames(image, needed, resample)
+        results = [
+            (
+                None
+                if target is None
+                else _encode_animation(
+                    animation, target, output_fmt, quality, max_bytes, profile
+                )
+            )
+            for target in targets
+        ]
+        stream.close()
+        return results
+
+    # Decode at the reduced scale enough for the largest size
+    largest = (
+        max(width for width, _ in needed),
+        max(height for _, height in needed),
+    )
+    box = _draft(image, fmt, *_oriented(largest, orientation))
+    _decode(image)
+
+    with metrics.stage("resize"):
+        stored = [_oriented(target, orientation) for target in needed]
+        pyramid = _resize_pyramid(image, box, stored, resample)
+        resized = {
+            target: _transpose(pyramid[_oriented(target, orientation)], orientation)
+            for target in set(needed)
+        }
+
+    results = [
+        (
+            None
+            if target is None
+            else _encode(resized[target], output_fmt, quality, max_bytes, profile)
+        )
+        for target in targets
+    ]
+    stream.close()
+    return results
+
+
+def negotiate(
+    requested: str | None, accepted: list[str], source: str | None = None
+) -> ImageFormat | None:
+    # Without the requested format, the format of the original is kept
+    if requested is None:
+        return None
+
+    # Choose the smallest format accepted by the viewer, or keep the format of the original
+    # The original is not read yet, so the one of a format which may be animated, named
+    # by its extension, is only converted into the formats keeping the animation
+    if requested == "auto":
+        animatable = source is not None and source.upper() in _ANIMATED_FORMATS
+        for name in _AUTO_FORMATS:
+            if animatable and name not in _ANIMATED_FORMATS:
+                continue
+            if ImageFormat[name].value in accepted and _is_encodable(name):
+                return ImageFormat[name]
+        return None
+
+    # Explicitly requested format should be supported
+    if requested.upper() not in ImageFormat.__members__ or not _is_encodable(
+        requested.upper()
+    ):
+        raise InvalidImageRequestError(f"Unsupported output format: {requested}")
+    return ImageFormat[requested.upper()]
+
+
+def needs_resize(
+    stream: BytesIO,
+    fmt: ImageFormat,
+    width: int | None,
+    height: int | None,
+    fit: str | None = None,
+) -> bool:
+    _check_negative_length(width, height)
+    _check_too_long_length(width, height)
+    _check_fit(fit)
+
+    # Both lengths are given, so the image is resized exactly or cropped,
+    # while the image fitted within the box may be small enough already
+    if width is not None and height is not None and fit != "contain":
+        return True
+
+    # Without lengths, the original is returned as is
+    if width is None and height is None:
+        return False
+
+    # Pillow reads only the header to get the size, so the stream may be a part of image
+    # If the header is not complete in the stream, resizing is assumed to be needed,
+    # while the image too large to decode is rejected on the header already
+    try:
+        image = _open(stream, fmt)
+        image_width, image_height = _oriented(image.size, _orientation(image))
+    except (UnidentifiedImageError, OSError):
+        return True
+    finally:
+        stream.seek(0)
+
+    # The image is not made bigger than the original, so it's returned as is
+    return (width is not None and width < image_width) or (
+        height is not None and height < image_height
+    )
+
+
 def _check_negative_length(width: int | None, height: int | None):
     if width is not None and width <= 0:
         raise InvalidImageRequestError(f"Width {width} cannot be negative")
@@ -50,6 +347,23 @@ def _check_negative_length(width: int | None, height: int | None):
         raise InvalidImageRequestError(f"Height {height} cannot be negative")
 
 
+def _check_profile(profile: str | None):
+    if profile is not None and profile not in _PROFILES:
+        raise InvalidImageRequestError(f"Unsupported encoder profile: {profile}")
+
+
+def _check_filter(resample: str | None):
+    if resample is not None and (
+        resample not in RESAMPLING_FILTERS or resample not in config.RESAMPLING_FILTERS
+    ):
+        raise InvalidImageRequestError(f"Unsupported resampling filter: {resample}")
+
+
+def _check_fit(fit: str | None):
+    if fit is not None and fit not in FITS:
+        raise InvalidImageRequestError(f"Unsupported fit: {fit}")
+
+
 def _check_too_long_length(width, height):
     if width is not None and width > MAX_WIDTH:
         raise InvalidImageRequestError(f"Width cannot be longer than {MAX_WIDTH} px")
@@ -58,11 +372,39 @@ def _check_too_long_length(width, height):
 
 
 def _resize_exactly(
-    stream: BytesIO, fmt: ImageFormat, width: int, height: int, quality: int
-) -> BytesIO:
-    image = Image.open(stream, formats=[fmt.name])
-    image = image.resize((width, height))
-    return _convert_image_to_bytes_stream(image, fmt, quality)
+    stream: BytesIO, fmt: ImageFormat, width: int, height: int, resample: str
+) -> Image.Image:
+    image = _open(stream, fmt)
+    metrics.put("input_pixels", image.width * image.height)
+    orientation = _orientation(image)
+    size = _oriented((width, height), orientation)
+    box = _draft(image, fmt, *size)
+    _decode(image)
+    with metrics.stage("resize"):
+        return _transpose(_resample(image, size, resample, box), orientation)
+
+
+def _resize_to_cover(
+    stream: BytesIO, fmt: ImageFormat, width: int, height: int, resample: str
+) -> Image.Image:
+    image = _open(stream, fmt)
+    metrics.put("input_pixels", image.width * image.height)
+    # The center crop is the same region whether it's taken from the stored image
+    # or the image shown in EXIF orientation, so it's taken from the stored one
+    orientation = _orientation(image)
+    size = _oriented((width, height), orientation)
+    image_size = image.size
+    crop = _crop_box(*image_size, *size)
+    # The whole image is drafted at the scale which the cropped region is resized in
+    scale = size[0] / (crop[2] - crop[0])
+    box = _draft(
+        image, fmt, math.ceil(image.width * scale), math.ceil(image.height * scale)
+    )
+    _decode(image)
+    with metrics.stage("resize"):
+        # Only the pixels in the box are reduced and resampled
+        box = _scale_box(crop, image_size, box)
+        return _transpose(_resample(image, size, resample, box), orientation)
 
 
 def _resize_proportionally(
@@ -70,12 +412,245 @@ def _resize_proportionally(
     fmt: ImageFormat,
     width: int | None,
     height: int | None,
+    resample: str,
+    fit: str | None = None,
+) -> Image.Image:
+    image = _open(stream, fmt)
+    metrics.put("input_pixels", image.width * image.height)
+    # The target is taken from the size of the original before it's drafted
+    orientation = _orientation(image)
+    image_width, image_height = _oriented(image.size, orientation)
+    target = _target_size(image_width, image_height, width, height, fit)
+    width, height = _fill_missing_length(image_width, image_height, width, height)
+    fit = _fit_within(image_width, image_height, width, height)
+    box = _draft(image, fmt, *_oriented(fit, orientation))
+    _decode(image)
+    if target is None:
+        return _transpose(image, orientation)
+    with metrics.stage("resize"):
+        resized = _resample(image, _oriented(target, orientation), resample, box)
+        return _transpose(resized, orientation)
+
+
+def _orientation(image: Image.Image) -> int:
+    # EXIF is read from the header without decoding the pixels
+    # PNG loads the whole image looking for EXIF after the pixels if it's not found
+    # in the header, where it's regarded as missing instead
+    if image.format == "PNG" and "exif" not in image.info:
+        return 1
+    try:
+        return image.getexif().get(ExifTags.Base.Orientation, 1)
+    except Exception:
+        return 1
+
+
+def _oriented(size: tuple[int, int], orientation: int) -> tuple[int, int]:
+    # Size turned between the stored image and the image shown in the orientation,
+    # which is the same in both ways
+    width, height = size
+    return (height, width) if orientation in _SWAPPING_ORIENTATIONS else (width, height)
+
+
+def _transpose(image: Image.Image, orientation: int) -> Image.Image:
+    # Transposed after resizing, as there are fewer pixels to move
+    method = _ORIENTATIONS.get(orientation)
+    return image if method is None else image.transpose(method)
+
+
+def _resize_pyramid(
+    image: Image.Image,
+    box: tuple[float, float, float, float] | None,
+    targets: list[tuple[int, int]],
+    resample: str,
+) -> dict[tuple[int, int], Image.Image]:
+    # Each size is resampled from the next larger one like a pyramid,
+    # which is cheaper than resampling the decoded image every time
+    resized = {}
+    source, source_box = image, box
+    for target in sorted(set(targets), key=lambda t: t[0] * t[1], reverse=True):
+        if source.width < target[0] or source.height < target[1]:
+            # The aspect ratio of the larger one differs, so the decoded image is used
+            source, source_box = image, box
+        resized[target] = _resample(source, target, resample, source_box)
+        source, source_box = resized[target], None
+    return resized
+
+
+@dataclass
+class _Animation:
+    # Resized frames by the target size, sharing the timing of the original
+    frames: dict[tuple[int, int], list[Image.Image]]
+    durations: list[int] = field(default_factory=list)
+    disposals: list[int] = field(default_factory=list)
+    loop: int | None = None
+
+
+def _open_animation(
+    stream: BytesIO, fmt: ImageFormat, output_fmt: ImageFormat
+) -> Image.Image | None:
+    # The animation is kept only if the output format can animate as well
+    if fmt.name not in _ANIMATED_FORMATS or output_fmt.name not in _ANIMATED_FORMATS:
+        return None
+    image = _open(stream, fmt)
+    return image if _is_animation(image, output_fmt) else None
+
+
+def _is_animation(image: Image.Image, output_fmt: ImageFormat) -> bool:
+    if output_fmt.name not in _ANIMATED_FORMATS:
+        return False
+    if not getattr(image, "is_animated", False):
+        return False
+
+    # Frames are decoded one by one, but too many or too large frames would exceed
+    # the memory and time limits of Lambda, so only the first frame is resized
+    n_frames = image.n_frames
+    if (
+        n_frames > config.ANIMATION_MAX_FRAMES
+        or image.width * image.height * n_frames > config.ANIMATION_MAX_PIXELS
+    ):
+        print(
+            f"Animation of {n_frames} frames in {image.width}x{image.height} "
+            "exceeds the limits, so only the first frame is resized"
+        )
+        return False
+    return True
+
+
+def _resize_frames(
+    image: Image.Image,
+    targets: list[tuple[int, int]],
+    resample: str,
+    box: tuple[float, float, float, float] | None = None,
+) -> _Animation:
+    # Only the current frame of the original is kept in full size while seeking,
+    # and frames over the budget are skipped adding their durations to the previous one
+    _check_decoding_budget(image)
+    metrics.put("input_frames", image.n_frames)
+    step = math.ceil(image.n_frames / config.ANIMATION_FRAME_BUDGET)
+    animation = _Animation({target: [] for target in set(targets)})
+    animation.loop = image.info.get("loop")
+    with metrics.stage("resize"):
+        for index in range(image.n_frames):
+            # Frames of GIF are decoded in order, as each one is drawn over the previous
+            image.seek(index)
+            image.load()
+            duration = image.info.get("duration", 0)
+            if index % step != 0:
+                animation.durations[-1] += duration
+                continue
+
+            frame = image.convert("RGBA" if _has_alpha(image) else "RGB")
+            for target, resized in _resize_pyramid(
+                frame, box, targets, resample
+            ).items():
+                animation.frames[target].append(resized)
+            animation.durations.append(duration)
+            disposal = getattr(image, "disposal_method", None)
+            if disposal is not None:
+                animation.disposals.append(disposal)
+    return animation
+
+
+def _encode_animation(
+    animation: _Animation,
+    target: tuple[int, int],
+    fmt: ImageFormat,
     quality: int,
-) -> BytesIO:
-    image = Image.open(stream, formats=[fmt.name])
-    width, height = _fill_missing_length(image.width, image.height, width, height)
-    image.thumbnail((width, height))
-    return _convert_image_to_bytes_stream(image, fmt, quality)
+    max_bytes: int | None,
+    profile: str | None,
+) -> tuple[BytesIO, ImageFormat]:
+    frames = animation.frames[target]
+    metrics.add("encoded_pixels", target[0] * target[1] * len(frames))
+    for frame in frames:
+        _strip_metadata(frame)
+    profile = _choose_profile(frames[0], profile)
+    options = _encoder_options(fmt, profile, quality)
+    options.update(_metadata_options(frames[0]))
+    options.update(
+        save_all=True, append_images=frames[1:], duration=animation.durations
+    )
+    if animation.loop is not None:
+        options["loop"] = animation.loop
+    if fmt is ImageFormat.GIF and animation.disposals:
+        options["disposal"] = animation.disposals
+    stream = BytesIO()
+    with metrics.stage("encode"):
+        frames[0].save(stream, format=fmt.name, **options)
+    if max_bytes is None or _length_of(stream) <= max_bytes:
+        return stream, fmt
+
+    # Searching smaller settings encodes all frames again for each attempt,
+    # so the first frame is encoded as a still image within the budget instead
+    _log_attempt("animation", fmt, {"frames": len(frames)}, stream, max_bytes)
+    stream.close()
+    return _encode(frames[0], fmt, quality, max_bytes, profile)
+
+
+def _resample(
+    image: Image.Image,
+    size: tuple[int, int],
+    resample: str,
+    box: tuple[float, float, float, float] | None = None,
+) -> Image.Image:
+    # Large downscaling is cheaper with the integer reduction before the filter,
+    # which Pillow applies by the reducing gap (but not for the nearest filter)
+    return image.resize(
+        size, RESAMPLING_FILTERS[resample], box=box, reducing_gap=REDUCING_GAP
+    )
+
+
+def _open(stream: BytesIO, fmt: ImageFormat) -> Image.Image:
+    if not _is_decodable(fmt.name):
+        raise UnsupportedImageFormatError(f"Unsupported image format: {fmt}")
+    try:
+        image = Image.open(stream, formats=[fmt.name])
+    except Image.DecompressionBombError as exception:
+        raise ImageTooLargeError(str(exception))
+    # Checked on the header before anything decodes the pixels, like EXIF of PNG
+    # which may follow them, except JPEG which may fit in the budget once drafted
+    if fmt is not ImageFormat.JPEG:
+        _check_decoding_budget(image)
+    return image
+
+
+def _decode(image: Image.Image) -> None:
+    # Pillow decodes lazily on the first access to pixels, which is made explicit
+    # to measure decoding apart from resampling
+    _check_decoding_budget(image)
+    with metrics.stage("decode"):
+        image.load()
+
+
+def _check_decoding_budget(image: Image.Image) -> None:
+    # Only the header is read so far, so the image is rejected before its pixels
+    # are allocated, instead of killing the container with the requests queued on it
+    budget = _decoding_budget()
+    if _decoded_bytes(image) > budget:
+        raise ImageTooLargeError(
+            f"Image of {image.width}x{image.height} in {image.mode} cannot be decoded "
+            f"within {budget} bytes"
+        )
+
+
+def _decoding_budget() -> int:
+    return int(config.MEMORY_SIZE_MB * 1024 * 1024 * config.DECODE_MEMORY_FRACTION)
+
+
+def _decoded_bytes(image: Image.Image) -> int:
+    return image.width * image.height * _PIXEL_BYTES.get(image.mode, 4)
+
+
+def _is_decodable(name: str) -> bool:
+    # Plugins like AVIF are not available in some builds of Pillow
+    try:
+        importlib.import_module(_PLUGINS[name])
+    except ImportError:
+        return False
+    return name in Image.OPEN
+
+
+def _is_encodable(name: str) -> bool:
+    return _is_decodable(name) and name in Image.SAVE
 
 
 def _fill_missing_length(
@@ -92,20 +667,347 @@ def _fill_missing_length(
     return width, height
 
 
+def _target_size(
+    image_width: int,
+    image_height: int,
+    width: int | None,
+    height: int | None,
+    fit: str | None = None,
+) -> tuple[int, int] | None:
+    # Size of the image resized by resize, or None if the original is returned as is
+    if width is not None and height is not None and fit != "contain":
+        return width, height
+    if width is None and height is None:
+        return None
+    width, height = _fill_missing_length(image_width, image_height, width, height)
+    if width >= image_width and height >= image_height:
+        return None
+
+    # Rounded in the same way as Image.thumbnail, so that derivatives of the same size
+    # are the same whichever of resize and resize_many made them
+    aspect = image_width / image_height
+    if width / height >= aspect:
+        candidates = (math.floor(height * aspect), math.ceil(height * aspect))
+        width = max(min(candidates, key=lambda n: abs(aspect - n / height)), 1)
+    else:
+        candidates = (math.floor(width / aspect), math.ceil(width / aspect))
+        height = max(
+            min(candidates, key=lambda n: 0 if n == 0 else abs(aspect - width / n)), 1
+        )
+    return width, height
+
+
+def _fit_within(
+    image_width: int, image_height: int, width: int, height: int
+) -> tuple[int, int]:
+    # Size of the image scaled down to fit within the box, never scaled up
+    scale = min(width / image_width, height / image_height, 1.0)
+    return max(1, round(image_width * scale)), max(1, round(image_height * scale))
+
+
+def _crop_box(
+    image_width: int, image_height: int, width: int, height: int
+) -> tuple[float, float, float, float]:
+    # The largest region in the ratio of the box at the center of the image
+    aspect = width / height
+    if image_width / image_height > aspect:
+        crop_width = image_height * aspect
+        left = (image_width - crop_width) / 2
+        return left, 0.0, left + crop_width, float(image_height)
+    crop_height = image_width / aspect
+    top = (image_height - crop_height) / 2
+    return 0.0, top, float(image_width), top + crop_height
+
+
+def _scale_box(
+    crop: tuple[float, float, float, float],
+    image_size: tuple[int, int],
+    draft_box: tuple[float, float, float, float] | None,
+) -> tuple[float, float, float, float]:
+    # Region of the original mapped into the image reduced by draft, whose box is
+    # the whole original in the coordinates of the reduced image
+    if draft_box is None:
+        return crop
+    scale_x, scale_y = draft_box[2] / image_size[0], draft_box[3] / image_size[1]
+    left, top, right, bottom = crop
+    return left * scale_x, top * scale_y, right * scale_x, bottom * scale_y
+
+
+def _draft(
+    image: Image.Image, fmt: ImageFormat, width: int, height: int
+) -> tuple[float, float, float, float] | None:
+    # Only JPEG can be decoded at a reduced scale by libjpeg
+    if fmt is not ImageFormat.JPEG:
+        return None
+
+    # The original too large to be decoded in full is decoded at the smallest scale
+    # still larger than the target, giving up the reducing gap for memory
+    gap = DRAFT_REDUCING_GAP if _decoded_bytes(image) <= _decoding_budget() else 1.0
+
+    # Skip if the original is not large enough to be reduced by at least a half
+    draft_width = math.ceil(width * gap)
+    draft_height = math.ceil(height * gap)
+    if image.width < draft_width * 2 or image.height < draft_height * 2:
+        return None
+
+    # Draft returns the region of the reduced image matching the original one,
+    # which is used to resample the image without shifting pixels
+    result = image.draft(None, (draft_width, draft_height))
+    return result[1] if result is not None else None
+
+
+def _encode(
+    image: Image.Image,
+    fmt: ImageFormat,
+    quality: int,
+    max_bytes: int | None,
+    profile: str | None,
+) -> tuple[BytesIO, ImageFormat]:
+    metrics.add("encoded_pixels", image.width * image.height)
+    _strip_metadata(image)
+    profile = _choose_profile(image, profile)
+    with metrics.stage("encode"):
+        return _encode_within(image, fmt, quality, max_bytes, profile)
+
+
+def _choose_profile(image: Image.Image, profile: str | None) -> str:
+    if profile is not None:
+        return profile
+    # The last tier without the maximum takes any number of pixels
+    pixels = image.width * image.height
+    return next(
+        tier_profile
+        for max_pixels, tier_profile in PROFILE_TIERS
+        if max_pixels is None or pixels <= max_pixels
+    )
+
+
+def _encode_within(
+    image: Image.Image,
+    fmt: ImageFormat,
+    quality: int,
+    max_bytes: int | None,
+    profile: str,
+) -> tuple[BytesIO, ImageFormat]:
+    stream = _convert_image_to_bytes_stream(image, fmt, quality, profile=profile)
+    if max_bytes is None or _length_of(stream) <= max_bytes:
+        return stream, fmt
+
+    # The output exceeds the budget, so smaller settings of the same format are searched
+    # at first, and then smaller formats are tried
+    # Encoding the downsampled image is much cheaper, and its length multiplied by
+    # the ratio of the full and downsampled outputs estimates the full output length
+    # The ratio differs by format, so it's measured again for each fallback format
+    # The smallest profile is used for searching, as bytes matter more than CPU time now
+    _log_attempt(
+        "full", fmt, {"quality": quality, "profile": profile}, stream, max_bytes
+    )
+    probe = _downsample(image)
+    probe_stream = _convert_image_to_bytes_stream(probe, fmt, quality, profile=profile)
+    _log_attempt(
+        "probe", fmt, {"quality": quality, "profile": profile}, probe_stream, max_bytes
+    )
+    ratio = _length_of(stream) / max(1, _length_of(probe_stream))
+    stream.close()
+    probe_stream.close()
+    fallbacks = [ImageFormat[name] for name in _FALLBACK_FORMATS if name != fmt.name]
+    for candidate in [fmt, *fallbacks]:
+        settings = _shrinking_settings(candidate, quality)
+        if candidate is fmt and profile == _BUDGET_PROFILE:
+            # The default setting is already tried above
+            settings = [s for s in settings if s != {"quality": quality}]
+        found = _search(
+            image,
+            probe,
+            candidate,
+            settings,
+            ratio if candidate is fmt else None,
+            max_bytes,
+        )
+        if found is not None:
+            return found, candidate
+
+    raise OutputTooLargeError(f"Image cannot be encoded within {max_bytes} bytes")
+
+
+def _shrinking_settings(fmt: ImageFormat, quality: int) -> list[dict]:
+    # Settings of encoding ordered from the largest and best output to the smallest
+    match fmt:
+        case ImageFormat.JPEG | ImageFormat.WEBP | ImageFormat.AVIF:
+            qualities = range(quality, MIN_QUALITY - 1, -QUALITY_STEP)
+            return [{"quality": q} for q in qualities]
+        case ImageFormat.PNG | ImageFormat.GIF:
+            return [{"colors": c} for c in (256, 128, 64, 32, 16)]
+        case ImageFormat.TIFF:
+            return [{"compression": "tiff_adobe_deflate"}]
+    return []
+
+
+def _search(
+    image: Image.Image,
+    probe: Image.Image,
+    fmt: ImageFormat,
+    settings: list[dict],
+    ratio: float | None,
+    max_bytes: int,
+) -> BytesIO | None:
+    # Find the best setting whose output fits the budget, encoding the image only with
+    # the settings estimated from the downsampled image as in bisection
+    found = None
+    probe_lengths = {}
+    low, high = 0, len(settings) - 1
+    while low <= high:
+        index = _estimate(
+            probe, fmt, settings, probe_lengths, ratio, max_bytes, low, high
+        )
+        if index is None:
+            # No better setting is estimated to fit the budget than the one found
+            if found is not None:
+                break
+            index = high
+
+        stream = _convert_image_to_bytes_stream(
+            image, fmt, **settings[index], profile=_BUDGET_PROFILE
+        )
+        _log_attempt("full", fmt, settings[index], stream, max_bytes)
+        # Ratio of the full and downsampled outputs is calibrated by the last encode
+        probe_length = _probe_length(
+            probe, fmt, settings, probe_lengths, index, max_bytes
+        )
+        ratio = _length_of(stream) / probe_length
+        if _length_of(stream) <= max_bytes:
+            if found is not None:
+                found.close()
+            found, high = stream, index - 1
+        else:
+            stream.close()
+            low = index + 1
+    return found
+
+
+def _estimate(
+    probe: Image.Image,
+    fmt: ImageFormat,
+    settings: list[dict],
+    probe_lengths: dict[int, int],
+    ratio: float | None,
+    max_bytes: int,
+    low: int,
+    high: int,
+) -> int | None:
+    # Without the ratio of this format yet, the middle of the range is encoded in full
+    # to measure it, as the first step of bisection
+    if ratio is None:
+        return (low + high) // 2
+
+    # The first setting in the range estimated to fit the budget, which is bisected
+    # as the outputs shrink along the settings
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        length = _probe_length(probe, fmt, settings, probe_lengths, middle, max_bytes)
+        if length * ratio <= max_bytes:
+            found, high = middle, middle - 1
+        else:
+            low = middle + 1
+    return found
+
+
+def _probe_length(
+    probe: Image.Image,
+    fmt: ImageFormat,
+    settings: list[dict],
+    probe_lengths: dict[int, int],
+    index: int,
+    max_bytes: int,
+) -> int:
+    # Each setting is encoded once over the downsampled image
+    if index not in probe_lengths:
+        stream = _convert_image_to_bytes_stream(
+            probe, fmt, **settings[index], profile=_BUDGET_PROFILE
+        )
+        _log_attempt("probe", fmt, settings[index], stream, max_bytes)
+        probe_lengths[index] = max(1, _length_of(stream))
+        stream.close()
+    return probe_lengths[index]
+
+
+def _downsample(image: Image.Image) -> Image.Image:
+    factor = max(1, math.isqrt(image.width * image.height // BUDGET_PROBE_PIXELS))
+    size = (max(1, image.width // factor), max(1, image.height // factor))
+    return image.resize(size, Image.Resampling.BOX)
+
+
+def _log_attempt(
+    kind: str, fmt: ImageFormat, setting: dict, stream: BytesIO, max_bytes: int
+) -> None:
+    print(
+        f"Encoding attempt ({kind}): {fmt.name} {setting} "
+        f"-> {_length_of(stream)} bytes, budget {max_bytes} bytes"
+    )
+
+
+def _length_of(stream: BytesIO) -> int:
+    return stream.getbuffer().nbytes
+
+
 def _convert_image_to_bytes_stream(
-    image: Image.Image, fmt: ImageFormat, quality: int
+    image: Image.Image,
+    fmt: ImageFormat,
+    quality: int = DEFAULT_QUALITY,
+    colors: int | None = None,
+    compression: str | None = None,
+    profile: str = _BUDGET_PROFILE,
 ) -> BytesIO:
+    # Palette with fewer colors makes PNG and GIF smaller
+    if colors is not None:
+        image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+        image = image.quantize(colors, Image.Quantize.FASTOCTREE)
+    # JPEG doesn't support alpha and palette, which may come from other formats
+    if fmt is ImageFormat.JPEG and image.mode not in ("RGB", "L", "CMYK"):
+        image = image.convert("RGB")
+    # Options of the profile are overridden by the setting searched for the byte budget
+    options = _encoder_options(fmt, profile, quality)
+    options.update(_metadata_options(image))
+    if compression is not None:
+        options["compression"] = compression
     stream = BytesIO()
-    image.save(stream, format=fmt.name, optimize=True, quality=quality)
+    image.save(stream, format=fmt.name, **options)
     return stream
 
 
+def _strip_metadata(image: Image.Image) -> None:
+    # Some encoders write metadata from the info of the image without being asked
+    for key in _METADATA_KEYS:
+        image.info.pop(key, None)
+    if not config.KEEP_ICC_PROFILE:
+        image.info.pop("icc_profile", None)
+
+
+def _metadata_options(image: Image.Image) -> dict:
+    # Other encoders write ICC profile only if it's given as an option
+    icc_profile = image.info.get("icc_profile")
+    return {"icc_profile": icc_profile} if icc_profile else {}
+
+
+def _encoder_options(fmt: ImageFormat, profile: str, quality: int) -> dict:
+    options = dict(ENCODER_PROFILES[fmt.name][profile])
+    if fmt.name in _QUALITY_FORMATS:
+        options["quality"] = quality
+    return options
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
 class ImageFormat(Enum):
     JPEG = "image/jpeg"
     PNG = "image/png"
     GIF = "image/gif"
     WEBP = "image/webp"
     TIFF = "image/tiff"
+    AVIF = "image/avif"
 
     def __str__(self):
         return self.value
@@ -125,6 +1027,16 @@ class InvalidImageRequestError(ValueError):
         super().__init__(message)
 
 
+class OutputTooLargeError(ValueError):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+class ImageTooLargeError(ValueError):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
 class UnsupportedImageFormatError(NotImplementedError):
     def __init__(self, message: str):
         super().__init__(message)
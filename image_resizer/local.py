@@ -0,0 +1,251 @@
+import mimetypes
+import mmap
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from io import SEEK_CUR, SEEK_END, SEEK_SET, BytesIO, RawIOBase
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+# Signatures of the supported image formats at the beginning of files
+_SIGNATURES = [
+    (re.compile(rb"\xff\xd8\xff"), "image/jpeg"),
+    (re.compile(rb"\x89PNG\r\n\x1a\n"), "image/png"),
+    (re.compile(rb"GIF8[79]a"), "image/gif"),
+    (re.compile(rb"RIFF....WEBP", re.DOTALL), "image/webp"),
+    (re.compile(rb"II\*\x00|MM\x00\*"), "image/tiff"),
+    (re.compile(rb"....ftypavi[fs]", re.DOTALL), "image/avif"),
+]
+
+
+class LocalClient:
+    # Subset of S3 client operations on a local directory, where buckets are
+    # subdirectories of the root, so that offline tools and tests share the storage code
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: str | None = None,
+        IfMatch: str = "",
+        IfNoneMatch: str = "",
+    ) -> dict:
+        path = self._path_of(Bucket, Key)
+        if not path.is_file():
+            raise _client_error("NoSuchKey", "GetObject")
+        etag = _etag_of(path)
+        _check_conditions(etag, IfMatch, IfNoneMatch)
+
+        # The file is mapped into memory instead of being read, so that only the pages
+        # touched by the range and by Pillow are loaded, and nothing is copied
+        with path.open("rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        response = {
+            "ContentType": _content_type_of(path.name, data),
+            "ETag": etag,
+            "LastModified": datetime.fromtimestamp(path.stat().st_mtime, timezone.utc),
+        }
+        return _respond(response, data, Range, MappedStream)
+
+    def put_object(
+        self, Bucket: str, Key: str, Body: bytes, ContentType: str = ""
+    ) -> dict:
+        path = self._path_of(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file and renamed not to expose a partial object
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary_path.write_bytes(Body)
+        temporary_path.replace(path)
+        return {"ETag": _etag_of(path)}
+
+    def list_objects_v2(
+        self, Bucket: str, Prefix: str = "", ContinuationToken: str = ""
+    ) -> dict:
+        bucket_path = self.root / Bucket
+        contents = []
+        for path in sorted(bucket_path.rglob("*")):
+            key = path.relative_to(bucket_path).as_posix()
+            if (
+                path.is_file()
+                and not path.name.startswith(".")
+                and key.startswith(Prefix)
+            ):
+                contents.append(
+                    {"Key": key, "ETag": _etag_of(path), "Size": path.stat().st_size}
+                )
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+    def _path_of(self, bucket: str, key: str) -> Path:
+        path = (self.root / bucket / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise _client_error("AccessDenied", "GetObject")
+        return path
+
+
+class MemoryClient:
+    # Subset of S3 client operations on objects kept in memory, for benchmarks without
+    # disks and networks, and tests
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: str | None = None,
+        IfMatch: str = "",
+        IfNoneMatch: str = "",
+    ) -> dict:
+        with self._lock:
+            stored = self._objects.get((Bucket, Key))
+        if stored is None:
+            raise _client_error("NoSuchKey", "GetObject")
+        data, content_type, etag, last_modified = stored
+        _check_conditions(etag, IfMatch, IfNoneMatch)
+        response = {
+            "ContentType": content_type,
+            "ETag": etag,
+            "LastModified": last_modified,
+        }
+        return _respond(response, data, Range, _streaming_body_of)
+
+    def put_object(
+        self, Bucket: str, Key: str, Body: bytes, ContentType: str = ""
+    ) -> dict:
+        data = bytes(Body)
+        with self._lock:
+            self._version += 1
+            etag = f'"{self._version:x}-{len(data):x}"'
+            self._objects[(Bucket, Key)] = (
+                data,
+                ContentType or _content_type_of(Key, data),
+                etag,
+                datetime.now(timezone.utc),
+            )
+        return {"ETag": etag}
+
+    def list_objects_v2(
+        self, Bucket: str, Prefix: str = "", ContinuationToken: str = ""
+    ) -> dict:
+        with self._lock:
+            contents = [
+                {"Key": key, "ETag": etag, "Size": len(data)}
+                for (bucket, key), (data, _, etag, _) in sorted(self._objects.items())
+                if bucket == Bucket and key.startswith(Prefix)
+            ]
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+
+class MappedStream(RawIOBase):
+    # Read-only stream over a range of a buffer like mmap, which Pillow reads in chunks
+    # without the whole buffer copied into bytes, and storage takes as BytesIO
+
+    def __init__(self, buffer, start: int = 0, end: int | None = None):
+        super().__init__()
+        self._buffer = buffer
+        self._view = memoryview(buffer)[start:end]
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int | None = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        data = self._view[self._position : end].tobytes()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position : self._position + len(buffer)]
+        memoryview(buffer).cast("B")[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        base = {SEEK_SET: 0, SEEK_CUR: self._position, SEEK_END: len(self._view)}
+        self._position = max(0, base[whence] + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def getbuffer(self) -> memoryview:
+        return self._view[:]
+
+    def getvalue(self) -> bytes:
+        return self._view.tobytes()
+
+    def whole(self) -> "MappedStream":
+        # Stream over the whole buffer, e.g. the whole file of the ranged response
+        return MappedStream(self._buffer)
+
+    def close(self) -> None:
+        super().close()
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            try:
+                self._buffer.close()
+            except BufferError:
+                # Views given by getbuffer are still used, and unmapped when released
+                pass
+
+
+def _streaming_body_of(data: bytes, start: int, end: int) -> StreamingBody:
+    # BytesIO shares the bytes of the whole object without copying until it's written
+    data = data if (start, end) == (0, len(data)) else data[start:end]
+    return StreamingBody(BytesIO(data), len(data))
+
+
+def _respond(response: dict, data, range_: str | None, body_of) -> dict:
+    # Response of GetObject for the whole data or the range of it
+    size = len(data)
+    start, end = 0, size - 1
+    if range_ is not None:
+        # "bytes=0-1023" or "bytes=1024-"
+        first, last = range_.removeprefix("bytes=").split("-")
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        response["ContentRange"] = f"bytes {start}-{end}/{size}"
+    response["ContentLength"] = end + 1 - start
+    response["Body"] = body_of(data, start, end + 1)
+    return response
+
+
+def _check_conditions(etag: str, if_match: str, if_none_match: str) -> None:
+    if if_match and if_match != etag:
+        raise _client_error("PreconditionFailed", "GetObject")
+    if if_none_match and if_none_match == etag:
+        raise _client_error("304", "GetObject")
+
+
+def _etag_of(path: Path) -> str:
+    # Modification time and size change whenever the file is rewritten,
+    # which is enough to invalidate derivatives without hashing the whole file
+    stat = path.stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _content_type_of(name: str, data) -> str:
+    # Derivatives are stored without extensions, so the content is sniffed first
+    head = bytes(data[:16])
+    for signature, content_type in _SIGNATURES:
+        if signature.match(head):
+            return content_type
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _client_error(code: str, operation_name: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation_name)
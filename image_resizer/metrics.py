@@ -0,0 +1,118 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from . import config
+
+# Metrics are recorded by stages in the modules without passing a recorder around,
+# and the recorder of the current invocation is kept in the context
+# Stages run in other threads, like backfill, are not recorded
+
+
+class _Recorder:
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+        self.started_at = time.perf_counter()
+        self.values: dict[str, tuple[float, str]] = {}
+        self.properties: dict[str, str] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        # Time of the stage run several times in an invocation is summed
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            self.add(f"{name}_ms", elapsed_ms, "Milliseconds")
+
+    def add(self, name: str, value: float, unit: str) -> None:
+        previous, _ = self.values.get(name, (0, unit))
+        self.values[name] = (previous + value, unit)
+
+    def put(self, name: str, value: float, unit: str) -> None:
+        self.values[name] = (value, unit)
+
+    def set_property(self, name: str, value: str) -> None:
+        self.properties[name] = value
+
+    def emit(self) -> None:
+        self.put(
+            "total_ms", (time.perf_counter() - self.started_at) * 1000, "Milliseconds"
+        )
+        # Embedded Metric Format, which CloudWatch extracts metrics from the log line
+        # https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+        line = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": config.METRICS_NAMESPACE,
+                        "Dimensions": [["event_type"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in self.values.items()
+                        ],
+                    }
+                ],
+            },
+            "event_type": self.event_type,
+            **self.properties,
+            **{name: value for name, (value, _) in self.values.items()},
+        }
+        print(json.dumps(line, separators=(",", ":")))
+
+
+class _DisabledRecorder:
+    # Every call does nothing, so that disabled metrics cost only a function call
+    _stage = nullcontext()
+
+    def stage(self, name: str):
+        return self._stage
+
+    def add(self, name: str, value: float, unit: str) -> None:
+        pass
+
+    def put(self, name: str, value: float, unit: str) -> None:
+        pass
+
+    def set_property(self, name: str, value: str) -> None:
+        pass
+
+    def emit(self) -> None:
+        pass
+
+
+_DISABLED = _DisabledRecorder()
+_current: ContextVar[_Recorder | _DisabledRecorder] = ContextVar(
+    "metrics", default=_DISABLED
+)
+
+
+def start(event_type: str) -> None:
+    _current.set(_Recorder(event_type) if config.METRICS_ENABLED else _DISABLED)
+
+
+def stage(name: str):
+    # with stage("decode"): ...
+    return _current.get().stage(name)
+
+
+def put(name: str, value: float, unit: str = "Count") -> None:
+    _current.get().put(name, value, unit)
+
+
+def add(name: str, value: float, unit: str = "Count") -> None:
+    # Summed if it's added several times in an invocation
+    _current.get().add(name, value, unit)
+
+
+def set_property(name: str, value: str) -> None:
+    _current.get().set_property(name, value)
+
+
+def emit() -> None:
+    # A single log line per invocation
+    _current.get().emit()
+    _current.set(_DISABLED)
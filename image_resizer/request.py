@@ -1,6 +1,10 @@
+import bisect
+import math
 import re
 from urllib.parse import parse_qs, unquote, urlencode
 
+from . import config
+
 # Map of resizing hint and expected width
 RESIZING_HINT = {
     "_t": 100,
@@ -8,12 +12,21 @@ RESIZING_HINT = {
     "_m": 300,
     "_l": 400,
 }
+# Sizes of the resizing hints from the smallest, which are resized together
+RESIZING_HINT_SIZES = tuple((width, None) for width in sorted(RESIZING_HINT.values()))
+# Query parameters read by the Lambda function in the order of the canonical query,
+# and the others are removed as they would only split the cache
+QUERY_PARAMS = ("w", "h", "q", "fit", "fmt", "profile", "f")
+_INTEGER_PARAMS = ("w", "h", "q")
+_NAME_PARAMS = ("fit", "fmt", "profile", "f")
+# Encoder profiles requested by the profile query parameter
+PROFILES = ("fast", "small")
 
 
 def take_resizing_hint(request: dict) -> dict:
     resizing_hint, uri = _parse_resizing_hint_and_uri(request)
     if resizing_hint is None:
-        return request
+        return canonicalize(request)
 
     width = RESIZING_HINT[resizing_hint]
     query_params = _parse_query_params(request)
@@ -21,6 +34,53 @@ def take_resizing_hint(request: dict) -> dict:
     query_params.pop("h", None)
     request["uri"] = uri
     request["querystring"] = urlencode(query_params)
+    return canonicalize(request)
+
+
+def canonicalize(request: dict) -> dict:
+    # Equivalent queries are turned into the same one, so that they share the object
+    # cached by CloudFront and the derivative instead of being resized one by one
+    # "w=400&q=80&fmt=webp" <- "utm_source=x&fmt=WEBP&w=301"
+    query_params = {
+        name: value
+        for name, value in _parse_query_params(request).items()
+        if name in QUERY_PARAMS
+    }
+    for name in _INTEGER_PARAMS:
+        if name in query_params:
+            query_params[name] = _canonical_integer(query_params[name])
+    for name in _NAME_PARAMS:
+        if name in query_params:
+            query_params[name] = query_params[name].lower()
+    _snap_size(query_params)
+
+    # Fit only matters for the box of both width and height, and fill is the default
+    if query_params.get("fit") == "fill" or not {"w", "h"} <= query_params.keys():
+        query_params.pop("fit", None)
+
+    # The default quality is applied only to the derivatives, not to the original
+    if {"w", "h", "fmt"} & query_params.keys():
+        query_params.setdefault("q", str(config.DEFAULT_QUALITY))
+
+    request["querystring"] = urlencode(
+        [(name, query_params[name]) for name in QUERY_PARAMS if name in query_params]
+    )
+    return request
+
+
+def restore_original_etag(request: dict) -> dict:
+    # CloudFront revalidates the expired derivative with its ETag given by the response,
+    # which is turned back into ETag of the original, so that S3 answers 304 Not Modified
+    # instead of sending the whole original again if the original is not updated
+    # "\"0563e39b\"" <- "\"0563e39b-w100_hauto_q80_fwebp_pfast\""
+    pattern = re.compile(
+        r"-w(?:\d+|auto)_h(?:\d+|auto)_q\d+"
+        r'(?:_f[a-z]+)?(?:_p[a-z]+)?(?:_r[a-z]+)?(?:_m[a-z]+)?(?="$)'
+    )
+    for header in request.get("headers", {}).get("if-none-match", []):
+        header["value"] = ", ".join(
+            pattern.sub("", etag.strip()) for etag in header["value"].split(",")
+        )
     return request
 
 
@@ -31,14 +91,74 @@ def parse(request: dict) -> tuple[str, str, int | None, int | None, int | None]:
     width = _parse_width(query_params)
     height = _parse_height(query_params)
     quality = _parse_quality(query_params)
+    # Names are checked before the original is read, as the original returned as is
+    # or the derivative looked up would never reject them
+    _check_name(query_params, "profile", PROFILES)
+    _check_name(query_params, "f", config.RESAMPLING_FILTERS)
     return bucket, path, width, height, quality
 
 
+def parse_region(request: dict) -> str | None:
+    # "ap-northeast-2" <- "hello.s3.ap-northeast-2.amazonaws.com"
+    pattern = re.compile(r"\.s3\.([a-z0-9-]+?)\.amazonaws\.com$")
+    match = pattern.search(
+        request.get("origin", {}).get("s3", {}).get("domainName", "")
+    )
+    return match.group(1) if match else None
+
+
+def parse_extension(request: dict) -> str | None:
+    # "gif" <- "/path/to/file.GIF"
+    name = _parse_path(request).rsplit("/", 1)[-1]
+    _, dot, extension = name.rpartition(".")
+    return extension.lower() if dot and extension else None
+
+
+def parse_format(request: dict) -> str | None:
+    # "auto" <- "w=100&fmt=auto"
+    return _parse_name(request, "fmt")
+
+
+def parse_profile(request: dict) -> str | None:
+    # "fast" <- "w=100&profile=fast"
+    return _parse_name(request, "profile")
+
+
+def parse_filter(request: dict) -> str | None:
+    # "bilinear" <- "w=100&f=bilinear"
+    return _parse_name(request, "f")
+
+
+def parse_fit(request: dict) -> str | None:
+    # "cover" <- "w=100&h=100&fit=cover"
+    return _parse_name(request, "fit")
+
+
+def parse_accept(request: dict) -> list[str]:
+    # ["image/avif", "image/webp", "*/*"] <- "image/avif,image/webp,*/*;q=0.8"
+    accepted = []
+    for header in request.get("headers", {}).get("accept", []):
+        for media_range in header.get("value", "").split(","):
+            media_type, *params = [p.strip() for p in media_range.split(";")]
+            if media_type and "q=0" not in params and "q=0.0" not in params:
+                accepted.append(media_type.lower())
+    return accepted
+
+
+def _parse_name(request: dict, key: str) -> str | None:
+    # Names in the query are case insensitive, and empty one is regarded as missing
+    name = _parse_query_params(request).get(key)
+    return name.lower() if name else None
+
+
 def _parse_resizing_hint_and_uri(request: dict) -> tuple[str | None, str]:
     # "/path/to", "hello_t.png" <- "/path/to/hello_t.png"
-    directory_path, file_name_with_extension = request["uri"].rsplit("/", 1)
+    directory_path, _, file_name_with_extension = request["uri"].rpartition("/")
     # "hello_t", "png" <- "hello_t.png"
-    file_name, extension = file_name_with_extension.rsplit(".", 1)
+    file_name, dot, extension = file_name_with_extension.rpartition(".")
+    # Files without extension don't have the hint, and are looked up as they are
+    if not dot:
+        return None, request["uri"]
     # "hello", "_t" <- "hello_t"
     file_name_without_resizing_hint, resizing_hint = file_name[:-2], file_name[-2:]
 
@@ -64,6 +184,50 @@ def _parse_query_params(request):
     return {k: v[0] for k, v in parse_qs(request.get("querystring", "")).items()}
 
 
+def _canonical_integer(value: str) -> str:
+    # "80" <- "080", while invalid values are kept to be rejected by parse
+    try:
+        return str(int(value))
+    except ValueError:
+        return value
+
+
+def _snap_size(query_params: dict) -> None:
+    # Exact size keeps its ratio with the height scaled as much as the width
+    # The size is kept as is if snapping makes it longer than the limits,
+    # which would reject the request valid as requested
+    width, height = query_params.get("w"), query_params.get("h")
+    if width is not None and width.isdigit() and int(width) > 0:
+        snapped_width = _snap_to_ladder(int(width))
+        snapped_height = None
+        if height is not None and height.isdigit():
+            snapped_height = math.ceil(int(height) * snapped_width / int(width))
+        if snapped_width > config.MAX_WIDTH or (
+            snapped_height is not None and snapped_height > config.MAX_HEIGHT
+        ):
+            return
+        query_params["w"] = str(snapped_width)
+        if snapped_height is not None:
+            query_params["h"] = str(snapped_height)
+    elif width is None and height is not None and height.isdigit() and int(height) > 0:
+        snapped_height = _snap_to_ladder(int(height))
+        if snapped_height <= config.MAX_HEIGHT:
+            query_params["h"] = str(snapped_height)
+
+
+def _snap_to_ladder(length: int) -> int:
+    # Rounded up, so that the image is not shown blurred by being scaled up,
+    # while the length over the ladder is kept as is
+    index = bisect.bisect_left(config.SIZE_LADDER, length)
+    return config.SIZE_LADDER[index] if index < len(config.SIZE_LADDER) else length
+
+
+def _check_name(query_params, key: str, names: tuple[str, ...]) -> None:
+    name = query_params.get(key)
+    if name and name.lower() not in names:
+        raise InvalidRequestError(f"Unsupported {key}: {name}")
+
+
 def _parse_width(query_params) -> int | None:
     width = query_params.get("w")
     if width:
@@ -83,3 +247,8 @@ def _parse_quality(query_params) -> int | None:
     if quality:
         quality = int(quality)
     return quality
+
+
+class InvalidRequestError(ValueError):
+    def __init__(self, message: str):
+        super().__init__(message)
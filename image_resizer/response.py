@@ -1,9 +1,23 @@
 import base64
+import json
 from http import HTTPStatus
 from io import BytesIO
 
-from .image import ImageFormat, InvalidImageRequestError, UnsupportedImageFormatError
-from .storage import ObjectNotFoundError
+from . import metrics
+from .image import (
+    ImageFormat,
+    ImageTooLargeError,
+    InvalidImageRequestError,
+    OutputTooLargeError,
+    UnsupportedImageFormatError,
+)
+from .request import InvalidRequestError
+from .storage import DeadlineExceededError, ObjectNotFoundError
+
+# Lambda@Edge rejects the response generated for origin events larger than this
+MAX_RESPONSE_BYTES = 1024 * 1024
+# Room for headers added while finalizing the response
+HEADERS_MARGIN_BYTES = 2048
 
 
 def finalize(
@@ -11,6 +25,8 @@ def finalize(
     stream: BytesIO,
     fmt: ImageFormat | None,
     exception: Exception | None = None,
+    vary: str | None = None,
+    etag: str | None = None,
 ) -> dict:
     # If no errors occurred, update the response as successful
     if exception is None:
@@ -18,14 +34,28 @@ def finalize(
         _update_status_as(response, HTTPStatus.OK)
         _update_body_as(response, stream, fmt)
         _update_cache_control_as(response, 31536000)
+        # Format negotiated by request headers makes the response vary by them
+        if vary is not None:
+            add_vary(response, vary)
+        # ETag of the original doesn't identify the derivative in the body
+        if etag is not None:
+            replace_etag(response, etag)
     # Add special handling for specific exceptions
-    elif isinstance(exception, InvalidImageRequestError):
+    elif isinstance(exception, (InvalidImageRequestError, InvalidRequestError)):
         _update_status_as(response, HTTPStatus.BAD_REQUEST)
     elif isinstance(exception, ObjectNotFoundError):
         _update_status_as(response, HTTPStatus.NOT_FOUND)
+    # The original too large to be decoded within the memory of Lambda
+    elif isinstance(exception, ImageTooLargeError):
+        _update_status_as(response, HTTPStatus.UNPROCESSABLE_ENTITY)
     # Add pass through for listed exceptions
-    elif isinstance(exception, UnsupportedImageFormatError):
+    # The original too large to be generated is served from the origin as is
+    elif isinstance(exception, (UnsupportedImageFormatError, OutputTooLargeError)):
         pass
+    # The original is served as is if reading from S3 took too long, but it's not
+    # cached by CloudFront, so that the next request is resized
+    elif isinstance(exception, DeadlineExceededError):
+        _update_cache_control_as(response, 0)
     # Other unexpected errors are handled as internal server errors
     elif isinstance(exception, Exception):
         _update_status_as(response, HTTPStatus.INTERNAL_SERVER_ERROR)
@@ -36,6 +66,27 @@ def finalize(
     return response
 
 
+def add_vary(response: dict, header: str) -> dict:
+    # "Origin, Accept" <- "Origin", "Accept"
+    headers = response.setdefault("headers", {})
+    values = [v.strip() for h in headers.get("vary", []) for v in h["value"].split(",")]
+    if header.lower() not in [v.lower() for v in values if v]:
+        values = [v for v in values if v] + [header]
+    headers["vary"] = [{"key": "Vary", "value": ", ".join(values)}]
+    return response
+
+
+def replace_etag(response: dict, etag: str) -> dict:
+    response.setdefault("headers", {})["etag"] = [{"key": "ETag", "value": etag}]
+    return response
+
+
+def body_budget(response: dict) -> int:
+    # Body is inflated by 4/3 in base64, and shares the limit with headers
+    headers_bytes = len(json.dumps(response.get("headers", {}))) + HEADERS_MARGIN_BYTES
+    return (MAX_RESPONSE_BYTES - headers_bytes) * 3 // 4
+
+
 def _check_mandatory_parameters(
     stream: BytesIO | None, fmt: ImageFormat | None
 ) -> None:
@@ -48,8 +99,14 @@ def _update_body_as(
     stream: BytesIO,
     fmt: ImageFormat,
 ) -> None:
-    response["bodyEncoding"] = "base64"
-    response["body"] = base64.standard_b64encode(stream.getvalue()).decode()
+    # Base64 is encoded straight from the buffer of stream without copying it to bytes,
+    # and the stream is released before decoding to str which makes another copy
+    with metrics.stage("base64"):
+        with stream.getbuffer() as buffer:
+            encoded = base64.standard_b64encode(buffer)
+        stream.close()
+        response["bodyEncoding"] = "base64"
+        response["body"] = encoded.decode("ascii")
     response["headers"]["content-type"] = [
         {"key": "Content-Type", "value": fmt.value},
     ]
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from . import config, derivative
+from .derivative import Variant
+from .image import (
+    ImageTooLargeError,
+    UnsupportedImageFormatError,
+    needs_resize,
+    negotiate,
+    resize,
+)
+from .request import (
+    parse,
+    parse_accept,
+    parse_extension,
+    parse_filter,
+    parse_fit,
+    parse_format,
+    parse_profile,
+    restore_original_etag,
+    take_resizing_hint,
+)
+from .storage import (
+    ObjectNotFoundError,
+    ObjectNotModifiedError,
+    load_remaining,
+    probe,
+)
+
+# Bytes written to the socket at once, waiting for the client to read before the next
+CHUNK_SIZE = 64 * 1024
+# Request line and headers longer than this are rejected
+MAX_HEAD_BYTES = 16 * 1024
+# Seconds of an idle keep-alive connection before it's closed
+KEEP_ALIVE_TIMEOUT = 5.0
+# Requests handed to the worker pool at once by each worker, over which the others
+# wait in the event loop instead of queueing in the pool without limit
+PENDING_PER_WORKER = 2
+
+
+@dataclass
+class Response:
+    status: HTTPStatus
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes | memoryview = b""
+
+
+async def serve(
+    client,
+    bucket: str,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int | None = None,
+) -> None:
+    # Decoding and encoding run in threads, as Pillow releases GIL for them,
+    # so the event loop only parses requests and writes responses
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(workers, thread_name_prefix="resize") as executor:
+        server = await start(
+            client, bucket, executor, host, port, workers * PENDING_PER_WORKER
+        )
+        addresses = ", ".join(str(s.getsockname()) for s in server.sockets)
+        print(f"Serving {bucket} on {addresses} with {workers} workers")
+        async with server:
+            await server.serve_forever()
+
+
+async def start(
+    client,
+    bucket: str,
+    executor: ThreadPoolExecutor,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    max_pending: int = 16,
+) -> asyncio.Server:
+    slots = asyncio.Semaphore(max_pending)
+    return await asyncio.start_server(
+        partial(_serve_connection, client, bucket, executor, slots),
+        host,
+        port,
+        limit=MAX_HEAD_BYTES,
+    )
+
+
+def handle(client, bucket: str, request: dict) -> Response:
+    # Same parameters and semantics as the origin response event of Lambda@Edge,
+    # from the request converted into the form of CloudFront
+    try:
+        request = restore_original_etag(take_resizing_hint(request))
+        _, path, width, height, quality = parse(request)
+        requested_fmt = parse_format(request)
+        variant = Variant(
+            width,
+            height,
+            quality,
+            negotiate(requested_fmt, parse_accept(request), parse_extension(request)),
+            parse_profile(request),
+            parse_filter(request),
+            parse_fit(request),
+        )
+    except ValueError as exception:
+        return _error(HTTPStatus.BAD_REQUEST, exception)
+    if_none_match = _header(request, "if-none-match")
+    vary = {"Vary": "Accept"} if requested_fmt == "auto" else {}
+
+    try:
+        stream, fmt, size, etag = probe(
+            client, bucket, path, config.S3_PROBE_BYTES, if_none_match
+        )
+    except ObjectNotModifiedError:
+        # The original of the derivative held by the client is not updated
+        headers = {**vary}
+        if if_none_match is not None and "," not in if_none_match:
+            headers["ETag"] = _etag_of(if_none_match, variant)
+        return Response(HTTPStatus.NOT_MODIFIED, headers)
+    except ObjectNotFoundError as exception:
+        return _error(HTTPStatus.NOT_FOUND, exception)
+    except UnsupportedImageFormatError as exception:
+        return _error(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, exception)
+
+    try:
+        stream = load_remaining(client, bucket, path, stream, size, etag)
+        # The original is returned as is if it doesn't need resizing nor converting
+        resizing = needs_resize(stream, fmt, width, height, variant.fit)
+        if resizing or variant.output_fmt not in (None, fmt):
+            stream, fmt = resize(
+                stream,
+                fmt,
+                width,
+                height,
+                quality,
+                output_fmt=variant.output_fmt,
+                profile=variant.profile,
+                resample=variant.resample,
+                fit=variant.fit,
+            )
+    except ImageTooLargeError as exception:
+        return _error(HTTPStatus.UNPROCESSABLE_ENTITY, exception)
+    except ValueError as exception:
+        return _error(HTTPStatus.BAD_REQUEST, exception)
+    except UnsupportedImageFormatError as exception:
+        return _error(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, exception)
+
+    # Body is shared with the stream without copying
+    body = stream.getbuffer()
+    headers = {"Content-Type": fmt.value, **vary}
+    if etag:
+        headers["ETag"] = _etag_of(etag, variant)
+    return Response(HTTPStatus.OK, headers, body)
+
+
+async def _serve_connection(
+    client,
+    bucket: str,
+    executor: ThreadPoolExecutor,
+    slots: asyncio.Semaphore,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(
+                    reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT
+                )
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                return
+            except asyncio.LimitOverrunError:
+                await _write(
+                    writer, Response(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+                )
+                return
+
+            try:
+                method, target, version, headers = _parse_head(head)
+            except ValueError:
+                await _write(writer, Response(HTTPStatus.BAD_REQUEST))
+                return
+            keep_alive = _keeps_alive(version, headers)
+
+            if method not in ("GET", "HEAD"):
+                response = Response(
+                    HTTPStatus.METHOD_NOT_ALLOWED, {"Allow": "GET, HEAD"}
+                )
+            else:
+                async with slots:
+                    response = await loop.run_in_executor(
+                        executor, _handle_safely, client, bucket, target, headers
+                    )
+            await _write(writer, response, method == "HEAD", keep_alive)
+            if not keep_alive:
+                return
+    except ConnectionError:
+        return
+    finally:
+        writer.close()
+
+
+def _handle_safely(client, bucket: str, target: str, headers: list) -> Response:
+    try:
+        return handle(client, bucket, _to_request(bucket, target, headers))
+    except Exception as exception:
+        print("An error occurred:", exception)
+        return Response(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+def _parse_head(head: bytes) -> tuple[str, str, str, list[tuple[str, str]]]:
+    # "GET /a.jpg?w=100 HTTP/1.1\r\nHost: ...\r\n\r\n"
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ")
+    if not version.startswith("HTTP/1.") or not target.startswith("/"):
+        raise ValueError(f"Invalid request line: {lines[0]}")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, separator, value = line.partition(":")
+        if not separator:
+            raise ValueError(f"Invalid header: {line}")
+        headers.append((name.strip(), value.strip()))
+    return method, target, version, headers
+
+
+def _keeps_alive(version: str, headers: list[tuple[str, str]]) -> bool:
+    connection = ",".join(v for n, v in headers if n.lower() == "connection").lower()
+    if version == "HTTP/1.0":
+        return "keep-alive" in connection
+    return "close" not in connection
+
+
+def _to_request(bucket: str, target: str, headers: list[tuple[str, str]]) -> dict:
+    # Request of CloudFront event, whose origin is the bucket of the server
+    url = urlsplit(target)
+    request = {
+        "uri": url.path,
+        "querystring": url.query,
+        "headers": {},
+        "origin": {"s3": {"domainName": bucket}},
+    }
+    for name, value in headers:
+        request["headers"].setdefault(name.lower(), []).append(
+            {"key": name, "value": value}
+        )
+    return request
+
+
+async def _write(
+    writer: asyncio.StreamWriter,
+    response: Response,
+    head_only: bool = False,
+    keep_alive: bool = False,
+) -> None:
+    headers = {
+        **response.headers,
+        "Content-Length": str(len(response.body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    head = f"HTTP/1.1 {response.status.value} {response.status.phrase}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(f"{head}\r\n".encode("latin-1"))
+    if not head_only:
+        # Written in chunks, so that a slow client doesn't make the whole body buffered
+        # in the transport at once
+        body = memoryview(response.body)
+        for offset in range(0, len(body), CHUNK_SIZE):
+            writer.write(body[offset : offset + CHUNK_SIZE])
+            await writer.drain()
+    await writer.drain()
+
+
+def _header(request: dict, name: str) -> str | None:
+    values = request.get("headers", {}).get(name)
+    return values[0]["value"] if values else None
+
+
+def _etag_of(etag: str, variant: Variant) -> str:
+    # The original returned as is keeps its own ETag, as the origin response event
+    if variant.keeps_original():
+        return etag
+    return derivative.build_etag(etag, variant)
+
+
+def _error(status: HTTPStatus, exception: Exception) -> Response:
+    return Response(
+        status, {"Content-Type": "text/plain"}, str(exception).encode("utf-8")
+    )
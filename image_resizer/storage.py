@@ -1,25 +1,236 @@
-from io import BytesIO
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from io import SEEK_END, BytesIO
+from typing import TYPE_CHECKING, Protocol
 
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 
+from . import config, metrics
 from .image import ImageFormat
+from .local import MappedStream
 
+if TYPE_CHECKING:
+    import argparse
 
-def load(client, bucket: str, path: str) -> tuple[BytesIO, ImageFormat]:
+# Storage backends chosen by config.STORAGE_BACKEND
+BACKENDS = ("s3", "local", "memory")
+
+# Clients are kept in module scope to be reused across warm invocations of Lambda,
+# because creating a client loads the service model and opens a new connection
+_clients = {}
+_clients_lock = threading.Lock()
+# Client given by use_client, which is returned instead for every region
+_used_client = None
+
+# Reads with a deadline run in these threads, so that the caller stops waiting for
+# a slow response at the deadline or hedges it with the second request,
+# and so do saves of many objects at once
+_readers = None
+_readers_lock = threading.Lock()
+# Seconds to the response of the recent reads, whose percentile decides when to hedge
+HEDGE_SAMPLES = 200
+HEDGE_MIN_SAMPLES = 20
+_latencies = deque(maxlen=HEDGE_SAMPLES)
+_latencies_lock = threading.Lock()
+
+
+class Backend(Protocol):
+    # Subset of S3 client operations used by storage, which S3 client of boto3,
+    # local.LocalClient and local.MemoryClient implement
+    # Errors are raised as ClientError of botocore with the error codes of S3
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: str | None = None,
+        IfMatch: str = "",
+        IfNoneMatch: str = "",
+    ) -> dict: ...
+
+    def put_object(
+        self, Bucket: str, Key: str, Body: bytes, ContentType: str = ""
+    ) -> dict: ...
+
+    def list_objects_v2(
+        self, Bucket: str, Prefix: str = "", ContinuationToken: str = ""
+    ) -> dict: ...
+
+
+def get_client(region: str) -> Backend:
+    # Client of the backend chosen by configuration, where only S3 differs by region
+    backend = config.STORAGE_BACKEND
+    key = region if backend == "s3" else backend
+    with _clients_lock:
+        if _used_client is not None:
+            return _used_client
+        client = _clients.get(key)
+        if client is None:
+            client = open_client(backend, region, config.STORAGE_LOCAL_ROOT)
+            _clients[key] = client
+        return client
+
+
+def use_client(client: Backend | None) -> None:
+    # Tools running the handler outside of Lambda, like the replay benchmark,
+    # give the client opened by their options instead of the configured backend
+    global _used_client
+    with _clients_lock:
+        _used_client = client
+
+
+def open_client(backend: str, region: str, local_root: str = "") -> Backend:
+    match backend:
+        case "s3":
+            # boto3 is imported on the first client creation, because it takes hundreds of
+            # milliseconds and slows down cold starts even if S3 is not used
+            import boto3
+
+            return boto3.client("s3", region_name=region, config=_client_config())
+        case "local":
+            from .local import LocalClient
+
+            return LocalClient(local_root or ".")
+        case "memory":
+            from .local import MemoryClient
+
+            return MemoryClient()
+    raise ValueError(f"Unsupported storage backend: {backend}")
+
+
+def add_client_arguments(
+    parser: "argparse.ArgumentParser", default_backend: str | None = None
+) -> None:
+    # Options of the storage shared by the command line tools, whose backend
+    # is the configured one unless the tool has its own default
+    default_backend = default_backend or config.STORAGE_BACKEND
+    parser.add_argument(
+        "--region", default=config.S3_DEFAULT_REGION, help="region of S3"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=None,
+        help=f"storage of the originals (default: {default_backend})",
+    )
+    parser.add_argument(
+        "--local-root",
+        default=None,
+        help="use directories under this root as buckets, which implies local backend",
+    )
+    parser.set_defaults(default_backend=default_backend)
+
+
+def open_client_from(args: "argparse.Namespace") -> Backend:
+    # Client of the options added by add_client_arguments
+    backend = args.backend or ("local" if args.local_root else args.default_backend)
+    return open_client(
+        backend, args.region, args.local_root or config.STORAGE_LOCAL_ROOT
+    )
+
+
+def load(
+    client: Backend,
+    bucket: str,
+    path: str,
+    if_none_match: str | None = None,
+    deadline: float | None = None,
+) -> tuple[BytesIO, ImageFormat]:
+    # If ETag of the object held by the caller is given and it's not updated,
+    # ObjectNotModifiedError is raised without transferring the object
+    # Deadline is in time.monotonic(), at which DeadlineExceededError is raised
     try:
-        response = client.get_object(Bucket=bucket, Key=path)
+        response = _get_object(
+            client, deadline, Bucket=bucket, Key=path, **_conditions(if_none_match)
+        )
         fmt = ImageFormat.try_from(response["ContentType"])
-        stream = BytesIO(response["Body"].read())
+        stream = _stream_of(response["Body"])
         return stream, fmt
     except ClientError as e:
-        if e.response.get("Error", {}).get("Code", None) == "NoSuchKey":
-            raise ObjectNotFoundError(f"File not found in S3: {bucket}/{path}") from e
+        raise _load_error(e, bucket, path) from e
+    except BotoCoreError as e:
+        # Network errors like timeouts come without any response from S3
         raise StorageOperationError(
             f"Failed to load image from S3: {bucket}/{path}"
         ) from e
 
 
-def save(client, bucket: str, path: str, stream: BytesIO, fmt: ImageFormat) -> None:
+def probe(
+    client: Backend,
+    bucket: str,
+    path: str,
+    length: int,
+    if_none_match: str | None = None,
+    deadline: float | None = None,
+) -> tuple[BytesIO, ImageFormat, int, str]:
+    # Load only the first bytes of the object, which are enough to read the image header
+    try:
+        response = _get_object(
+            client,
+            deadline,
+            Bucket=bucket,
+            Key=path,
+            Range=f"bytes=0-{length - 1}",
+            **_conditions(if_none_match),
+        )
+        fmt = ImageFormat.try_from(response["ContentType"])
+        stream = BytesIO(response["Body"].read())
+        size = _parse_object_size(response.get("ContentRange"), stream)
+        return stream, fmt, size, response.get("ETag", "")
+    except ClientError as e:
+        raise _load_error(e, bucket, path) from e
+
+
+def load_remaining(
+    client: Backend,
+    bucket: str,
+    path: str,
+    stream: BytesIO,
+    size: int,
+    etag: str,
+    deadline: float | None = None,
+) -> BytesIO:
+    # Load the rest of the object after the probed stream
+    # ETag from probing guards against mixing bytes of an object updated in the meantime
+    offset = stream.seek(0, SEEK_END)
+    if offset < size:
+        # The whole object is read into one buffer allocated in advance,
+        # instead of concatenating the probed stream and the rest in bytes
+        try:
+            response = _get_object(
+                client,
+                deadline,
+                Bucket=bucket,
+                Key=path,
+                Range=f"bytes={offset}-",
+                IfMatch=etag,
+            )
+            if isinstance(response["Body"], MappedStream):
+                # The whole file is mapped already, and the probed bytes are the same
+                # as guarded by ETag, so nothing is copied
+                mapped = response["Body"].whole()
+                mapped.seek(0)
+                return mapped
+            whole = _allocate(size)
+            with whole.getbuffer() as buffer:
+                buffer[:offset] = stream.getvalue()
+                _read_into(response["Body"], buffer[offset:], deadline)
+        except ClientError as e:
+            raise _load_error(e, bucket, path) from e
+        finally:
+            stream.close()
+        stream = whole
+    stream.seek(0)
+    return stream
+
+
+def save(
+    client: Backend, bucket: str, path: str, stream: BytesIO, fmt: ImageFormat
+) -> None:
     try:
         client.put_object(
             Bucket=bucket,
@@ -27,17 +238,213 @@ def save(client, bucket: str, path: str, stream: BytesIO, fmt: ImageFormat) -> N
             Body=stream.getvalue(),
             ContentType=fmt.value,
         )
-    except ClientError as e:
+    except (ClientError, BotoCoreError) as e:
         raise StorageOperationError(
             f"Failed to save image to S3: {bucket}/{path}"
         ) from e
 
 
+def save_many(
+    client: Backend,
+    objects: list[tuple[str, str, BytesIO, ImageFormat]],
+    deadline: float | None = None,
+) -> list[Exception | None]:
+    # Objects are saved concurrently, and the error of each is returned in order
+    # Saves not started by the deadline are skipped with DeadlineExceededError,
+    # while the ones in flight can't be cancelled and are left to finish
+    if deadline is not None and time.monotonic() >= deadline:
+        return [
+            DeadlineExceededError(f"Not saved by the deadline: {bucket}/{path}")
+            for bucket, path, _, _ in objects
+        ]
+    writers = _get_readers()
+    saves = [
+        writers.submit(save, client, bucket, path, stream, fmt)
+        for bucket, path, stream, fmt in objects
+    ]
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    wait(saves, timeout=timeout)
+    errors = []
+    for (bucket, path, _, _), future in zip(objects, saves):
+        if future.done():
+            errors.append(future.exception())
+        else:
+            future.cancel()
+            errors.append(
+                DeadlineExceededError(f"Not saved by the deadline: {bucket}/{path}")
+            )
+    return errors
+
+
+def _get_object(client: Backend, deadline: float | None, **params) -> dict:
+    # Without deadline, the object is read in the calling thread
+    if deadline is None:
+        return client.get_object(**params)
+
+    # The second request is sent if the first doesn't respond as soon as the usual ones,
+    # and the response coming first is taken while the other is discarded
+    readers = _get_readers()
+    attempts = [readers.submit(_timed_get_object, client, params)]
+    hedge_at = deadline
+    if config.S3_HEDGE_PERCENTILE > 0:
+        hedge_at = min(time.monotonic() + _hedge_delay(), deadline)
+    winner = None
+    try:
+        while True:
+            succeeded = [a for a in attempts if a.done() and a.exception() is None]
+            if succeeded:
+                winner = succeeded[0]
+                return winner.result()
+            # Errors of the request like NoSuchKey are the same for both,
+            # so the other is not waited for
+            rejected = [a for a in attempts if a.done() and _is_rejected(a)]
+            if rejected:
+                return rejected[0].result()
+            pending = [a for a in attempts if not a.done()]
+            if not pending:
+                return attempts[0].result()
+            now = time.monotonic()
+            if now >= deadline:
+                raise DeadlineExceededError(
+                    f"No response from storage by the deadline: {params['Key']}"
+                )
+            if len(attempts) == 1 and now >= hedge_at:
+                metrics.put("hedged_reads", 1)
+                attempts.append(readers.submit(_timed_get_object, client, params))
+                continue
+            until = hedge_at if len(attempts) == 1 else deadline
+            wait(pending, timeout=until - now, return_when=FIRST_COMPLETED)
+    finally:
+        # Requests can't be cancelled in flight, so the loser releases its connection
+        # by closing its body whenever it responds
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.add_done_callback(_discard)
+
+
+def _timed_get_object(client: Backend, params: dict) -> dict:
+    started_at = time.monotonic()
+    response = client.get_object(**params)
+    with _latencies_lock:
+        _latencies.append(time.monotonic() - started_at)
+    return response
+
+
+def _hedge_delay() -> float:
+    with _latencies_lock:
+        latencies = list(_latencies)
+    if len(latencies) < HEDGE_MIN_SAMPLES:
+        return config.S3_HEDGE_INITIAL_DELAY
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    # 99 cut points are given for the percentiles from 1 to 99
+    return percentiles[min(config.S3_HEDGE_PERCENTILE, 99) - 1]
+
+
+def _is_rejected(attempt: Future) -> bool:
+    # Server errors may not happen again, unlike errors like NoSuchKey or AccessDenied
+    exception = attempt.exception()
+    if not isinstance(exception, ClientError):
+        return False
+    status = exception.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status is None or status < 500
+
+
+def _discard(attempt: Future) -> None:
+    if attempt.cancelled() or attempt.exception() is not None:
+        return
+    body = attempt.result().get("Body")
+    if body is not None:
+        body.close()
+
+
+def _get_readers() -> ThreadPoolExecutor:
+    global _readers
+    with _readers_lock:
+        if _readers is None:
+            # Up to two requests of each connection in the pool of S3 client
+            _readers = ThreadPoolExecutor(
+                2 * config.S3_MAX_POOL_CONNECTIONS, thread_name_prefix="storage"
+            )
+        return _readers
+
+
+def _stream_of(body) -> BytesIO:
+    # Mapped files of the local backend are handed to Pillow without copying
+    if isinstance(body, MappedStream):
+        return body
+    return BytesIO(body.read())
+
+
+def _allocate(size: int) -> BytesIO:
+    # Writing at the end makes BytesIO allocate the buffer of the exact size at once
+    stream = BytesIO()
+    stream.seek(size - 1)
+    stream.write(b"\0")
+    return stream
+
+
+def _read_into(body, buffer: memoryview, deadline: float | None = None) -> None:
+    # Read the body directly into the buffer without making intermediate bytes
+    offset = 0
+    while offset < len(buffer):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceededError("Object is not read by the deadline")
+        count = body.readinto(buffer[offset:])
+        if not count:
+            raise StorageOperationError("Object is shorter than expected")
+        offset += count
+
+
+def _conditions(if_none_match: str | None) -> dict:
+    return {} if if_none_match is None else {"IfNoneMatch": if_none_match}
+
+
+def _load_error(e: ClientError, bucket: str, path: str) -> Exception:
+    code = e.response.get("Error", {}).get("Code", None)
+    if code == "NoSuchKey":
+        return ObjectNotFoundError(f"File not found in S3: {bucket}/{path}")
+    # S3 answers 304 without a body, which botocore raises as an error
+    if code in ("304", "NotModified"):
+        return ObjectNotModifiedError(f"File not modified in S3: {bucket}/{path}")
+    return StorageOperationError(f"Failed to load image from S3: {bucket}/{path}")
+
+
+def _parse_object_size(content_range: str | None, stream: BytesIO) -> int:
+    # 727858 <- "bytes 0-16383/727858"
+    match = re.fullmatch(r"bytes \d+-\d+/(\d+)", content_range or "")
+    if match is None:
+        # The whole object is returned if range is not applied
+        return len(stream.getbuffer())
+    return int(match.group(1))
+
+
+def _client_config():
+    from botocore.config import Config
+
+    return Config(
+        connect_timeout=config.S3_CONNECT_TIMEOUT,
+        read_timeout=config.S3_READ_TIMEOUT,
+        max_pool_connections=config.S3_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={"max_attempts": 2, "mode": "standard"},
+    )
+
+
 class ObjectNotFoundError(FileNotFoundError):
     def __init__(self, message: str):
         super().__init__(message)
 
 
+class ObjectNotModifiedError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+class DeadlineExceededError(TimeoutError):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
 class StorageOperationError(RuntimeError):
     def __init__(self, message: str):
         super().__init__(message)
@@ -1,55 +1,239 @@
+from __future__ import annotations
+
+import time
+from dataclasses import replace
 from http import HTTPStatus
-from io import BytesIO
+from io import SEEK_END, BytesIO
+from typing import TYPE_CHECKING
 
-import boto3
+from image_resizer import config, metrics
+from image_resizer.request import (
+    RESIZING_HINT_SIZES,
+    canonicalize,
+    parse,
+    parse_accept,
+    parse_extension,
+    parse_filter,
+    parse_fit,
+    parse_format,
+    parse_profile,
+    parse_region,
+    restore_original_etag,
+    take_resizing_hint,
+)
 
-from image_resizer.image import resize
-from image_resizer.request import parse, take_resizing_hint
-from image_resizer.response import finalize
-from image_resizer.storage import load
+if TYPE_CHECKING:
+    from image_resizer.derivative import Variant
+    from image_resizer.image import ImageFormat
 
 
-def handle(event, _context):
-    config = event["Records"][0]["cf"]["config"]
+def handle(event, context):
+    event_config = event["Records"][0]["cf"]["config"]
     request = event["Records"][0]["cf"]["request"]
 
-    match config["eventType"]:
-        case "origin-request":
-            return _handle_origin_request_event(request)
-        case "origin-response":
-            response = event["Records"][0]["cf"]["response"]
-            return _handle_origin_response_event(request, response)
+    # Timings and sizes of the stages are logged in a line at the end of the invocation
+    metrics.start(event_config["eventType"])
+    try:
+        match event_config["eventType"]:
+            case "viewer-request":
+                return _handle_viewer_request_event(request)
+            case "origin-request":
+                return _handle_origin_request_event(request)
+            case "origin-response":
+                response = event["Records"][0]["cf"]["response"]
+                response = _handle_origin_response_event(
+                    request, response, _deadline_of(context)
+                )
+                metrics.set_property("status", str(response["status"]))
+                return response
+    finally:
+        metrics.emit()
+
+
+def _handle_viewer_request_event(request):
+    # CloudFront looks up its cache by the viewer request, so the query canonicalized
+    # here makes equivalent requests share the cached object as well as the derivative
+    return canonicalize(request)
 
 
 def _handle_origin_request_event(request):
     # Take resizing hint from the request and modify uri and length-related query parameters in the request
-    return take_resizing_hint(request)
+    request = take_resizing_hint(request)
+    # Revalidate the derivative cached by CloudFront against ETag of the original in S3
+    return restore_original_etag(request)
 
 
-def _handle_origin_response_event(request: dict, response: dict) -> dict:
+def _handle_origin_response_event(
+    request: dict, response: dict, deadline: float | None = None
+) -> dict:
     # Create a BytesIO stream for image early to avoid undefined variable error
     stream = BytesIO()
 
+    # S3 answers 304 to the revalidation by CloudFront if the original is not updated,
+    # and then CloudFront keeps serving the cached derivative
+    if response["status"] == str(HTTPStatus.NOT_MODIFIED.value):
+        return _handle_not_modified(request, response)
+
     # If the response from S3 is not OK (meaning the object doesn't exist),
     # return the original response
     if response["status"] != str(HTTPStatus.OK.value):
         return response
 
+    # Modules for resizing are imported on the first origin response event,
+    # so that Pillow and botocore don't slow down cold starts of origin request events
+    from image_resizer.derivative import Variant
+    from image_resizer.image import needs_resize, negotiate, resize, resize_many
+    from image_resizer.response import add_vary, body_budget, finalize, replace_etag
+    from image_resizer.storage import get_client, load_remaining, probe
+
     try:
-        # Parse the request to get the necessary information
-        bucket, path, width, height, quality = parse(request)
+        with metrics.stage("parse"):
+            # Parse the request to get the necessary information
+            bucket, path, width, height, quality = parse(request)
+            region = parse_region(request) or config.S3_DEFAULT_REGION
+
+            # Choose the output format from the query and Accept header of the viewer
+            # If it is None, the format of the original is kept
+            requested_fmt = parse_format(request)
+            output_fmt = negotiate(
+                requested_fmt, parse_accept(request), parse_extension(request)
+            )
+            vary = "Accept" if requested_fmt == "auto" else None
+            # Encoder profile trades encoding time for output size
+            profile = parse_profile(request)
+            # Resampling filter trades quality of downscaling for CPU time
+            resample = parse_filter(request)
+            # Fit of the image in the box of both width and height
+            fit = parse_fit(request)
+            variant = Variant(
+                width, height, quality, output_fmt, profile, resample, fit
+            )
 
-        # Load the image from S3 and make it BytesIO stream
-        # If the image doesn't exist, FileNotFoundError is raised
-        client = boto3.client("s3", region_name="ap-northeast-2")
-        stream, fmt = load(client, bucket, path)
+        with metrics.stage("client"):
+            client = get_client(region)
 
-        # Resize the image
-        # If length from request parser is not valid, ValueError is raised
-        stream = resize(stream, fmt, width, height, quality)
+        # Look up the image resized from the same original by the previous requests
+        # in memory and then in S3. If it exists, resizing is skipped
+        derivative_bucket = config.DERIVATIVE_BUCKET or bucket
+        etag = _original_etag(response)
+        derivative_key = _build_derivative_key(etag, path, variant)
+        derivative_etag = _build_derivative_etag(etag, variant)
+        found = None
+        if derivative_key is not None:
+            with metrics.stage("lookup"):
+                found = _lookup_derivative(
+                    client, derivative_bucket, derivative_key, deadline
+                )
+
+        if found is not None:
+            stream, fmt = found
+            metrics.put("cache_hit", 1)
+        else:
+            # Take the original loaded by the previous requests from memory, or load
+            # the header of the image from S3 and make it BytesIO stream
+            # If the image doesn't exist, FileNotFoundError is raised
+            original = _lookup_original(bucket, path, etag)
+            metrics.put("cache_hit", 0 if original is None else 1)
+            if original is not None:
+                stream, fmt = original
+            else:
+                with metrics.stage("probe"):
+                    stream, fmt, size, probed_etag = probe(
+                        client, bucket, path, config.S3_PROBE_BYTES, None, deadline
+                    )
+            metrics.set_property("input_format", fmt.name)
+
+            # If the image doesn't need resizing nor converting, the origin response is
+            # returned as is without loading the rest, decoding and encoding the image
+            resizing = needs_resize(stream, fmt, width, height, fit)
+            if not resizing and output_fmt in (None, fmt):
+                stream.close()
+                if derivative_etag is not None:
+                    replace_etag(response, derivative_etag)
+                return response if vary is None else add_vary(response, vary)
+
+            # Load the rest of the image only if it is resized
+            if original is None:
+                with metrics.stage("load"):
+                    stream = load_remaining(
+                        client, bucket, path, stream, size, probed_etag, deadline
+                    )
+                _store_original(bucket, path, etag, stream, fmt)
+            metrics.put("input_bytes", _length_of(stream), "Bytes")
+
+            # Resize the image
+            # If length from request parser is not valid, ValueError is raised
+            # Lambda@Edge rejects the response if the body is larger than its limit,
+            # so the resized image may be compressed more or even converted to another format
+            max_bytes = body_budget(response)
+            if (
+                resizing
+                and config.DERIVATIVE_ENABLED
+                and derivative_key is not None
+                and (width, height) in RESIZING_HINT_SIZES
+            ):
+                # Other hint sizes of the same image are likely to be requested soon,
+                # so all of them are made from a single decode and stored together
+                # Without the derivative store, only the requested size is worth making
+                resized_all = resize_many(
+                    stream,
+                    fmt,
+                    list(RESIZING_HINT_SIZES),
+                    quality,
+                    max_bytes,
+                    output_fmt=output_fmt,
+                    profile=profile,
+                    resample=resample,
+                )
+                derivatives = [
+                    (
+                        _build_derivative_key(
+                            etag,
+                            path,
+                            replace(variant, width=hint_width, height=hint_height),
+                        ),
+                        *resized,
+                    )
+                    for (hint_width, hint_height), resized in zip(
+                        RESIZING_HINT_SIZES, resized_all
+                    )
+                    if resized is not None
+                ]
+                with metrics.stage("store"):
+                    _store_derivatives(client, derivative_bucket, derivatives, deadline)
+                resized = resized_all[RESIZING_HINT_SIZES.index((width, height))]
+                if resized is None:
+                    # The header was not in the probed bytes, and the image turned out
+                    # not to be larger than the requested size
+                    if derivative_etag is not None:
+                        replace_etag(response, derivative_etag)
+                    return response if vary is None else add_vary(response, vary)
+                stream, fmt = resized
+            else:
+                stream, fmt = resize(
+                    stream,
+                    fmt,
+                    width,
+                    height,
+                    quality,
+                    max_bytes,
+                    output_fmt=output_fmt,
+                    profile=profile,
+                    resample=resample,
+                    fit=fit,
+                )
+
+                # Store the resized image for the next requests
+                if derivative_key is not None:
+                    with metrics.stage("store"):
+                        _store_derivative(
+                            client, derivative_bucket, derivative_key, stream, fmt
+                        )
 
         # Finalise the response
-        response = finalize(response, stream, fmt, None)
+        metrics.set_property("output_format", fmt.name)
+        metrics.put("output_bytes", _length_of(stream), "Bytes")
+        response = finalize(response, stream, fmt, None, vary, derivative_etag)
     except Exception as exception:
         # Finalise the response with exception
         response = finalize(response, stream, None, exception)
@@ -57,3 +241,159 @@ def _handle_origin_response_event(request: dict, response: dict) -> dict:
         print("Response is finalized:", response)
 
     return response
+
+
+def _deadline_of(context) -> float | None:
+    # Reads from S3 give up before the time limit of Lambda, leaving the time to return
+    # the original response as is instead of timing out
+    if context is None:
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000
+    return time.monotonic() + remaining - config.S3_DEADLINE_MARGIN
+
+
+def _handle_not_modified(request: dict, response: dict) -> dict:
+    from image_resizer.derivative import Variant
+    from image_resizer.image import negotiate
+    from image_resizer.response import replace_etag
+
+    # 304 from S3 has ETag of the original, which would replace ETag of the derivative
+    # cached by CloudFront, so it's turned into ETag of the derivative again
+    try:
+        _, _, width, height, quality = parse(request)
+        variant = Variant(
+            width,
+            height,
+            quality,
+            negotiate(
+                parse_format(request), parse_accept(request), parse_extension(request)
+            ),
+            parse_profile(request),
+            parse_filter(request),
+            parse_fit(request),
+        )
+    except Exception as exception:
+        print("Failed to parse the revalidated request:", exception)
+        return response
+    etag = _build_derivative_etag(_original_etag(response), variant)
+    return response if etag is None else replace_etag(response, etag)
+
+
+def _length_of(stream: BytesIO) -> int:
+    # getbuffer would copy the bytes of BytesIO shared with the cache by getvalue,
+    # so the length is taken by seeking to the end
+    position = stream.tell()
+    length = stream.seek(0, SEEK_END)
+    stream.seek(position)
+    return length
+
+
+def _copy_of(stream: BytesIO) -> bytes:
+    # Bytes shared with the cache by getvalue would be copied again by getbuffer
+    # when the same stream is finalized, so the cache keeps its own copy instead
+    with stream.getbuffer() as buffer:
+        return bytes(buffer)
+
+
+def _original_etag(response: dict) -> str | None:
+    return response.get("headers", {}).get("etag", [{}])[0].get("value") or None
+
+
+def _build_derivative_key(etag: str | None, path: str, variant: Variant) -> str | None:
+    # The original is returned as is without length and conversion, so nothing to store
+    if variant.keeps_original():
+        return None
+
+    # Without ETag of the original, the derivative cannot be invalidated when the original changes
+    if etag is None:
+        return None
+
+    from image_resizer import derivative
+
+    return derivative.build_key(config.DERIVATIVE_PREFIX, path, etag, variant)
+
+
+def _build_derivative_etag(etag: str | None, variant: Variant) -> str | None:
+    # The original returned as is without length and conversion keeps its own ETag
+    if etag is None or variant.keeps_original():
+        return None
+
+    from image_resizer import derivative
+
+    return derivative.build_etag(etag, variant)
+
+
+def _lookup_derivative(
+    client, bucket: str, key: str, deadline: float | None = None
+) -> tuple[BytesIO, ImageFormat] | None:
+    from image_resizer import derivative
+    from image_resizer.cache import cache
+
+    # Derivatives in memory of the warm container skip the round trip to S3
+    cached = cache.get(("derivative", bucket, key))
+    if cached is not None:
+        metrics.set_property("cache", "derivative_memory")
+        data, fmt = cached
+        return BytesIO(data), fmt
+
+    if not config.DERIVATIVE_ENABLED:
+        return None
+    found = derivative.lookup(client, bucket, key, deadline)
+    if found is not None:
+        metrics.set_property("cache", "derivative_s3")
+        cache.put(("derivative", bucket, key), _copy_of(found[0]), found[1])
+    return found
+
+
+def _store_derivative(
+    client, bucket: str, key: str, stream: BytesIO, fmt: ImageFormat
+) -> None:
+    from image_resizer import derivative
+    from image_resizer.cache import cache
+
+    cache.put(("derivative", bucket, key), _copy_of(stream), fmt)
+    if config.DERIVATIVE_ENABLED:
+        derivative.store(client, bucket, key, stream, fmt)
+
+
+def _store_derivatives(
+    client,
+    bucket: str,
+    derivatives: list[tuple[str, BytesIO, ImageFormat]],
+    deadline: float | None = None,
+) -> None:
+    from image_resizer import derivative
+    from image_resizer.cache import cache
+
+    for key, stream, fmt in derivatives:
+        cache.put(("derivative", bucket, key), _copy_of(stream), fmt)
+    if config.DERIVATIVE_ENABLED:
+        derivative.store_many(client, bucket, derivatives, deadline)
+
+
+def _lookup_original(
+    bucket: str, path: str, etag: str | None
+) -> tuple[BytesIO, ImageFormat] | None:
+    from image_resizer.cache import cache
+
+    # ETag from the origin response guarantees the original in memory is not stale
+    if etag is None:
+        return None
+    cached = cache.get(("original", bucket, path, etag))
+    if cached is None:
+        return None
+    metrics.set_property("cache", "original_memory")
+    data, fmt = cached
+    return BytesIO(data), fmt
+
+
+def _store_original(
+    bucket: str, path: str, etag: str | None, stream: BytesIO, fmt: ImageFormat
+) -> None:
+    from image_resizer.cache import cache
+    from image_resizer.local import MappedStream
+
+    # Files mapped by the local backend are kept in the page cache by OS already
+    if etag is not None and not isinstance(stream, MappedStream):
+        # Bytes of BytesIO are shared without copying until the stream is written
+        cache.put(("original", bucket, path, etag), stream.getvalue(), fmt)
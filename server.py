@@ -0,0 +1,32 @@
+import argparse
+import asyncio
+import sys
+
+from image_resizer.server import serve
+from image_resizer.storage import add_client_arguments, open_client_from
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Serve resized images over HTTP like the Lambda@Edge function"
+    )
+    parser.add_argument("bucket", help="bucket of the originals")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="decode and encode (default: CPUs)"
+    )
+    add_client_arguments(parser)
+    args = parser.parse_args(argv)
+
+    client = open_client_from(args)
+
+    try:
+        asyncio.run(serve(client, args.bucket, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import pytest
+
+from image_resizer.backfill import parse_sizes
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("100", ((100, None),)),
+        ("100,200", ((100, None), (200, None))),
+        ("200x100", ((200, 100),)),
+        ("x300", ((None, 300),)),
+        (" 100 , 200x200 ", ((100, None), (200, 200))),
+    ],
+)
+def test_sut_parses_sizes_correctly(text, expected):
+    # Arrange
+    sut = parse_sizes
+
+    # Act
+    actual = sut(text)
+
+    # Assert
+    assert actual == expected
+
+
+def test_sut_raises_error_if_size_is_not_number():
+    # Arrange
+    sut = parse_sizes
+
+    # Act & Assert
+    with pytest.raises(ValueError):
+        sut("large")
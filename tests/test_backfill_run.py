@@ -0,0 +1,207 @@
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from image_resizer import backfill
+from image_resizer.backfill import run
+from image_resizer.derivative import Variant, build_key
+from image_resizer.local import LocalClient
+
+
+def test_sut_stores_derivatives_of_all_sizes(client, originals):
+    # Arrange
+    sut = run
+    etag = client.get_object(Bucket="bucket", Key="images/a.jpg")["ETag"]
+
+    # Act
+    report = sut(client, "bucket", ["images/a.jpg"], sizes=[(100, None), (200, 50)])
+
+    # Assert
+    assert report.originals == 1
+    assert report.derivatives == 2
+    assert report.bytes_written > 0
+    for width, height, expected_size in [(100, None, (100, 75)), (200, 50, (200, 50))]:
+        key = build_key("_derivatives", "images/a.jpg", etag, Variant(width, height))
+        response = client.get_object(Bucket="bucket", Key=key)
+        assert response["ContentType"] == "image/jpeg"
+        assert Image.open(response["Body"]).size == expected_size
+
+
+def test_sut_stores_derivatives_to_given_bucket_and_prefix(client, originals):
+    # Arrange
+    sut = run
+
+    # Act
+    sut(
+        client,
+        "bucket",
+        ["images/a.jpg"],
+        sizes=[(100, None)],
+        derivative_bucket="derivatives",
+        derivative_prefix="resized",
+    )
+
+    # Assert
+    stored = [
+        content["Key"]
+        for content in client.list_objects_v2(Bucket="derivatives")["Contents"]
+    ]
+    assert len(stored) == 1
+    assert stored[0].startswith("resized/images/a.jpg/")
+
+
+def test_sut_skips_size_not_smaller_than_original(client, originals):
+    # Arrange
+    sut = run
+
+    # Act
+    report = sut(client, "bucket", ["images/a.jpg"], sizes=[(100, None), (1000, None)])
+
+    # Assert
+    assert report.originals == 1
+    assert report.derivatives == 1
+
+
+def test_sut_records_failed_keys_and_continues(client, originals):
+    # Arrange
+    sut = run
+
+    # Act
+    report = sut(
+        client, "bucket", ["images/missing.jpg", "images/b.png"], sizes=[(100, None)]
+    )
+
+    # Assert
+    assert report.failed == ["images/missing.jpg"]
+    assert report.originals == 1
+    assert report.derivatives == 1
+
+
+def test_sut_skips_derivatives_in_same_bucket(client, originals):
+    # Arrange
+    sut = run
+    sut(client, "bucket", ["images/a.jpg"], sizes=[(100, None)])
+    keys = [
+        content["Key"]
+        for content in client.list_objects_v2(Bucket="bucket")["Contents"]
+    ]
+
+    # Act
+    report = sut(client, "bucket", keys, sizes=[(100, None)])
+
+    # Assert
+    assert report.skipped == 1
+    assert report.originals == 2
+
+
+def test_sut_resumes_from_progress(client, originals, tmp_path):
+    # Arrange
+    sut = run
+    progress_path = tmp_path / "progress"
+    keys = ["images/a.jpg", "images/b.png"]
+    sut(client, "bucket", keys[:1], sizes=[(100, None)], progress_path=progress_path)
+
+    # Act
+    report = sut(
+        client, "bucket", keys, sizes=[(100, None)], progress_path=progress_path
+    )
+
+    # Assert
+    assert report.skipped == 1
+    assert report.originals == 1
+    lines = progress_path.read_text().splitlines()
+    assert [line.split("\t")[0] for line in lines] == keys
+
+
+def test_sut_backfills_again_original_updated_since_progress(
+    client, originals, tmp_path
+):
+    # Arrange
+    sut = run
+    progress_path = tmp_path / "progress"
+    sut(
+        client,
+        "bucket",
+        ["images/a.jpg"],
+        sizes=[(100, None)],
+        progress_path=progress_path,
+    )
+    client.put_object(Bucket="bucket", Key="images/a.jpg", Body=_image_bytes("PNG"))
+
+    # Act
+    report = sut(
+        client,
+        "bucket",
+        ["images/a.jpg"],
+        sizes=[(100, None)],
+        progress_path=progress_path,
+    )
+
+    # Assert
+    assert report.skipped == 0
+    assert report.originals == 1
+    assert report.derivatives == 1
+
+
+def test_sut_bounds_originals_in_flight(monkeypatch, client):
+    # Arrange
+    sut = run
+    keys = [f"images/{index}.png" for index in range(6)]
+    for key in keys:
+        client.put_object(Bucket="bucket", Key=key, Body=_image_bytes("PNG"))
+    in_flight = _spy_originals_in_flight(monkeypatch)
+
+    # Act
+    report = sut(
+        client, "bucket", keys, sizes=[(100, None)], threads=4, max_in_flight=1
+    )
+
+    # Assert
+    assert report.originals == 6
+    assert report.derivatives == 6
+    assert in_flight["max"] == 1
+
+
+@pytest.fixture
+def client(tmp_path: Path) -> LocalClient:
+    return LocalClient(tmp_path / "root")
+
+
+@pytest.fixture
+def originals(client: LocalClient) -> None:
+    client.put_object(Bucket="bucket", Key="images/a.jpg", Body=_image_bytes("JPEG"))
+    client.put_object(Bucket="bucket", Key="images/b.png", Body=_image_bytes("PNG"))
+
+
+def _image_bytes(fmt: str) -> bytes:
+    stream = BytesIO()
+    Image.new("RGB", (400, 300), (255, 0, 0)).save(stream, fmt)
+    return stream.getvalue()
+
+
+def _spy_originals_in_flight(monkeypatch) -> dict[str, int]:
+    # Each original is in flight from its download until its only derivative is uploaded
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+    download, upload = backfill._download, backfill._upload
+
+    def download_spy(*args):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(0.01)
+        return download(*args)
+
+    def upload_spy(*args):
+        written = upload(*args)
+        with lock:
+            in_flight["now"] -= 1
+        return written
+
+    monkeypatch.setattr(backfill, "_download", download_spy)
+    monkeypatch.setattr(backfill, "_upload", upload_spy)
+    return in_flight
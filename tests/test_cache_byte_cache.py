@@ -0,0 +1,75 @@
+from image_resizer.cache import ByteCache
+
+
+def test_sut_returns_value_and_metadata_put_before():
+    # Arrange
+    sut = ByteCache(100)
+    sut.put(("original", "bucket", "path", "etag"), b"image", "JPEG")
+
+    # Act
+    actual = sut.get(("original", "bucket", "path", "etag"))
+
+    # Assert
+    assert actual == (b"image", "JPEG")
+
+
+def test_sut_evicts_least_recently_used_entries_over_budget():
+    # Arrange
+    sut = ByteCache(10)
+    sut.put(("original", "a"), b"1234")
+    sut.put(("original", "b"), b"1234")
+    sut.get(("original", "a"))
+
+    # Act
+    sut.put(("original", "c"), b"1234")
+
+    # Assert
+    assert sut.get(("original", "a")) is not None
+    assert sut.get(("original", "b")) is None
+    assert sut.get(("original", "c")) is not None
+    assert sut.stats()["bytes"] == 8
+    assert sut.stats()["evictions"] == 1
+
+
+def test_sut_does_not_keep_value_larger_than_budget():
+    # Arrange
+    sut = ByteCache(10)
+    sut.put(("original", "a"), b"1234")
+
+    # Act
+    sut.put(("original", "b"), b"12345678901")
+
+    # Assert
+    assert sut.get(("original", "a")) is not None
+    assert sut.get(("original", "b")) is None
+
+
+def test_sut_accounts_replaced_value():
+    # Arrange
+    sut = ByteCache(10)
+    sut.put(("original", "a"), b"1234")
+
+    # Act
+    sut.put(("original", "a"), b"12")
+
+    # Assert
+    assert sut.stats()["bytes"] == 2
+    assert sut.stats()["entries"] == 1
+
+
+def test_sut_counts_hits_and_misses_by_kind():
+    # Arrange
+    sut = ByteCache(100)
+    sut.put(("original", "a"), b"1234")
+
+    # Act
+    sut.get(("original", "a"))
+    sut.get(("original", "b"))
+    sut.get(("derivative", "a"))
+
+    # Assert
+    stats = sut.stats()
+    assert stats["original_hits"] == 1
+    assert stats["original_misses"] == 1
+    assert stats["derivative_misses"] == 1
+    assert "derivative_hits" not in stats
@@ -0,0 +1,35 @@
+from image_resizer.derivative import Variant, build_etag
+from image_resizer.image import ImageFormat
+
+
+def test_sut_builds_strong_etag_having_etag_of_original_and_variant():
+    # Arrange
+    sut = build_etag
+
+    # Act
+    actual = sut('"0563e39b"', Variant(100, None))
+
+    # Assert
+    assert actual == '"0563e39b-w100_hauto_q80"'
+
+
+def test_sut_builds_different_etag_by_output_format():
+    # Arrange
+    sut = build_etag
+
+    # Act
+    actual = sut('"0563e39b"', Variant(100, 90, 70, ImageFormat.WEBP))
+
+    # Assert
+    assert actual == '"0563e39b-w100_h90_q70_fwebp"'
+
+
+def test_sut_builds_different_etag_by_profile():
+    # Arrange
+    sut = build_etag
+
+    # Act
+    actual = sut('"0563e39b"', Variant(100, None, None, ImageFormat.WEBP, "fast"))
+
+    # Assert
+    assert actual == '"0563e39b-w100_hauto_q80_fwebp_pfast"'
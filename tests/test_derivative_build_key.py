@@ -0,0 +1,116 @@
+import pytest
+
+from image_resizer.derivative import Variant, build_key
+from image_resizer.image import ImageFormat
+
+
+def test_sut_builds_key_having_prefix_path_etag_and_lengths():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut("_derivatives", "path/to/file.jpg", '"0563e39b"', Variant(100, 90, 70))
+
+    # Assert
+    assert actual == "_derivatives/path/to/file.jpg/0563e39b/w100_h90_q70"
+
+
+@pytest.mark.parametrize(
+    "width,height,expected",
+    [(100, None, "w100_hauto_q80"), (None, 90, "wauto_h90_q80")],
+)
+def test_sut_builds_key_with_auto_length_if_length_is_not_given(
+    width, height, expected
+):
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut("_derivatives", "file.jpg", "etag", Variant(width, height))
+
+    # Assert
+    assert actual.endswith(f"/{expected}")
+
+
+def test_sut_builds_same_key_if_quality_is_not_given_or_default():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut("_derivatives", "file.jpg", "etag", Variant(100, None))
+
+    # Assert
+    assert actual == sut("_derivatives", "file.jpg", "etag", Variant(100, None, 80))
+
+
+def test_sut_builds_different_key_if_etag_of_original_changes():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut("_derivatives", "file.jpg", '"new"', Variant(100, None))
+
+    # Assert
+    assert actual != sut("_derivatives", "file.jpg", '"old"', Variant(100, None))
+
+
+@pytest.mark.parametrize("prefix", ["", "/"])
+def test_sut_builds_key_without_leading_slash_if_prefix_is_empty(prefix):
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut(prefix, "file.jpg", "etag", Variant(100, None))
+
+    # Assert
+    assert actual == "file.jpg/etag/w100_hauto_q80"
+
+
+def test_sut_builds_key_having_output_format_if_format_is_converted():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut(
+        "_derivatives", "file.jpg", "etag", Variant(100, None, 80, ImageFormat.WEBP)
+    )
+
+    # Assert
+    assert actual == "_derivatives/file.jpg/etag/w100_hauto_q80_fwebp"
+
+
+def test_sut_builds_key_having_profile_if_profile_is_requested():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut(
+        "_derivatives", "file.jpg", "etag", Variant(100, None, 80, profile="small")
+    )
+
+    # Assert
+    assert actual == "_derivatives/file.jpg/etag/w100_hauto_q80_psmall"
+
+
+def test_sut_builds_key_having_filter_if_filter_is_requested():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut(
+        "_derivatives", "file.jpg", "etag", Variant(100, None, 80, resample="nearest")
+    )
+
+    # Assert
+    assert actual == "_derivatives/file.jpg/etag/w100_hauto_q80_rnearest"
+
+
+def test_sut_builds_key_having_fit_if_fit_is_requested():
+    # Arrange
+    sut = build_key
+
+    # Act
+    actual = sut("_derivatives", "file.jpg", "etag", Variant(100, 100, 80, fit="cover"))
+
+    # Assert
+    assert actual == "_derivatives/file.jpg/etag/w100_h100_q80_mcover"
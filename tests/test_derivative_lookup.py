@@ -0,0 +1,68 @@
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError, ReadTimeoutError
+from botocore.response import StreamingBody
+
+from image_resizer.derivative import lookup
+from image_resizer.image import ImageFormat
+
+
+def test_sut_returns_stream_and_format_if_derivative_exists():
+    # Arrange
+    sut = lookup
+    client_stub = MagicMock()
+    client_stub.get_object.return_value = {
+        "ContentType": "image/png",
+        "Body": StreamingBody(BytesIO(b"resized"), len(b"resized")),
+    }
+
+    # Act
+    stream, fmt = sut(client_stub, "bucket", "key")
+
+    # Assert
+    assert stream.getvalue() == b"resized"
+    assert fmt == ImageFormat.PNG
+
+
+def test_sut_returns_none_if_derivative_does_not_exist():
+    # Arrange
+    sut = lookup
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+    )
+
+    # Act
+    actual = sut(client_stub, "bucket", "key")
+
+    # Assert
+    assert actual is None
+
+
+def test_sut_returns_none_if_client_error_happens():
+    # Arrange
+    sut = lookup
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied"}}, "GetObject"
+    )
+
+    # Act
+    actual = sut(client_stub, "bucket", "key")
+
+    # Assert
+    assert actual is None
+
+
+def test_sut_returns_none_if_network_error_happens():
+    # Arrange
+    sut = lookup
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ReadTimeoutError(endpoint_url="s3")
+
+    # Act
+    actual = sut(client_stub, "bucket", "key")
+
+    # Assert
+    assert actual is None
@@ -0,0 +1,41 @@
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from image_resizer.derivative import store
+from image_resizer.image import ImageFormat
+
+
+def test_sut_sends_command_to_client_correctly():
+    # Arrange
+    sut = store
+    client_spy = MagicMock()
+
+    # Act
+    sut(client_spy, "bucket", "key", BytesIO(b"resized"), ImageFormat.JPEG)
+
+    # Assert
+    client_spy.put_object.assert_called_once_with(
+        Bucket="bucket", Key="key", Body=b"resized", ContentType="image/jpeg"
+    )
+
+
+def test_sut_does_not_raise_error_if_client_error_happens():
+    # Arrange
+    sut = store
+    client_stub = MagicMock()
+    client_stub.put_object.side_effect = ClientError({}, "PutObject")
+
+    # Act & Assert
+    sut(client_stub, "bucket", "key", BytesIO(), ImageFormat.JPEG)
+
+
+def test_sut_does_not_raise_error_if_network_error_happens():
+    # Arrange
+    sut = store
+    client_stub = MagicMock()
+    client_stub.put_object.side_effect = EndpointConnectionError(endpoint_url="s3")
+
+    # Act & Assert
+    sut(client_stub, "bucket", "key", BytesIO(), ImageFormat.JPEG)
@@ -0,0 +1,68 @@
+import time
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+
+from image_resizer.derivative import store_many
+from image_resizer.image import ImageFormat
+
+
+def test_sut_sends_commands_to_client_correctly():
+    # Arrange
+    sut = store_many
+    client_spy = MagicMock()
+    derivatives = [
+        ("key0", BytesIO(b"resized0"), ImageFormat.JPEG),
+        ("key1", BytesIO(b"resized1"), ImageFormat.JPEG),
+    ]
+
+    # Act
+    sut(client_spy, "bucket", derivatives)
+
+    # Assert
+    calls = sorted(
+        (c.kwargs for c in client_spy.put_object.call_args_list),
+        key=lambda params: params["Key"],
+    )
+    assert calls == [
+        dict(Bucket="bucket", Key="key0", Body=b"resized0", ContentType="image/jpeg"),
+        dict(Bucket="bucket", Key="key1", Body=b"resized1", ContentType="image/jpeg"),
+    ]
+
+
+def test_sut_does_not_raise_error_if_client_error_happens():
+    # Arrange
+    sut = store_many
+    client_stub = MagicMock()
+    client_stub.put_object.side_effect = ClientError({}, "PutObject")
+
+    # Act & Assert
+    sut(client_stub, "bucket", [("key", BytesIO(), ImageFormat.JPEG)])
+
+
+def test_sut_does_not_raise_unexpected_error_of_client():
+    # Arrange
+    sut = store_many
+    client_stub = MagicMock()
+    client_stub.put_object.side_effect = RuntimeError("unexpected")
+
+    # Act & Assert
+    sut(client_stub, "bucket", [("key", BytesIO(), ImageFormat.JPEG)])
+
+
+def test_sut_does_not_raise_error_if_deadline_has_passed():
+    # Arrange
+    sut = store_many
+    client_spy = MagicMock()
+
+    # Act
+    sut(
+        client_spy,
+        "bucket",
+        [("key", BytesIO(), ImageFormat.JPEG)],
+        time.monotonic() - 1,
+    )
+
+    # Assert
+    client_spy.put_object.assert_not_called()
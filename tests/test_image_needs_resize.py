@@ -0,0 +1,197 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, PngImagePlugin
+
+from image_resizer.image import (
+    MAX_HEIGHT,
+    MAX_WIDTH,
+    ImageFormat,
+    ImageTooLargeError,
+    InvalidImageRequestError,
+    needs_resize,
+)
+
+# Size of the sample image
+ORIGINAL_WIDTH, ORIGINAL_HEIGHT = 1028, 1280
+
+
+@pytest.mark.parametrize(
+    "width,height",
+    [(-300, None), (None, -300), (MAX_WIDTH + 1, None), (None, MAX_HEIGHT + 1)],
+)
+def test_sut_raises_image_validation_error_when_requested_length_is_invalid(
+    header_stream, width, height
+):
+    # Arrange
+    sut = needs_resize
+
+    # Act & Assert
+    with pytest.raises(InvalidImageRequestError):
+        sut(header_stream, ImageFormat.JPEG, width, height)
+
+
+def test_sut_returns_false_if_requested_width_and_height_are_none(header_stream):
+    # Arrange
+    sut = needs_resize
+
+    # Act
+    actual = sut(header_stream, ImageFormat.JPEG, None, None)
+
+    # Assert
+    assert actual is False
+
+
+@pytest.mark.parametrize("width,height", [(2000, 2000), (100, 100)])
+def test_sut_returns_true_if_width_and_height_are_given(header_stream, width, height):
+    # Arrange
+    sut = needs_resize
+
+    # Act
+    actual = sut(header_stream, ImageFormat.JPEG, width, height)
+
+    # Assert
+    assert actual is True
+
+
+@pytest.mark.parametrize(
+    "width,height", [(ORIGINAL_WIDTH - 1, None), (None, ORIGINAL_HEIGHT - 1)]
+)
+def test_sut_returns_true_if_requested_length_is_shorter_than_original(
+    header_stream, width, height
+):
+    # Arrange
+    sut = needs_resize
+
+    # Act
+    actual = sut(header_stream, ImageFormat.JPEG, width, height)
+
+    # Assert
+    assert actual is True
+
+
+@pytest.mark.parametrize(
+    "width,height", [(ORIGINAL_WIDTH, None), (None, ORIGINAL_HEIGHT), (2000, None)]
+)
+def test_sut_returns_false_if_requested_length_is_not_shorter_than_original(
+    header_stream, width, height
+):
+    # Arrange
+    sut = needs_resize
+
+    # Act
+    actual = sut(header_stream, ImageFormat.JPEG, width, height)
+
+    # Assert
+    assert actual is False
+
+
+@pytest.mark.parametrize(
+    "width,height,expected",
+    [
+        (ORIGINAL_WIDTH - 1, 2000, True),
+        (2000, ORIGINAL_HEIGHT - 1, True),
+        (ORIGINAL_WIDTH, ORIGINAL_HEIGHT, False),
+    ],
+)
+def test_sut_compares_box_with_original_if_fit_is_contain(
+    header_stream, width, height, expected
+):
+    # Arrange
+    sut = needs_resize
+
+    # Act
+    actual = sut(header_stream, ImageFormat.JPEG, width, height, "contain")
+
+    # Assert
+    assert actual is expected
+
+
+def test_sut_returns_true_if_header_is_not_complete_in_stream():
+    # Arrange
+    sut = needs_resize
+    stream = BytesIO(open("tests/sample_image.jpg", "rb").read()[:8])
+
+    # Act
+    actual = sut(stream, ImageFormat.JPEG, 2000, None)
+
+    # Assert
+    assert actual is True
+
+
+def test_sut_raises_image_too_large_error_if_header_exceeds_limit(
+    monkeypatch, header_stream
+):
+    # Arrange
+    sut = needs_resize
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+
+    # Act & Assert
+    with pytest.raises(ImageTooLargeError):
+        sut(header_stream, ImageFormat.JPEG, 2000, None)
+
+
+def test_sut_rewinds_stream_after_reading_header(header_stream):
+    # Arrange
+    sut = needs_resize
+
+    # Act
+    sut(header_stream, ImageFormat.JPEG, 100, None)
+
+    # Assert
+    assert header_stream.tell() == 0
+
+
+def test_sut_compares_requested_width_with_width_in_exif_orientation():
+    # Arrange
+    sut = needs_resize
+    # Stored in 400x300 and shown in 300x400, rotated by EXIF orientation
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    stream = BytesIO()
+    Image.new("RGB", (400, 300)).save(stream, format="JPEG", exif=exif.tobytes())
+
+    # Act
+    actual = sut(stream, ImageFormat.JPEG, 350, None)
+
+    # Assert
+    assert actual is False
+
+
+def test_sut_compares_requested_width_with_width_in_exif_orientation_of_png():
+    # Arrange
+    sut = needs_resize
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    stream = BytesIO()
+    Image.new("RGB", (400, 300)).save(stream, format="PNG", exif=exif.tobytes())
+
+    # Act
+    actual = sut(stream, ImageFormat.PNG, 350, None)
+
+    # Assert
+    assert actual is False
+
+
+def test_sut_does_not_decode_png_without_exif(monkeypatch):
+    # Arrange
+    sut = needs_resize
+    stream = BytesIO()
+    Image.new("RGB", (400, 300)).save(stream, format="PNG")
+    loaded = []
+    monkeypatch.setattr(
+        PngImagePlugin.PngImageFile, "load", lambda self: loaded.append(self)
+    )
+
+    # Act
+    actual = sut(stream, ImageFormat.PNG, 350, None)
+
+    # Assert
+    assert actual is True
+    assert loaded == []
+
+
+@pytest.fixture
+def header_stream() -> BytesIO:
+    # Only the first bytes of the sample image, as loaded by probing
+    return BytesIO(open("tests/sample_image.jpg", "rb").read()[:16384])
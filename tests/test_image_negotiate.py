@@ -0,0 +1,93 @@
+import pytest
+from PIL import features
+
+from image_resizer.image import ImageFormat, InvalidImageRequestError, negotiate
+
+
+def test_sut_returns_none_if_format_is_not_requested():
+    # Arrange
+    sut = negotiate
+
+    # Act
+    actual = sut(None, ["image/avif", "image/webp"])
+
+    # Assert
+    assert actual is None
+
+
+@pytest.mark.parametrize(
+    "accepted,expected",
+    [
+        pytest.param(
+            ["image/avif", "image/webp", "*/*"],
+            ImageFormat.AVIF,
+            marks=pytest.mark.skipif(
+                not features.check("avif"), reason="AVIF is not supported by Pillow"
+            ),
+        ),
+        (["image/webp", "*/*"], ImageFormat.WEBP),
+    ],
+)
+def test_sut_returns_smallest_accepted_format_if_format_is_auto(accepted, expected):
+    # Arrange
+    sut = negotiate
+
+    # Act
+    actual = sut("auto", accepted)
+
+    # Assert
+    assert actual == expected
+
+
+@pytest.mark.parametrize("accepted", [["image/*", "*/*"], []])
+def test_sut_returns_none_if_format_is_auto_and_no_smaller_format_is_accepted(
+    accepted,
+):
+    # Arrange
+    sut = negotiate
+
+    # Act
+    actual = sut("auto", accepted)
+
+    # Assert
+    assert actual is None
+
+
+@pytest.mark.parametrize(
+    "accepted,expected",
+    [(["image/avif", "image/webp"], ImageFormat.WEBP), (["image/avif"], None)],
+)
+def test_sut_chooses_only_animated_format_if_original_may_be_animated(
+    accepted, expected
+):
+    # Arrange
+    sut = negotiate
+
+    # Act
+    actual = sut("auto", accepted, "gif")
+
+    # Assert
+    assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "requested,expected", [("webp", ImageFormat.WEBP), ("jpeg", ImageFormat.JPEG)]
+)
+def test_sut_returns_explicitly_requested_format(requested, expected):
+    # Arrange
+    sut = negotiate
+
+    # Act
+    actual = sut(requested, [])
+
+    # Assert
+    assert actual == expected
+
+
+def test_sut_raises_image_validation_error_if_requested_format_is_unsupported():
+    # Arrange
+    sut = negotiate
+
+    # Act & Assert
+    with pytest.raises(InvalidImageRequestError):
+        sut("bmp", [])
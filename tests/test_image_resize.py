@@ -1,12 +1,16 @@
+import os
 from io import BytesIO
 
 import pytest
-from PIL import Image
+from PIL import Image, ImageCms, ImageFile, JpegImagePlugin, features
 
+from image_resizer import config
 from image_resizer.image import (
     ImageFormat,
+    ImageTooLargeError,
     resize,
     InvalidImageRequestError,
+    OutputTooLargeError,
     MAX_WIDTH,
     MAX_HEIGHT,
 )
@@ -77,7 +81,7 @@ def test_sut_returns_original_image_without_resizing_if_requested_width_and_heig
     sut = resize
 
     # Act
-    resized_stream = sut(original_stream, original_format, None, None, None)
+    resized_stream, _ = sut(original_stream, original_format, None, None, None)
 
     # Assert
     assert original_stream == resized_stream
@@ -96,7 +100,7 @@ def test_sut_resizes_image_by_keeping_ratio_if_one_of_width_and_height_is_none(
     expected = float(original_image.width) / original_image.height
 
     # Act
-    resized_stream = sut(original_stream, original_format, width, height, None)
+    resized_stream, _ = sut(original_stream, original_format, width, height, None)
 
     # Assert
     resized_image = Image.open(resized_stream, formats=[original_format.name])
@@ -115,7 +119,7 @@ def test_sut_resizes_image_having_same_length_as_requested_if_one_of_width_and_h
     sut = resize
 
     # Act
-    resized_stream = sut(original_stream, original_format, width, height, None)
+    resized_stream, _ = sut(original_stream, original_format, width, height, None)
 
     # Assert
     actual = Image.open(resized_stream, formats=[original_format.name])
@@ -136,7 +140,7 @@ def test_sut_does_not_resize_to_make_bigger_than_original_image_if_one_of_width_
     expected = Image.open(original_stream, formats=[original_format.name])
 
     # Act
-    resized_stream = sut(original_stream, original_format, width, height, None)
+    resized_stream, _ = sut(original_stream, original_format, width, height, None)
 
     # Assert
     actual = Image.open(resized_stream, formats=[original_format.name])
@@ -155,7 +159,7 @@ def test_sut_resizes_exactly_having_same_length_as_requested_if_width_and_height
     sut = resize
 
     # Act
-    resized_stream = sut(original_stream, original_format, width, height, None)
+    resized_stream, _ = sut(original_stream, original_format, width, height, None)
 
     # Assert
     actual = Image.open(resized_stream, formats=[original_format.name])
@@ -193,6 +197,682 @@ def test_sut_does_not_close_stream_if_both_width_and_height_are_none(
     assert not original_stream.closed
 
 
+@pytest.mark.parametrize("width,height", [(100, 100), (100, None), (None, 100)])
+def test_sut_decodes_large_jpeg_in_reduced_scale_if_requested_length_is_much_shorter(
+    large_original_stream,
+    monkeypatch,
+    width,
+    height,
+):
+    # Arrange
+    sut = resize
+    decoded_sizes = _spy_jpeg_draft(monkeypatch)
+
+    # Act
+    sut(large_original_stream, ImageFormat.JPEG, width, height, None)
+
+    # Assert
+    assert decoded_sizes == [(500, 375)]
+
+
+@pytest.mark.parametrize("width,height", [(1500, 1500), (1500, None), (None, 1500)])
+def test_sut_decodes_large_jpeg_in_full_scale_if_requested_length_is_not_short_enough(
+    large_original_stream,
+    monkeypatch,
+    width,
+    height,
+):
+    # Arrange
+    sut = resize
+    decoded_sizes = _spy_jpeg_draft(monkeypatch)
+
+    # Act
+    sut(large_original_stream, ImageFormat.JPEG, width, height, None)
+
+    # Assert
+    assert decoded_sizes == []
+
+
+@pytest.mark.parametrize("width,height", [(100, 100), (150, 50), (99, 37)])
+def test_sut_resizes_large_jpeg_exactly_having_same_length_as_requested(
+    large_original_stream,
+    width,
+    height,
+):
+    # Arrange
+    sut = resize
+
+    # Act
+    resized_stream, _ = sut(
+        large_original_stream, ImageFormat.JPEG, width, height, None
+    )
+
+    # Assert
+    actual = Image.open(resized_stream, formats=[ImageFormat.JPEG.name])
+    assert actual.width == width and actual.height == height
+
+
+@pytest.mark.parametrize("width,height", [(100, 100), (100, None)])
+def test_sut_keeps_format_and_quality_if_output_is_within_max_bytes(
+    original_stream,
+    original_format,
+    width,
+    height,
+):
+    # Arrange
+    sut = resize
+    expected = sut(
+        BytesIO(original_stream.getvalue()), original_format, width, height, None
+    )[0]
+
+    # Act
+    resized_stream, actual = sut(
+        original_stream, original_format, width, height, None, 1024 * 1024
+    )
+
+    # Assert
+    assert actual == original_format
+    assert resized_stream.getvalue() == expected.getvalue()
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.JPEG, ImageFormat.WEBP])
+def test_sut_lowers_quality_to_fit_output_within_max_bytes(noise_image, fmt):
+    # Arrange
+    sut = resize
+    stream = _stream_of(noise_image, fmt)
+    max_bytes = sut(_stream_of(noise_image, fmt), fmt, 600, None, None)[0]
+    max_bytes = len(max_bytes.getvalue()) // 2
+
+    # Act
+    resized_stream, actual = sut(stream, fmt, 600, None, None, max_bytes)
+
+    # Assert
+    assert actual == fmt
+    assert len(resized_stream.getvalue()) <= max_bytes
+    assert Image.open(resized_stream, formats=[fmt.name]).width == 600
+
+
+@pytest.mark.skipif(
+    not features.check("avif"), reason="AVIF is not supported by Pillow"
+)
+def test_sut_lowers_quality_of_avif_output_to_fit_output_within_max_bytes(noise_image):
+    # Arrange
+    sut = resize
+    stream = _stream_of(noise_image, ImageFormat.PNG)
+    max_bytes = sut(
+        _stream_of(noise_image, ImageFormat.PNG),
+        ImageFormat.PNG,
+        100,
+        None,
+        None,
+        output_fmt=ImageFormat.AVIF,
+    )[0]
+    max_bytes = len(max_bytes.getvalue()) // 2
+
+    # Act
+    resized_stream, actual = sut(
+        stream, ImageFormat.PNG, 100, None, None, max_bytes, ImageFormat.AVIF
+    )
+
+    # Assert
+    assert actual == ImageFormat.AVIF
+    assert len(resized_stream.getvalue()) <= max_bytes
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.PNG, ImageFormat.GIF, ImageFormat.TIFF])
+def test_sut_falls_back_to_smaller_format_if_output_does_not_fit_max_bytes(
+    noise_image, fmt
+):
+    # Arrange
+    sut = resize
+    stream = _stream_of(noise_image, fmt)
+
+    # Act
+    resized_stream, actual = sut(stream, fmt, 600, None, None, 64 * 1024)
+
+    # Assert
+    assert actual != fmt
+    assert len(resized_stream.getvalue()) <= 64 * 1024
+    assert Image.open(resized_stream, formats=[actual.name]).width == 600
+
+
+def test_sut_bisects_settings_over_downsampled_image_to_fit_max_bytes(
+    noise_image, capsys
+):
+    # Arrange
+    sut = resize
+    stream = _stream_of(noise_image, ImageFormat.PNG)
+
+    # Act
+    sut(stream, ImageFormat.PNG, 600, None, None, 64 * 1024)
+
+    # Assert
+    # PNG, WEBP and JPEG have 5, 15 and 15 settings, of which bisection probes a few
+    attempts = capsys.readouterr().out
+    assert attempts.count("Encoding attempt (probe)") <= 12
+    assert attempts.count("Encoding attempt (full)") <= 6
+
+
+def test_sut_raises_output_too_large_error_if_output_never_fits_max_bytes(
+    original_stream, original_format
+):
+    # Arrange
+    sut = resize
+
+    # Act & Assert
+    with pytest.raises(OutputTooLargeError):
+        sut(original_stream, original_format, 100, None, None, 100)
+
+
+@pytest.mark.parametrize("width,height", [(100, 100), (100, None), (None, None)])
+def test_sut_converts_image_into_requested_output_format(
+    original_stream,
+    original_format,
+    width,
+    height,
+):
+    # Arrange
+    sut = resize
+
+    # Act
+    resized_stream, actual = sut(
+        original_stream, original_format, width, height, None, None, ImageFormat.WEBP
+    )
+
+    # Assert
+    assert actual == ImageFormat.WEBP
+    assert Image.open(resized_stream, formats=["WEBP"]).format == "WEBP"
+
+
+def test_sut_does_not_close_stream_if_output_format_is_same_as_original(
+    original_stream,
+    original_format,
+):
+    # Arrange
+    sut = resize
+
+    # Act
+    resized_stream, _ = sut(
+        original_stream, original_format, None, None, None, None, original_format
+    )
+
+    # Assert
+    assert resized_stream is original_stream
+    assert not original_stream.closed
+
+
+def test_sut_raises_image_validation_error_when_profile_is_not_supported(
+    original_stream,
+    original_format,
+):
+    # Arrange
+    sut = resize
+
+    # Act & Assert
+    with pytest.raises(InvalidImageRequestError):
+        sut(original_stream, original_format, 100, None, None, profile="tiny")
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.JPEG, ImageFormat.PNG])
+def test_sut_encodes_smaller_output_in_small_profile_than_fast_profile(fmt):
+    # Arrange
+    sut = resize
+    image = Image.effect_mandelbrot((800, 600), (-2.0, -1.2, 1.0, 1.2), 100)
+    original = _stream_of(image.convert("RGB"), fmt).getvalue()
+
+    # Act
+    fast_stream, _ = sut(BytesIO(original), fmt, 400, None, None, profile="fast")
+    small_stream, _ = sut(BytesIO(original), fmt, 400, None, None, profile="small")
+
+    # Assert
+    assert small_stream.getbuffer().nbytes < fast_stream.getbuffer().nbytes
+
+
+def test_sut_encodes_large_output_in_fast_profile_by_default(monkeypatch):
+    # Arrange
+    sut = resize
+    original = _stream_of(Image.new("RGB", (2000, 1500), "orange"), ImageFormat.PNG)
+    saved_options = _spy_png_save(monkeypatch)
+
+    # Act
+    sut(original, ImageFormat.PNG, 1000, None, None)
+
+    # Assert
+    assert saved_options == [{"compress_level": 1}]
+
+
+@pytest.mark.parametrize("resample", ["mitchell", "bicubic"])
+def test_sut_raises_image_validation_error_when_filter_is_not_allowed(
+    original_stream,
+    original_format,
+    resample,
+):
+    # Arrange
+    sut = resize
+
+    # Act & Assert
+    with pytest.raises(InvalidImageRequestError):
+        sut(original_stream, original_format, 100, None, None, resample=resample)
+
+
+@pytest.mark.parametrize("resample", ["nearest", "bilinear", "lanczos"])
+def test_sut_resizes_image_by_requested_filter(
+    original_stream, original_format, resample
+):
+    # Arrange
+    sut = resize
+
+    # Act
+    resized_stream, _ = sut(
+        original_stream, original_format, 100, 100, None, resample=resample
+    )
+
+    # Assert
+    assert Image.open(resized_stream).size == (100, 100)
+
+
+@pytest.mark.parametrize("width,height", [(100, 75), (100, None)])
+def test_sut_reduces_image_by_integer_factor_before_resampling_large_ratio(
+    monkeypatch, width, height
+):
+    # Arrange
+    sut = resize
+    original = _stream_of(Image.new("RGB", (2000, 1500), "orange"), ImageFormat.PNG)
+    factors = []
+    reduce = Image.Image.reduce
+
+    def reduce_spy(self, factor, box=None):
+        factors.append(factor)
+        return reduce(self, factor, box)
+
+    monkeypatch.setattr(Image.Image, "reduce", reduce_spy)
+
+    # Act
+    resized_stream, _ = sut(original, ImageFormat.PNG, width, height, None)
+
+    # Assert
+    assert factors == [(6, 6)]
+    assert Image.open(resized_stream).size == (100, 75)
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.GIF, ImageFormat.WEBP])
+def test_sut_resizes_all_frames_of_animation_keeping_timing(fmt):
+    # Arrange
+    sut = resize
+    original = _animation_stream_of(fmt, ["red", "green", "blue"], [100, 200, 300])
+
+    # Act
+    resized_stream, actual = sut(original, fmt, 100, None, None)
+
+    # Assert
+    assert actual == fmt
+    resized = Image.open(resized_stream)
+    assert resized.size == (100, 75)
+    assert resized.info["loop"] == 0
+    assert _durations_of(resized) == [100, 200, 300]
+
+
+def test_sut_keeps_disposal_of_frames_of_animated_gif():
+    # Arrange
+    sut = resize
+    original = _animation_stream_of(
+        ImageFormat.GIF, ["red", "green", "blue"], [100, 100, 100], disposal=[1, 2, 1]
+    )
+
+    # Act
+    resized_stream, _ = sut(original, ImageFormat.GIF, 100, None, None)
+
+    # Assert
+    resized = Image.open(resized_stream)
+    disposals = []
+    for index in range(resized.n_frames):
+        resized.seek(index)
+        disposals.append(resized.disposal_method)
+    assert disposals == [1, 2, 1]
+
+
+def test_sut_skips_frames_over_budget_adding_their_durations(monkeypatch):
+    # Arrange
+    sut = resize
+    monkeypatch.setattr(config, "ANIMATION_FRAME_BUDGET", 2)
+    original = _animation_stream_of(
+        ImageFormat.GIF, ["red", "green", "blue", "white"], [100, 200, 300, 400]
+    )
+
+    # Act
+    resized_stream, _ = sut(original, ImageFormat.GIF, 100, None, None)
+
+    # Assert
+    assert _durations_of(Image.open(resized_stream)) == [300, 700]
+
+
+@pytest.mark.parametrize(
+    "max_frames,max_pixels", [(2, 200_000_000), (1000, 400 * 300 * 2)]
+)
+def test_sut_resizes_only_first_frame_if_animation_exceeds_limits(
+    monkeypatch, max_frames, max_pixels
+):
+    # Arrange
+    sut = resize
+    monkeypatch.setattr(config, "ANIMATION_MAX_FRAMES", max_frames)
+    monkeypatch.setattr(config, "ANIMATION_MAX_PIXELS", max_pixels)
+    original = _animation_stream_of(
+        ImageFormat.GIF, ["red", "green", "blue"], [100, 100, 100]
+    )
+
+    # Act
+    resized_stream, _ = sut(original, ImageFormat.GIF, 100, None, None)
+
+    # Assert
+    assert getattr(Image.open(resized_stream), "n_frames", 1) == 1
+
+
+def test_sut_resizes_only_first_frame_if_output_format_cannot_animate():
+    # Arrange
+    sut = resize
+    original = _animation_stream_of(
+        ImageFormat.GIF, ["red", "green", "blue"], [100, 100, 100]
+    )
+
+    # Act
+    resized_stream, actual = sut(
+        original, ImageFormat.GIF, 100, None, None, None, ImageFormat.JPEG
+    )
+
+    # Assert
+    assert actual == ImageFormat.JPEG
+    assert Image.open(resized_stream).getpixel((50, 37))[0] > 250
+
+
+@pytest.mark.parametrize("width,height", [(150, None), (None, 200), (150, 200)])
+@pytest.mark.parametrize("fmt", [ImageFormat.JPEG, ImageFormat.PNG])
+def test_sut_resizes_image_shown_in_exif_orientation(fmt, width, height):
+    # Arrange
+    sut = resize
+    original = _rotated_stream_of(fmt)
+
+    # Act
+    resized_stream, _ = sut(original, fmt, width, height, None)
+
+    # Assert
+    resized = Image.open(resized_stream).convert("RGB")
+    assert resized.size == (150, 200)
+    # Red on the left of the stored image is shown on the top
+    assert resized.getpixel((75, 10))[0] > 250
+    assert resized.getpixel((75, 190))[2] > 250
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.JPEG, ImageFormat.PNG, ImageFormat.WEBP])
+def test_sut_strips_metadata_of_original_from_output(fmt):
+    # Arrange
+    sut = resize
+    original = _rotated_stream_of(fmt)
+
+    # Act
+    resized_stream, _ = sut(original, fmt, 150, None, None)
+
+    # Assert
+    resized = Image.open(resized_stream)
+    assert "exif" not in resized.info
+    assert "icc_profile" not in resized.info
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.JPEG, ImageFormat.PNG, ImageFormat.WEBP])
+def test_sut_keeps_icc_profile_if_configured(monkeypatch, fmt):
+    # Arrange
+    sut = resize
+    monkeypatch.setattr(config, "KEEP_ICC_PROFILE", True)
+    original = _rotated_stream_of(fmt)
+
+    # Act
+    resized_stream, _ = sut(original, fmt, 150, None, None)
+
+    # Assert
+    resized = Image.open(resized_stream)
+    assert "exif" not in resized.info
+    assert resized.info["icc_profile"] == _icc_profile()
+
+
+@pytest.mark.parametrize("fmt", [ImageFormat.JPEG, ImageFormat.PNG])
+def test_sut_crops_center_of_image_to_ratio_of_box_if_fit_is_cover(fmt):
+    # Arrange
+    sut = resize
+    stream = _stream_of(_panorama(), fmt)
+
+    # Act
+    resized_stream, _ = sut(stream, fmt, 100, 100, None, fit="cover")
+
+    # Assert
+    resized = Image.open(resized_stream).convert("RGB")
+    assert resized.size == (100, 100)
+    # Only the green third in the center is left
+    for x in (5, 50, 94):
+        red, green, blue = resized.getpixel((x, 50))
+        assert green > 200 and red < 50 and blue < 50
+
+
+def test_sut_resamples_only_cropped_region_of_drafted_jpeg_if_fit_is_cover(
+    monkeypatch,
+):
+    # Arrange
+    sut = resize
+    stream = _stream_of(_panorama(), ImageFormat.JPEG)
+    decoded_sizes = _spy_jpeg_draft(monkeypatch)
+    boxes = []
+    resize_image = Image.Image.resize
+
+    def resize_spy(self, size, resample=None, box=None, reducing_gap=None):
+        boxes.append(box)
+        return resize_image(self, size, resample, box, reducing_gap)
+
+    monkeypatch.setattr(Image.Image, "resize", resize_spy)
+
+    # Act
+    sut(stream, ImageFormat.JPEG, 100, 100, None, fit="cover")
+
+    # Assert
+    # 1200x400 is drafted at 1/2, whose center third is 200x200
+    assert decoded_sizes == [(600, 200)]
+    assert boxes == [(200.0, 0.0, 400.0, 200.0)]
+
+
+def test_sut_crops_image_shown_in_exif_orientation_if_fit_is_cover():
+    # Arrange
+    sut = resize
+    stream = _rotated_stream_of(ImageFormat.JPEG)
+
+    # Act
+    resized_stream, _ = sut(stream, ImageFormat.JPEG, 150, 100, None, fit="cover")
+
+    # Assert
+    # Shown in 300x400 with red on the top and blue on the bottom, cropped in the middle
+    resized = Image.open(resized_stream)
+    assert resized.size == (150, 100)
+    assert resized.getpixel((75, 5))[0] > 200
+    assert resized.getpixel((75, 94))[2] > 200
+
+
+@pytest.mark.parametrize(
+    "width,height,expected", [(300, 300, (300, 100)), (600, 50, (150, 50))]
+)
+def test_sut_keeps_ratio_within_box_if_fit_is_contain(width, height, expected):
+    # Arrange
+    sut = resize
+    stream = _stream_of(_panorama(), ImageFormat.PNG)
+
+    # Act
+    resized_stream, _ = sut(stream, ImageFormat.PNG, width, height, None, fit="contain")
+
+    # Assert
+    assert Image.open(resized_stream).size == expected
+
+
+def test_sut_keeps_size_of_original_within_box_if_fit_is_contain():
+    # Arrange
+    sut = resize
+    stream = _stream_of(_panorama(), ImageFormat.PNG)
+
+    # Act
+    resized_stream, _ = sut(stream, ImageFormat.PNG, 2000, 1000, None, fit="contain")
+
+    # Assert
+    assert Image.open(resized_stream).size == (1200, 400)
+
+
+def test_sut_raises_image_validation_error_if_fit_is_not_supported(
+    original_stream, original_format
+):
+    # Arrange
+    sut = resize
+
+    # Act & Assert
+    with pytest.raises(InvalidImageRequestError):
+        sut(original_stream, original_format, 100, 100, None, fit="stretch")
+
+
+def test_sut_rejects_image_over_decoding_budget_before_decoding(monkeypatch):
+    # Arrange
+    sut = resize
+    _limit_decoding_budget(monkeypatch)
+    stream = _stream_of(Image.new("RGB", (4000, 3000), "orange"), ImageFormat.PNG)
+    load_spy = []
+    monkeypatch.setattr(ImageFile.ImageFile, "load", lambda self: load_spy.append(self))
+
+    # Act & Assert
+    with pytest.raises(ImageTooLargeError):
+        sut(stream, ImageFormat.PNG, 100, None, None)
+    assert load_spy == []
+
+
+def test_sut_decodes_jpeg_over_decoding_budget_at_smallest_scale(
+    monkeypatch, large_original_stream
+):
+    # Arrange
+    sut = resize
+    _limit_decoding_budget(monkeypatch)
+    decoded_sizes = _spy_jpeg_draft(monkeypatch)
+
+    # Act
+    resized_stream, _ = sut(large_original_stream, ImageFormat.JPEG, 1000, None, None)
+
+    # Assert
+    # Decoded at 1/4 instead of 1/2 kept by the reducing gap
+    assert decoded_sizes == [(1000, 750)]
+    assert Image.open(resized_stream).size == (1000, 750)
+
+
+def test_sut_rejects_decompression_bomb(monkeypatch, original_stream):
+    # Arrange
+    sut = resize
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+
+    # Act & Assert
+    with pytest.raises(ImageTooLargeError):
+        sut(original_stream, ImageFormat.JPEG, 100, None, None)
+
+
+def _panorama() -> Image.Image:
+    # Red, green and blue thirds from the left
+    image = Image.new("RGB", (1200, 400), "red")
+    image.paste("lime", (400, 0, 800, 400))
+    image.paste("blue", (800, 0, 1200, 400))
+    return image
+
+
+def _rotated_stream_of(fmt: ImageFormat) -> BytesIO:
+    # Stored in 400x300 with red on the left and blue on the right,
+    # and shown in 300x400 with red on the top by EXIF orientation
+    image = Image.new("RGB", (400, 300), "red")
+    image.paste("blue", (200, 0, 400, 300))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    stream = BytesIO()
+    image.save(stream, format=fmt.name, exif=exif.tobytes(), icc_profile=_icc_profile())
+    return stream
+
+
+def _icc_profile() -> bytes:
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+
+
+def _animation_stream_of(
+    fmt: ImageFormat, colors: list[str], durations: list[int], **params
+) -> BytesIO:
+    frames = [Image.new("RGB", (400, 300), color) for color in colors]
+    stream = BytesIO()
+    frames[0].save(
+        stream,
+        format=fmt.name,
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=0,
+        **params,
+    )
+    return stream
+
+
+def _durations_of(image: Image.Image) -> list[int]:
+    durations = []
+    for index in range(image.n_frames):
+        image.seek(index)
+        image.load()
+        durations.append(image.info["duration"])
+    return durations
+
+
+def _spy_png_save(monkeypatch) -> list[dict]:
+    saved_options = []
+    save = Image.Image.save
+
+    def save_spy(self, fp, format=None, **params):
+        saved_options.append(params)
+        return save(self, fp, format, **params)
+
+    monkeypatch.setattr(Image.Image, "save", save_spy)
+    return saved_options
+
+
+def _stream_of(image: Image.Image, fmt: ImageFormat) -> BytesIO:
+    stream = BytesIO()
+    image.save(stream, format=fmt.name)
+    return stream
+
+
+def _limit_decoding_budget(monkeypatch) -> None:
+    # 128 MB * 0.05 is about 6.7 MB, less than 4000x3000 and 2000x1500 in RGB
+    monkeypatch.setattr(config, "MEMORY_SIZE_MB", 128)
+    monkeypatch.setattr(config, "DECODE_MEMORY_FRACTION", 0.05)
+
+
+def _spy_jpeg_draft(monkeypatch) -> list[tuple[int, int]]:
+    decoded_sizes = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+
+    def draft_spy(self, mode, size):
+        original_size = self.size
+        result = draft(self, mode, size)
+        if self.size != original_size:
+            decoded_sizes.append(self.size)
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", draft_spy)
+    return decoded_sizes
+
+
+@pytest.fixture
+def noise_image() -> Image.Image:
+    # Noise is hardly compressed, so the output is large in any format
+    return Image.frombytes("RGB", (800, 600), os.urandom(800 * 600 * 3))
+
+
+@pytest.fixture
+def large_original_stream() -> BytesIO:
+    stream = BytesIO()
+    Image.new("RGB", (4000, 3000), "orange").save(stream, format="JPEG")
+    return stream
+
+
 @pytest.fixture
 def original_stream() -> BytesIO:
     path = "tests/sample_image.jpg"
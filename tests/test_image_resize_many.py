@@ -0,0 +1,182 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, JpegImagePlugin
+
+from image_resizer.image import (
+    ImageFormat,
+    InvalidImageRequestError,
+    resize,
+    resize_many,
+)
+
+SIZES = [(100, None), (200, None), (300, None), (400, None)]
+
+
+def test_sut_resizes_image_to_all_sizes_having_same_length_as_resize(
+    original_stream, original_format
+):
+    # Arrange
+    sut = resize_many
+    expected = []
+    for width, height in SIZES + [(150, 150), (None, 100)]:
+        stream, _ = resize(
+            BytesIO(original_stream.getvalue()), original_format, width, height, None
+        )
+        expected.append(Image.open(stream).size)
+
+    # Act
+    actual = sut(
+        original_stream, original_format, SIZES + [(150, 150), (None, 100)], None
+    )
+
+    # Assert
+    assert [Image.open(stream).size for stream, _ in actual] == expected
+    assert all(fmt is original_format for _, fmt in actual)
+
+
+def test_sut_decodes_image_only_once(original_stream, original_format, monkeypatch):
+    # Arrange
+    sut = resize_many
+    decodes = []
+    load_prepare = JpegImagePlugin.JpegImageFile.load_prepare
+
+    # Pixels are prepared only before decoding
+    def load_prepare_spy(self):
+        decodes.append(self.size)
+        return load_prepare(self)
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "load_prepare", load_prepare_spy)
+
+    # Act
+    sut(original_stream, original_format, SIZES, None)
+
+    # Assert
+    assert len(decodes) == 1
+
+
+def test_sut_decodes_large_jpeg_in_reduced_scale_enough_for_largest_size(
+    large_original_stream, monkeypatch
+):
+    # Arrange
+    sut = resize_many
+    decoded_sizes = _spy_jpeg_draft(monkeypatch)
+
+    # Act
+    actual = sut(large_original_stream, ImageFormat.JPEG, SIZES, None)
+
+    # Assert
+    assert decoded_sizes == [(1000, 750)]
+    assert [Image.open(stream).size for stream, _ in actual] == [
+        (100, 75),
+        (200, 150),
+        (300, 225),
+        (400, 300),
+    ]
+
+
+def test_sut_returns_none_for_size_not_smaller_than_original(original_stream):
+    # Arrange
+    sut = resize_many
+
+    # Act
+    actual = sut(original_stream, ImageFormat.JPEG, [(100, None), (2000, None)], None)
+
+    # Assert
+    assert actual[0] is not None
+    assert actual[1] is None
+    assert original_stream.closed
+
+
+def test_sut_converts_image_in_its_size_for_size_not_smaller_than_original(
+    original_stream,
+):
+    # Arrange
+    sut = resize_many
+
+    # Act
+    actual = sut(
+        original_stream,
+        ImageFormat.JPEG,
+        [(100, None), (2000, None)],
+        None,
+        None,
+        ImageFormat.PNG,
+    )
+
+    # Assert
+    assert [fmt for _, fmt in actual] == [ImageFormat.PNG, ImageFormat.PNG]
+    assert Image.open(actual[1][0]).size == (1028, 1280)
+
+
+def test_sut_raises_image_validation_error_if_any_size_is_invalid(original_stream):
+    # Arrange
+    sut = resize_many
+
+    # Act & Assert
+    with pytest.raises(InvalidImageRequestError):
+        sut(original_stream, ImageFormat.JPEG, [(100, None), (-100, None)], None)
+
+
+def test_sut_resizes_all_frames_of_animation_to_all_sizes():
+    # Arrange
+    sut = resize_many
+    frames = [Image.new("RGB", (400, 300), color) for color in ("red", "blue")]
+    original = BytesIO()
+    frames[0].save(original, format="GIF", save_all=True, append_images=frames[1:])
+
+    # Act
+    actual = sut(original, ImageFormat.GIF, [(100, None), (200, None)], None)
+
+    # Assert
+    resized = [Image.open(stream) for stream, _ in actual]
+    assert [image.size for image in resized] == [(100, 75), (200, 150)]
+    assert [image.n_frames for image in resized] == [2, 2]
+
+
+def test_sut_resizes_image_to_all_sizes_in_exif_orientation():
+    # Arrange
+    sut = resize_many
+    exif = Image.Exif()
+    exif[0x0112] = 8
+    original = BytesIO()
+    Image.new("RGB", (400, 300)).save(original, format="JPEG", exif=exif.tobytes())
+
+    # Act
+    actual = sut(original, ImageFormat.JPEG, [(100, None), (200, None)], None)
+
+    # Assert
+    assert [Image.open(stream).size for stream, _ in actual] == [(100, 133), (200, 267)]
+
+
+def _spy_jpeg_draft(monkeypatch) -> list[tuple[int, int]]:
+    decoded_sizes = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+
+    def draft_spy(self, mode, size):
+        original_size = self.size
+        result = draft(self, mode, size)
+        if self.size != original_size:
+            decoded_sizes.append(self.size)
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", draft_spy)
+    return decoded_sizes
+
+
+@pytest.fixture
+def large_original_stream() -> BytesIO:
+    stream = BytesIO()
+    Image.new("RGB", (4000, 3000), "orange").save(stream, format="JPEG")
+    return stream
+
+
+@pytest.fixture
+def original_stream() -> BytesIO:
+    path = "tests/sample_image.jpg"
+    return BytesIO(open(path, "rb").read())
+
+
+@pytest.fixture
+def original_format() -> ImageFormat:
+    return ImageFormat.JPEG
@@ -0,0 +1,139 @@
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import ClientError
+from PIL import Image
+
+from image_resizer.image import ImageFormat
+from image_resizer.local import LocalClient, MappedStream
+from image_resizer.storage import (
+    ObjectNotFoundError,
+    StorageOperationError,
+    load,
+    load_remaining,
+    probe,
+    save,
+)
+
+
+def test_sut_saves_and_loads_image_with_storage(client):
+    # Arrange
+    sut = client
+    image = _image_bytes("PNG")
+
+    # Act
+    save(sut, "bucket", "path/to/derivative", BytesIO(image), ImageFormat.PNG)
+    stream, fmt = load(sut, "bucket", "path/to/derivative")
+
+    # Assert
+    assert stream.getvalue() == image
+    assert fmt == ImageFormat.PNG
+
+
+def test_sut_probes_and_loads_remaining_with_storage(client):
+    # Arrange
+    sut = client
+    image = _image_bytes("JPEG")
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=image)
+
+    # Act
+    stream, fmt, size, etag = probe(sut, "bucket", "file.jpg", 16)
+    head = stream.getvalue()
+    stream = load_remaining(sut, "bucket", "file.jpg", stream, size, etag)
+
+    # Assert
+    assert head == image[:16]
+    assert size == len(image)
+    assert etag.startswith('"')
+    assert stream.getvalue() == image
+
+
+def test_sut_maps_whole_file_for_pillow_without_copying(client):
+    # Arrange
+    sut = client
+    image = _image_bytes("JPEG")
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=image)
+
+    # Act
+    stream, _, size, etag = probe(sut, "bucket", "file.jpg", 16)
+    stream = load_remaining(sut, "bucket", "file.jpg", stream, size, etag)
+
+    # Assert
+    assert isinstance(stream, MappedStream)
+    assert stream.getbuffer().nbytes == len(image)
+    assert Image.open(stream).size == (40, 30)
+
+
+def test_sut_loads_mapped_file_with_storage(client):
+    # Arrange
+    sut = client
+    image = _image_bytes("PNG")
+    sut.put_object(Bucket="bucket", Key="file.png", Body=image)
+
+    # Act
+    stream, fmt = load(sut, "bucket", "file.png")
+
+    # Assert
+    assert isinstance(stream, MappedStream)
+    assert fmt == ImageFormat.PNG
+    assert stream.read(8) == image[:8]
+    assert stream.seek(0, 2) == len(image)
+    stream.seek(0)
+    assert Image.open(stream).size == (40, 30)
+
+
+def test_sut_raises_not_found_error_with_storage(client):
+    # Arrange
+    sut = client
+
+    # Act & Assert
+    with pytest.raises(ObjectNotFoundError):
+        load(sut, "bucket", "missing.jpg")
+
+
+def test_sut_rejects_remaining_of_updated_object(client):
+    # Arrange
+    sut = client
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=_image_bytes("JPEG"))
+    stream, _, size, etag = probe(sut, "bucket", "file.jpg", 16)
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=_image_bytes("JPEG") + b"\0")
+
+    # Act & Assert
+    with pytest.raises(StorageOperationError):
+        load_remaining(sut, "bucket", "file.jpg", stream, size, etag)
+
+
+def test_sut_rejects_key_outside_root(client):
+    # Arrange
+    sut = client
+
+    # Act & Assert
+    with pytest.raises(ClientError):
+        sut.get_object(Bucket="bucket", Key="../../outside")
+
+
+def test_sut_lists_objects_under_prefix(client):
+    # Arrange
+    sut = client
+    for key in ("a/1.jpg", "a/2.jpg", "b/1.jpg"):
+        sut.put_object(Bucket="bucket", Key=key, Body=b"")
+
+    # Act
+    response = sut.list_objects_v2(Bucket="bucket", Prefix="a/")
+
+    # Assert
+    assert [content["Key"] for content in response["Contents"]] == [
+        "a/1.jpg",
+        "a/2.jpg",
+    ]
+
+
+@pytest.fixture
+def client(tmp_path) -> LocalClient:
+    return LocalClient(tmp_path)
+
+
+def _image_bytes(fmt: str) -> bytes:
+    stream = BytesIO()
+    Image.new("RGB", (40, 30), (255, 0, 0)).save(stream, fmt)
+    return stream.getvalue()
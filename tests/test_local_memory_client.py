@@ -0,0 +1,107 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from image_resizer.image import ImageFormat
+from image_resizer.local import MemoryClient
+from image_resizer.storage import (
+    ObjectNotFoundError,
+    ObjectNotModifiedError,
+    StorageOperationError,
+    load,
+    load_remaining,
+    probe,
+    save,
+)
+
+
+def test_sut_saves_and_loads_image_with_storage(client):
+    # Arrange
+    sut = client
+    image = _image_bytes("PNG")
+
+    # Act
+    save(sut, "bucket", "path/to/derivative", BytesIO(image), ImageFormat.PNG)
+    stream, fmt = load(sut, "bucket", "path/to/derivative")
+
+    # Assert
+    assert stream.getvalue() == image
+    assert fmt == ImageFormat.PNG
+
+
+def test_sut_probes_and_loads_remaining_with_storage(client):
+    # Arrange
+    sut = client
+    image = _image_bytes("JPEG")
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=image)
+
+    # Act
+    stream, fmt, size, etag = probe(sut, "bucket", "file.jpg", 16)
+    head = stream.getvalue()
+    stream = load_remaining(sut, "bucket", "file.jpg", stream, size, etag)
+
+    # Assert
+    assert head == image[:16]
+    assert fmt == ImageFormat.JPEG
+    assert size == len(image)
+    assert stream.getvalue() == image
+
+
+def test_sut_raises_not_modified_error_for_same_etag(client):
+    # Arrange
+    sut = client
+    etag = sut.put_object(Bucket="bucket", Key="file.jpg", Body=_image_bytes("JPEG"))
+
+    # Act & Assert
+    with pytest.raises(ObjectNotModifiedError):
+        load(sut, "bucket", "file.jpg", etag["ETag"])
+
+
+def test_sut_raises_not_found_error_with_storage(client):
+    # Arrange
+    sut = client
+
+    # Act & Assert
+    with pytest.raises(ObjectNotFoundError):
+        load(sut, "bucket", "missing.jpg")
+
+
+def test_sut_rejects_remaining_of_updated_object(client):
+    # Arrange
+    sut = client
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=_image_bytes("JPEG"))
+    stream, _, size, etag = probe(sut, "bucket", "file.jpg", 16)
+    sut.put_object(Bucket="bucket", Key="file.jpg", Body=_image_bytes("JPEG"))
+
+    # Act & Assert
+    with pytest.raises(StorageOperationError):
+        load_remaining(sut, "bucket", "file.jpg", stream, size, etag)
+
+
+def test_sut_lists_objects_under_prefix(client):
+    # Arrange
+    sut = client
+    for key in ("a/2.jpg", "a/1.jpg", "b/1.jpg"):
+        sut.put_object(Bucket="bucket", Key=key, Body=b"")
+    sut.put_object(Bucket="other", Key="a/3.jpg", Body=b"")
+
+    # Act
+    response = sut.list_objects_v2(Bucket="bucket", Prefix="a/")
+
+    # Assert
+    assert [content["Key"] for content in response["Contents"]] == [
+        "a/1.jpg",
+        "a/2.jpg",
+    ]
+
+
+@pytest.fixture
+def client() -> MemoryClient:
+    return MemoryClient()
+
+
+def _image_bytes(fmt: str) -> bytes:
+    stream = BytesIO()
+    Image.new("RGB", (40, 30), (255, 0, 0)).save(stream, fmt)
+    return stream.getvalue()
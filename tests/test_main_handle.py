@@ -0,0 +1,544 @@
+import base64
+import copy
+import json
+import time
+import tracemalloc
+from io import BufferedReader, BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import (
+    ClientError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+from botocore.response import StreamingBody
+from PIL import Image
+
+from image_resizer import config, image, response, storage
+from image_resizer.cache import cache
+from image_resizer.local import MappedStream
+from main import handle
+
+ORIGINAL_KEY = "644b79d146ab870566a66a25/202312291340365002.jpg"
+DERIVATIVE_KEY = (
+    "_derivatives/644b79d146ab870566a66a25/202312291340365002.jpg"
+    "/0563e39bd22f9d669dc54985b8d10b2d/w108_h108_q80"
+)
+
+
+def test_sut_resizes_original_and_stores_derivative_if_derivative_does_not_exist(
+    event, client
+):
+    # Arrange
+    sut = handle
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    client.put_object.assert_called_once()
+    assert client.put_object.call_args.kwargs["Key"] == DERIVATIVE_KEY
+
+
+def test_sut_returns_derivative_without_loading_original_if_derivative_exists(
+    event, client, objects
+):
+    # Arrange
+    sut = handle
+    objects[DERIVATIVE_KEY] = b"resized"
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    assert actual["body"] == "cmVzaXplZA=="
+    requested_keys = [c.kwargs["Key"] for c in client.get_object.call_args_list]
+    assert ORIGINAL_KEY not in requested_keys
+    client.put_object.assert_not_called()
+
+
+def test_sut_does_not_use_derivative_if_original_has_no_etag(event, client):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["response"]["headers"].pop("etag")
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    requested_keys = {c.kwargs["Key"] for c in client.get_object.call_args_list}
+    assert requested_keys == {ORIGINAL_KEY}
+    client.put_object.assert_not_called()
+
+
+def test_sut_returns_original_response_as_is_if_image_is_not_resized(event, client):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["request"]["querystring"] = "w=2000"
+    expected = copy.deepcopy(event["Records"][0]["cf"]["response"])
+    expected["headers"]["etag"] = [
+        {"key": "ETag", "value": '"0563e39bd22f9d669dc54985b8d10b2d-w2000_hauto_q80"'}
+    ]
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual == expected
+    original_requests = [
+        c for c in client.get_object.call_args_list if c.kwargs["Key"] == ORIGINAL_KEY
+    ]
+    assert len(original_requests) == 1
+    assert original_requests[0].kwargs["Range"] == "bytes=0-16383"
+    client.put_object.assert_not_called()
+
+
+def test_sut_loads_rest_of_original_if_image_is_resized(event, client, objects):
+    # Arrange
+    sut = handle
+
+    # Act
+    sut(event, None)
+
+    # Assert
+    ranges = [
+        c.kwargs["Range"]
+        for c in client.get_object.call_args_list
+        if c.kwargs["Key"] == ORIGINAL_KEY
+    ]
+    assert ranges == ["bytes=0-16383", "bytes=16384-"]
+
+
+def test_sut_converts_image_into_format_accepted_by_viewer_if_format_is_auto(
+    event, client
+):
+    # Arrange
+    sut = handle
+    request = event["Records"][0]["cf"]["request"]
+    request["querystring"] = "w=100&fmt=auto"
+    request["headers"]["accept"] = [{"key": "Accept", "value": "image/webp,*/*"}]
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    assert actual["headers"]["content-type"][0]["value"] == "image/webp"
+    assert actual["headers"]["vary"] == [{"key": "Vary", "value": "Accept"}]
+    assert client.put_object.call_args.kwargs["Key"].endswith("_fwebp")
+
+
+def test_sut_returns_original_response_varying_by_accept_if_format_is_auto_and_not_resized(
+    event, client
+):
+    # Arrange
+    sut = handle
+    request = event["Records"][0]["cf"]["request"]
+    request["querystring"] = "w=2000&fmt=auto"
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == "200"
+    assert actual["headers"]["vary"] == [{"key": "Vary", "value": "Accept"}]
+    assert "body" not in actual
+
+
+def test_sut_stores_derivatives_of_all_hint_sizes_if_hint_size_is_requested(
+    event, client
+):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["request"]["querystring"] = "w=200"
+    prefix = DERIVATIVE_KEY.rsplit("/", 1)[0]
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    # Derivatives are stored concurrently in any order
+    stored_keys = sorted(c.kwargs["Key"] for c in client.put_object.call_args_list)
+    assert stored_keys == [f"{prefix}/w{w}_hauto_q80" for w in (100, 200, 300, 400)]
+    stored = {
+        c.kwargs["Key"]: c.kwargs["Body"] for c in client.put_object.call_args_list
+    }
+    assert base64.b64decode(actual["body"]) == stored[f"{prefix}/w200_hauto_q80"]
+
+
+def test_sut_resizes_only_requested_hint_size_if_derivative_store_is_disabled(
+    event, client, monkeypatch
+):
+    # Arrange
+    sut = handle
+    monkeypatch.setattr(config, "DERIVATIVE_ENABLED", False)
+    event["Records"][0]["cf"]["request"]["querystring"] = "w=200"
+    resize_many_spy = MagicMock(side_effect=image.resize_many)
+    monkeypatch.setattr(image, "resize_many", resize_many_spy)
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    resize_many_spy.assert_not_called()
+    client.put_object.assert_not_called()
+
+
+def test_sut_returns_derivative_in_memory_without_loading_from_s3(event, client):
+    # Arrange
+    sut = handle
+    expected = sut(copy.deepcopy(event), None)["body"]
+    client.get_object.reset_mock()
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["body"] == expected
+    client.get_object.assert_not_called()
+
+
+def test_sut_resizes_original_in_memory_without_loading_from_s3(event, client):
+    # Arrange
+    sut = handle
+    sut(copy.deepcopy(event), None)
+    client.get_object.reset_mock()
+    event["Records"][0]["cf"]["request"]["querystring"] = "w=50&h=50"
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    requested_keys = [c.kwargs["Key"] for c in client.get_object.call_args_list]
+    assert ORIGINAL_KEY not in requested_keys
+
+
+def test_sut_keeps_derivative_in_memory_even_if_derivative_store_is_disabled(
+    event, client, monkeypatch
+):
+    # Arrange
+    sut = handle
+    monkeypatch.setattr(config, "DERIVATIVE_ENABLED", False)
+    sut(copy.deepcopy(event), None)
+    client.get_object.reset_mock()
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    client.get_object.assert_not_called()
+    client.put_object.assert_not_called()
+
+
+def test_sut_returns_strong_etag_of_derivative(event, client):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["request"]["querystring"] = "w=100&fmt=webp"
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["headers"]["etag"] == [
+        {
+            "key": "ETag",
+            "value": '"0563e39bd22f9d669dc54985b8d10b2d-w100_hauto_q80_fwebp"',
+        }
+    ]
+
+
+def test_sut_returns_etag_of_derivative_if_original_is_not_modified(event, client):
+    # Arrange
+    sut = handle
+    response = event["Records"][0]["cf"]["response"]
+    response["status"] = "304"
+    response["statusDescription"] = "Not Modified"
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == "304"
+    assert "body" not in actual
+    assert actual["headers"]["etag"] == [
+        {"key": "ETag", "value": '"0563e39bd22f9d669dc54985b8d10b2d-w108_h108_q80"'}
+    ]
+    client.get_object.assert_not_called()
+
+
+def test_sut_restores_etag_of_original_in_revalidation_request(event):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["config"]["eventType"] = "origin-request"
+    request = event["Records"][0]["cf"]["request"]
+    request["headers"]["if-none-match"] = [
+        {
+            "key": "If-None-Match",
+            "value": '"0563e39bd22f9d669dc54985b8d10b2d-w108_h108_q80"',
+        }
+    ]
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["headers"]["if-none-match"] == [
+        {"key": "If-None-Match", "value": '"0563e39bd22f9d669dc54985b8d10b2d"'}
+    ]
+
+
+def test_sut_canonicalizes_query_string_in_viewer_request(event):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["config"]["eventType"] = "viewer-request"
+    request = event["Records"][0]["cf"]["request"]
+    request["querystring"] = "utm_source=x&w=301"
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["querystring"] == "w=400&q=80"
+
+
+def test_sut_passes_original_response_through_if_s3_is_slower_than_deadline(
+    monkeypatch, event, client
+):
+    # Arrange
+    sut = handle
+    monkeypatch.setattr(config, "S3_DEADLINE_MARGIN", 0.0)
+    get_object = client.get_object.side_effect
+    client.get_object.side_effect = lambda **params: (
+        time.sleep(1),
+        get_object(**params),
+    )[1]
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 200
+    expected = copy.deepcopy(event["Records"][0]["cf"]["response"])
+
+    # Act
+    actual = sut(event, context)
+
+    # Assert
+    assert actual["status"] == expected["status"]
+    assert "body" not in actual
+    assert actual["headers"]["cache-control"] == [
+        {"key": "Cache-Control", "value": "max-age=0"},
+    ]
+
+
+def test_sut_logs_timings_and_sizes_of_stages_in_single_line(event, client, capsys):
+    # Arrange
+    sut = handle
+
+    # Act
+    sut(event, None)
+
+    # Assert
+    lines = [
+        json.loads(line)
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith('{"_aws"')
+    ]
+    assert len(lines) == 1
+    for name in ("probe_ms", "load_ms", "decode_ms", "resize_ms", "encode_ms"):
+        assert name in lines[0]
+    assert lines[0]["input_bytes"] == 211321
+    assert lines[0]["input_pixels"] == 1028 * 1280
+    assert lines[0]["cache_hit"] == 0
+    assert lines[0]["status"] == "200"
+
+
+def test_sut_does_not_copy_original_nor_derivative_while_handling(
+    event, client, objects
+):
+    # Arrange
+    sut = handle
+    objects[ORIGINAL_KEY] = _large_jpeg()
+    original_bytes = len(objects[ORIGINAL_KEY])
+
+    # Act
+    tracemalloc.start()
+    try:
+        actual = sut(event, None)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Assert
+    # The original is read once into the stream whose bytes are shared by the cache,
+    # and the pixels are decoded at the smallest scale, so nothing else is as large
+    assert actual["status"] == 200
+    assert peak < 1.5 * original_bytes
+
+
+def test_sut_does_not_share_bytes_of_finalized_stream_with_cache(
+    event, client, monkeypatch
+):
+    # Arrange
+    sut = handle
+    finalize = response.finalize
+    finalized = []
+
+    def finalize_spy(response, stream, *args):
+        finalized.append(stream.getvalue())
+        return finalize(response, stream, *args)
+
+    monkeypatch.setattr(response, "finalize", finalize_spy)
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    # The bytes shared with the cache would be copied again to encode the body
+    assert actual["status"] == 200
+    bucket = client.put_object.call_args.kwargs["Bucket"]
+    cached, _ = cache.get(("derivative", bucket, DERIVATIVE_KEY))
+    assert cached == finalized[0]
+    assert cached is not finalized[0]
+
+
+def test_sut_resizes_original_if_derivative_lookup_fails_on_network(event, client):
+    # Arrange
+    sut = handle
+    get_object = client.get_object.side_effect
+
+    def get_object_failing_on_derivative(**params):
+        if params["Key"] == DERIVATIVE_KEY:
+            raise ReadTimeoutError(endpoint_url="s3")
+        return get_object(**params)
+
+    client.get_object.side_effect = get_object_failing_on_derivative
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    assert actual["body"]
+
+
+def test_sut_returns_resized_image_if_derivative_store_fails_on_network(event, client):
+    # Arrange
+    sut = handle
+    client.put_object.side_effect = EndpointConnectionError(endpoint_url="s3")
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    assert actual["body"]
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [("image/avif,image/webp", "image/webp"), ("image/avif", "image/gif")],
+)
+def test_sut_keeps_animation_of_gif_if_format_is_auto(
+    event, client, objects, accept, expected
+):
+    # Arrange
+    sut = handle
+    request = event["Records"][0]["cf"]["request"]
+    request["uri"] = "/animated.gif"
+    request["querystring"] = "w=50&fmt=auto"
+    request["headers"]["accept"] = [{"key": "Accept", "value": accept}]
+    objects["animated.gif"] = _animated_gif()
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 200
+    assert actual["headers"]["content-type"][0]["value"] == expected
+    resized = Image.open(BytesIO(base64.b64decode(actual["body"])))
+    assert resized.n_frames == 10
+
+
+@pytest.mark.parametrize("query_string", ["w=2000&f=bogus", "w=100&profile=bogus"])
+def test_sut_rejects_unsupported_names_before_reading_storage(
+    event, client, query_string
+):
+    # Arrange
+    sut = handle
+    event["Records"][0]["cf"]["request"]["querystring"] = query_string
+
+    # Act
+    actual = sut(event, None)
+
+    # Assert
+    assert actual["status"] == 400
+    client.get_object.assert_not_called()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    # Cache in module scope is shared by tests like warm invocations
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def event() -> dict:
+    with open("tests/sample_request.json") as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def objects() -> dict[str, bytes]:
+    with open("tests/sample_image.jpg", "rb") as file:
+        return {ORIGINAL_KEY: file.read()}
+
+
+@pytest.fixture
+def client(monkeypatch, objects) -> MagicMock:
+    def get_object(Bucket, Key, Range=None, IfMatch=None):
+        if Key not in objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body, content_range = objects[Key], None
+        if Range is not None:
+            start, end = Range.removeprefix("bytes=").split("-")
+            end = min(int(end), len(body) - 1) if end else len(body) - 1
+            content_range = f"bytes {start}-{end}/{len(body)}"
+            start, end = int(start), end + 1
+        else:
+            start, end = 0, len(body)
+        # Body is streamed over the object without copying it, like from the network
+        return {
+            "ContentType": "image/gif" if Key.endswith(".gif") else "image/jpeg",
+            "ContentRange": content_range,
+            "ETag": '"etag"',
+            "Body": StreamingBody(
+                BufferedReader(MappedStream(body, start, end)), end - start
+            ),
+        }
+
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = get_object
+    monkeypatch.setattr(storage, "get_client", lambda region: client_stub)
+    return client_stub
+
+
+def _large_jpeg() -> bytes:
+    # Noise is hardly compressed, which makes an original of several MB
+    stream = BytesIO()
+    image = Image.effect_noise((2400, 1800), 100).convert("RGB")
+    image.save(stream, format="JPEG", quality=100)
+    return stream.getvalue()
+
+
+def _animated_gif() -> bytes:
+    stream = BytesIO()
+    frames = [Image.new("RGB", (100, 100), (25 * i, 0, 0)) for i in range(10)]
+    frames[0].save(stream, format="GIF", save_all=True, append_images=frames[1:])
+    return stream.getvalue()
@@ -0,0 +1,82 @@
+import json
+import subprocess
+import sys
+
+from PIL import Image
+
+from image_resizer.image import ImageFormat
+
+# Plugins imported by Pillow itself before opening any image
+PRELOADED_PLUGINS = {"BmpImagePlugin", "PpmImagePlugin"}
+SUPPORTED_PLUGINS = {
+    "JpegImagePlugin",
+    "PngImagePlugin",
+    "GifImagePlugin",
+    "WebPImagePlugin",
+    "TiffImagePlugin",
+    "AvifImagePlugin",
+}
+
+
+def test_sut_does_not_import_boto3_and_pillow_on_import():
+    # Arrange
+    code = "import main"
+
+    # Act
+    actual = _imported_modules_after(code)
+
+    # Assert
+    assert not {"boto3", "botocore", "PIL"} & {m.split(".")[0] for m in actual}
+
+
+def test_sut_does_not_import_boto3_and_pillow_on_origin_request_event():
+    # Arrange
+    code = """
+import json
+import main
+with open("tests/sample_request.json") as file:
+    event = json.load(file)
+event["Records"][0]["cf"]["config"]["eventType"] = "origin-request"
+main.handle(event, None)
+"""
+
+    # Act
+    actual = _imported_modules_after(code)
+
+    # Assert
+    assert not {"boto3", "botocore", "PIL"} & {m.split(".")[0] for m in actual}
+
+
+def test_sut_imports_only_plugins_of_supported_formats_on_resizing(tmp_path):
+    # Arrange
+    # Images are created in this process not to let the test code import any plugin
+    for fmt in ImageFormat:
+        Image.new("RGB", (20, 20)).save(tmp_path / fmt.name, format=fmt.name)
+    code = f"""
+from io import BytesIO
+from image_resizer.image import ImageFormat, resize
+for fmt in ImageFormat:
+    with open("{tmp_path}/" + fmt.name, "rb") as file:
+        resize(BytesIO(file.read()), fmt, 10, None, None)
+"""
+
+    # Act
+    actual = _imported_modules_after(code)
+
+    # Assert
+    plugins = {m.split(".")[1] for m in actual if m.endswith("ImagePlugin")}
+    assert plugins <= SUPPORTED_PLUGINS | PRELOADED_PLUGINS
+
+
+def _imported_modules_after(code: str) -> list[str]:
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"{code}\nimport sys, json\nprint(json.dumps(list(sys.modules)))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
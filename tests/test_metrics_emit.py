@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from image_resizer import config, metrics
+
+
+def test_sut_prints_single_line_in_embedded_metric_format(capsys):
+    # Arrange
+    sut = metrics.emit
+    metrics.start("origin-response")
+    with metrics.stage("decode"):
+        pass
+    metrics.put("input_bytes", 1024, "Bytes")
+    metrics.set_property("cache", "derivative_memory")
+
+    # Act
+    sut()
+
+    # Assert
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    line = json.loads(lines[0])
+    declared = line["_aws"]["CloudWatchMetrics"][0]
+    assert declared["Namespace"] == config.METRICS_NAMESPACE
+    assert declared["Dimensions"] == [["event_type"]]
+    assert {"Name": "decode_ms", "Unit": "Milliseconds"} in declared["Metrics"]
+    assert {"Name": "input_bytes", "Unit": "Bytes"} in declared["Metrics"]
+    assert {"Name": "total_ms", "Unit": "Milliseconds"} in declared["Metrics"]
+    assert line["event_type"] == "origin-response"
+    assert line["cache"] == "derivative_memory"
+    assert line["input_bytes"] == 1024
+    assert line["decode_ms"] >= 0
+
+
+def test_sut_sums_time_of_stage_run_several_times(capsys, monkeypatch):
+    # Arrange
+    sut = metrics.emit
+    clock = iter([0.0, 1.0, 2.0, 2.5, 3.0, 4.0])
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: next(clock))
+    metrics.start("origin-response")
+    with metrics.stage("encode"):
+        pass
+    with metrics.stage("encode"):
+        pass
+
+    # Act
+    sut()
+
+    # Assert
+    line = json.loads(capsys.readouterr().out)
+    assert line["encode_ms"] == pytest.approx(1500.0)
+    assert line["total_ms"] == pytest.approx(4000.0)
+
+
+def test_sut_prints_nothing_if_metrics_are_disabled(capsys, monkeypatch):
+    # Arrange
+    sut = metrics.emit
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    metrics.start("origin-response")
+    with metrics.stage("decode"):
+        pass
+    metrics.put("input_bytes", 1024, "Bytes")
+
+    # Act
+    sut()
+
+    # Assert
+    assert capsys.readouterr().out == ""
+
+
+def test_sut_prints_nothing_without_start(capsys):
+    # Arrange
+    sut = metrics.emit
+    metrics.put("input_bytes", 1024, "Bytes")
+
+    # Act
+    sut()
+
+    # Assert
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,132 @@
+import pytest
+
+from image_resizer import config
+from image_resizer.request import canonicalize
+
+
+@pytest.mark.parametrize(
+    "query_string,expected",
+    [
+        ("w=301", "w=400&q=80"),
+        ("w=302&q=80", "w=400&q=80"),
+        ("w=400", "w=400&q=80"),
+        ("w=100&h=50", "w=100&h=50&q=80"),
+        ("w=150&h=75", "w=200&h=100&q=80"),
+        ("h=250", "h=300&q=80"),
+        ("w=2500", "w=2500&q=80"),
+    ],
+)
+def test_sut_snaps_size_to_ladder(query_string, expected):
+    # Arrange
+    sut = canonicalize
+
+    # Act
+    actual = sut({"querystring": query_string})
+
+    # Assert
+    assert actual["querystring"] == expected
+
+
+@pytest.mark.parametrize(
+    "query_string,expected",
+    [
+        ("utm_source=x&w=400&ref=y", "w=400&q=80"),
+        ("fmt=WEBP&q=070&w=0400", "w=400&q=70&fmt=webp"),
+        ("f=Bilinear&profile=FAST&w=400&q=60", "w=400&q=60&profile=fast&f=bilinear"),
+        ("fmt=auto", "q=80&fmt=auto"),
+        ("fit=COVER&h=100&w=100", "w=100&h=100&q=80&fit=cover"),
+        ("fit=fill&h=100&w=100", "w=100&h=100&q=80"),
+        ("fit=cover&w=100", "w=100&q=80"),
+    ],
+)
+def test_sut_removes_unknown_parameters_and_orders_the_others(query_string, expected):
+    # Arrange
+    sut = canonicalize
+
+    # Act
+    actual = sut({"querystring": query_string})
+
+    # Assert
+    assert actual["querystring"] == expected
+
+
+@pytest.mark.parametrize("query_string", ["", "profile=fast", "utm_source=x"])
+def test_sut_does_not_add_default_quality_for_original(query_string):
+    # Arrange
+    sut = canonicalize
+
+    # Act
+    actual = sut({"querystring": query_string})
+
+    # Assert
+    assert "q=" not in actual["querystring"]
+
+
+@pytest.mark.parametrize(
+    "query_string", ["w=abc&q=80", "w=-100&q=80", "w=0&q=80", "w=400&q=high"]
+)
+def test_sut_keeps_invalid_values_to_be_rejected_by_parse(query_string):
+    # Arrange
+    sut = canonicalize
+
+    # Act
+    actual = sut({"querystring": query_string})
+
+    # Assert
+    assert actual["querystring"] == query_string
+
+
+@pytest.mark.parametrize(
+    "query_string,expected",
+    [
+        ("w=1999&h=4999", "w=1999&h=4999&q=80"),
+        ("w=101&h=2600", "w=101&h=2600&q=80"),
+        ("w=101&h=2400", "w=200&h=4753&q=80"),
+    ],
+)
+def test_sut_keeps_size_if_snapped_height_is_longer_than_limit(query_string, expected):
+    # Arrange
+    sut = canonicalize
+
+    # Act
+    actual = sut({"querystring": query_string})
+
+    # Assert
+    assert actual["querystring"] == expected
+
+
+def test_sut_keeps_size_if_snapped_width_is_longer_than_limit(monkeypatch):
+    # Arrange
+    sut = canonicalize
+    monkeypatch.setattr(config, "SIZE_LADDER", (1000, 2400))
+
+    # Act
+    actual = sut({"querystring": "w=1999"})
+
+    # Assert
+    assert actual["querystring"] == "w=1999&q=80"
+
+
+def test_sut_does_not_snap_size_if_ladder_is_empty(monkeypatch):
+    # Arrange
+    sut = canonicalize
+    monkeypatch.setattr(config, "SIZE_LADDER", ())
+
+    # Act
+    actual = sut({"querystring": "w=301"})
+
+    # Assert
+    assert actual["querystring"] == "w=301&q=80"
+
+
+def test_sut_returns_same_query_if_canonicalized_again():
+    # Arrange
+    sut = canonicalize
+    request = sut({"querystring": "h=75&x=1&w=150&fmt=WEBP"})
+    expected = request["querystring"]
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual["querystring"] == expected
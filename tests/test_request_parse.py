@@ -1,6 +1,6 @@
 import pytest
 
-from image_resizer.request import parse
+from image_resizer.request import InvalidRequestError, parse
 
 
 @pytest.mark.parametrize(
@@ -142,6 +142,19 @@ def test_sut_parses_quality_correctly():
     assert actual == 70
 
 
+@pytest.mark.parametrize("query_string", ["w=100&f=bogus", "w=100&profile=bogus"])
+def test_sut_raises_invalid_request_error_if_name_is_unsupported(query_string):
+    # Arrange
+    sut = parse
+    request = _request(
+        "/path/to/file", query_string, "hello.s3.ap-northeast-2.amazonaws.com"
+    )
+
+    # Act & Assert
+    with pytest.raises(InvalidRequestError):
+        sut(request)
+
+
 def _request(uri: str, query_string: str, origin: str) -> dict:
     assert uri.startswith("/")
     return {
@@ -0,0 +1,44 @@
+import pytest
+
+from image_resizer.request import parse_accept
+
+
+def test_sut_parses_media_types_from_accept_header():
+    # Arrange
+    sut = parse_accept
+    request = _request("image/avif,image/webp,image/apng,image/*,*/*;q=0.8")
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual == ["image/avif", "image/webp", "image/apng", "image/*", "*/*"]
+
+
+@pytest.mark.parametrize("value", ["image/webp;q=0", "image/webp; q=0.0"])
+def test_sut_ignores_media_types_not_acceptable(value):
+    # Arrange
+    sut = parse_accept
+    request = _request(f"image/jpeg,{value}")
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual == ["image/jpeg"]
+
+
+def test_sut_parses_empty_list_if_accept_header_is_not_given():
+    # Arrange
+    sut = parse_accept
+    request = {"headers": {}}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual == []
+
+
+def _request(accept: str) -> dict:
+    return {"headers": {"accept": [{"key": "Accept", "value": accept}]}}
@@ -0,0 +1,40 @@
+import pytest
+
+from image_resizer.request import parse_filter, parse_fit, parse_format, parse_profile
+
+
+@pytest.mark.parametrize(
+    "sut,query_string,expected",
+    [
+        (parse_format, "w=100&fmt=auto", "auto"),
+        (parse_format, "fmt=WEBP", "webp"),
+        (parse_profile, "w=100&profile=fast", "fast"),
+        (parse_profile, "profile=SMALL", "small"),
+        (parse_filter, "w=100&f=bilinear", "bilinear"),
+        (parse_filter, "f=Nearest", "nearest"),
+        (parse_fit, "w=100&h=100&fit=cover", "cover"),
+        (parse_fit, "fit=Contain", "contain"),
+    ],
+)
+def test_sut_parses_name_from_query_string_in_lower_case(sut, query_string, expected):
+    # Arrange
+    request = {"querystring": query_string}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual == expected
+
+
+@pytest.mark.parametrize("sut", [parse_format, parse_profile, parse_filter, parse_fit])
+@pytest.mark.parametrize("query_string", ["w=100", "w=100&fmt=&profile=&f=&fit="])
+def test_sut_returns_none_if_name_is_not_given(sut, query_string):
+    # Arrange
+    request = {"querystring": query_string}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual is None
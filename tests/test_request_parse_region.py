@@ -0,0 +1,36 @@
+import pytest
+
+from image_resizer.request import parse_region
+
+
+@pytest.mark.parametrize(
+    "origin,expected",
+    [
+        ("hello.s3.ap-northeast-2.amazonaws.com", "ap-northeast-2"),
+        ("hi-there.s3.us-east-1.amazonaws.com", "us-east-1"),
+        ("hp.s3.hp.s3.eu-west-3.amazonaws.com", "eu-west-3"),
+    ],
+)
+def test_sut_parses_region_from_origin_domain_correctly(origin, expected):
+    # Arrange
+    sut = parse_region
+    request = {"origin": {"s3": {"domainName": origin}}}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual == expected
+
+
+@pytest.mark.parametrize("origin", ["hello.s3.amazonaws.com", "example.com"])
+def test_sut_parses_region_as_none_if_origin_domain_has_no_region(origin):
+    # Arrange
+    sut = parse_region
+    request = {"origin": {"s3": {"domainName": origin}}}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual is None
@@ -0,0 +1,41 @@
+import pytest
+
+from image_resizer.request import restore_original_etag
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ('"0563e39b-w100_hauto_q80"', '"0563e39b"'),
+        ('"0563e39b-wauto_h90_q70_fwebp"', '"0563e39b"'),
+        ('"0563e39b-w100_hauto_q80_fwebp_pfast"', '"0563e39b"'),
+        ('"0563e39b-w100_h100_q80_rbilinear"', '"0563e39b"'),
+        ('"0563e39b-w100_h100_q80_fwebp_mcover"', '"0563e39b"'),
+        # ETag of multipart upload has its own suffix
+        ('"0563e39b-3-w100_h100_q80"', '"0563e39b-3"'),
+        ('"0563e39b-3"', '"0563e39b-3"'),
+        ('"a-w100_hauto_q80", "b-w200_hauto_q80"', '"a", "b"'),
+    ],
+)
+def test_sut_restores_etag_of_original_from_etag_of_derivative(value, expected):
+    # Arrange
+    sut = restore_original_etag
+    request = {"headers": {"if-none-match": [{"key": "If-None-Match", "value": value}]}}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual["headers"]["if-none-match"][0]["value"] == expected
+
+
+def test_sut_does_nothing_if_request_is_not_conditional():
+    # Arrange
+    sut = restore_original_etag
+    request = {"headers": {}}
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual == {"headers": {}}
@@ -71,6 +71,23 @@ def test_sut_removes_height_from_query_string_if_resizing_hint_is_given(query_st
     assert "h=" not in actual
 
 
+def test_sut_canonicalizes_query_string_if_resizing_hint_is_given():
+    # Arrange
+    sut = take_resizing_hint
+    request = _request(
+        "/path/to/file_m.png",
+        "utm_source=x&fmt=WEBP&h=90",
+        "hello.s3.ap-northeast-2.amazonaws.com",
+    )
+
+    # Act
+    updated_request = sut(request)
+
+    # Assert
+    actual = updated_request["querystring"]
+    assert actual == "w=300&q=80&fmt=webp"
+
+
 def test_sut_does_not_change_anything_if_resizing_hint_is_not_found():
     # Arrange
     sut = take_resizing_hint
@@ -88,6 +105,19 @@ def test_sut_does_not_change_anything_if_resizing_hint_is_not_found():
     assert actual == expected
 
 
+@pytest.mark.parametrize("uri", ["/path/to/file_t", "/file"])
+def test_sut_does_not_change_uri_without_extension(uri):
+    # Arrange
+    sut = take_resizing_hint
+    request = _request(uri, "w=100", "hello.s3.ap-northeast-2.amazonaws.com")
+
+    # Act
+    actual = sut(request)
+
+    # Assert
+    assert actual["uri"] == uri
+
+
 def _request(uri: str, query_string: str, origin: str) -> dict:
     assert uri.startswith("/")
     return {
@@ -0,0 +1,28 @@
+import json
+
+from image_resizer.response import HEADERS_MARGIN_BYTES, MAX_RESPONSE_BYTES, body_budget
+
+
+def test_sut_leaves_room_for_base64_inflation_and_headers():
+    # Arrange
+    sut = body_budget
+    response = {"headers": {"etag": [{"key": "ETag", "value": '"etag"'}]}}
+    headers_bytes = len(json.dumps(response["headers"])) + HEADERS_MARGIN_BYTES
+
+    # Act
+    actual = sut(response)
+
+    # Assert
+    assert actual * 4 / 3 + headers_bytes <= MAX_RESPONSE_BYTES
+
+
+def test_sut_returns_smaller_budget_if_headers_are_larger():
+    # Arrange
+    sut = body_budget
+    response = {"headers": {"x-large": [{"key": "X-Large", "value": "x" * 1000}]}}
+
+    # Act
+    actual = sut(response)
+
+    # Assert
+    assert actual < sut({"headers": {}})
@@ -1,15 +1,19 @@
 import copy
+import os
+import tracemalloc
 from io import BytesIO
 
 import pytest
 
 from image_resizer.image import (
     ImageFormat,
+    ImageTooLargeError,
     InvalidImageRequestError,
+    OutputTooLargeError,
     UnsupportedImageFormatError,
 )
 from image_resizer.response import finalize
-from image_resizer.storage import ObjectNotFoundError
+from image_resizer.storage import DeadlineExceededError, ObjectNotFoundError
 
 
 def test_sut_updates_simple_properties_if_successful_correctly(response):
@@ -41,6 +45,29 @@ def test_sut_updates_image_related_properties_if_successful_correctly(response):
     ]
 
 
+def test_sut_encodes_body_without_copying_stream(response):
+    # Arrange
+    sut = finalize
+    body = os.urandom(3 * 1024 * 1024)
+    stream = BytesIO()
+    # Written in chunks like encoders do
+    for offset in range(0, len(body), 65536):
+        stream.write(body[offset : offset + 65536])
+
+    # Act
+    tracemalloc.start()
+    try:
+        actual = sut(response, stream, ImageFormat.JPEG)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Assert
+    # Base64 in bytes and str are 4/3 of body each, and nothing else should be as large
+    assert actual["body"] is not None
+    assert peak < 3 * len(body)
+
+
 def test_sut_updates_cache_control_header_if_successful(response):
     # Arrange
     sut = finalize
@@ -54,6 +81,52 @@ def test_sut_updates_cache_control_header_if_successful(response):
     ]
 
 
+def test_sut_updates_vary_header_if_successful_with_vary(response):
+    # Arrange
+    sut = finalize
+
+    # Act
+    actual = sut(response, BytesIO(), ImageFormat.WEBP, None, "Accept")
+
+    # Assert
+    assert actual["headers"]["vary"] == [{"key": "Vary", "value": "Accept"}]
+
+
+def test_sut_replaces_etag_header_if_successful_with_etag(response):
+    # Arrange
+    sut = finalize
+    response["headers"]["etag"] = [{"key": "ETag", "value": '"original"'}]
+
+    # Act
+    actual = sut(response, BytesIO(), ImageFormat.WEBP, None, None, '"derivative"')
+
+    # Assert
+    assert actual["headers"]["etag"] == [{"key": "ETag", "value": '"derivative"'}]
+
+
+def test_sut_appends_vary_header_to_existing_one_if_successful_with_vary(response):
+    # Arrange
+    sut = finalize
+    response["headers"]["vary"] = [{"key": "Vary", "value": "Origin"}]
+
+    # Act
+    actual = sut(response, BytesIO(), ImageFormat.WEBP, None, "Accept")
+
+    # Assert
+    assert actual["headers"]["vary"] == [{"key": "Vary", "value": "Origin, Accept"}]
+
+
+def test_sut_does_not_update_vary_header_if_successful_without_vary(response):
+    # Arrange
+    sut = finalize
+
+    # Act
+    actual = sut(response, BytesIO(), ImageFormat.JPEG)
+
+    # Assert
+    assert "vary" not in actual["headers"]
+
+
 def test_sut_closes_stream_if_successful(response):
     # Arrange
     sut = finalize
@@ -99,6 +172,35 @@ def test_sut_updates_response_if_object_not_found_correctly(response):
     assert actual["status"] == 404
 
 
+def test_sut_updates_response_if_image_too_large_to_decode(response):
+    # Arrange
+    sut = finalize
+    stream = BytesIO()
+
+    # Act
+    actual = sut(response, stream, None, ImageTooLargeError("too large"))
+
+    # Assert
+    assert actual["status"] == 422
+    assert stream.closed
+
+
+def test_sut_passes_original_through_without_caching_if_deadline_exceeded(response):
+    # Arrange
+    sut = finalize
+    status = response["status"]
+
+    # Act
+    actual = sut(response, BytesIO(), None, DeadlineExceededError("too slow"))
+
+    # Assert
+    assert actual["status"] == status
+    assert actual["body"] is None
+    assert actual["headers"]["cache-control"] == [
+        {"key": "Cache-Control", "value": "max-age=0"},
+    ]
+
+
 def test_sut_closes_stream_if_file_not_found(response):
     # Arrange
     sut = finalize
@@ -134,7 +236,13 @@ def test_sut_closes_stream_if_unexpected_error_occurred(response):
     assert stream.closed
 
 
-def test_sut_returns_original_response_if_listed_pass_through_errors_occurred(response):
+@pytest.mark.parametrize(
+    "exception",
+    [UnsupportedImageFormatError("unsupported"), OutputTooLargeError("too large")],
+)
+def test_sut_returns_original_response_if_listed_pass_through_errors_occurred(
+    response, exception
+):
     # Arrange
     sut = finalize
     expected = copy.deepcopy(response)
@@ -144,7 +252,7 @@ def test_sut_returns_original_response_if_listed_pass_through_errors_occurred(re
         response,
         BytesIO(),
         ImageFormat.JPEG,
-        UnsupportedImageFormatError("unsupported"),
+        exception,
     )
 
     # Assert
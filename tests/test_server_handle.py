@@ -0,0 +1,114 @@
+from http import HTTPStatus
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from image_resizer.local import LocalClient
+from image_resizer.server import handle
+
+
+def test_sut_resizes_original_by_query_string(client, original):
+    # Arrange
+    sut = handle
+    request = _request_of("/images/a.jpg", "w=100")
+
+    # Act
+    actual = sut(client, "bucket", request)
+
+    # Assert
+    assert actual.status == HTTPStatus.OK
+    assert actual.headers["Content-Type"] == "image/jpeg"
+    assert Image.open(BytesIO(actual.body)).size == (100, 75)
+
+
+def test_sut_resizes_original_by_resizing_hint(client, original):
+    # Arrange
+    sut = handle
+    request = _request_of("/images/a_s.jpg", "")
+
+    # Act
+    actual = sut(client, "bucket", request)
+
+    # Assert
+    assert Image.open(BytesIO(actual.body)).size == (200, 150)
+
+
+def test_sut_returns_original_as_is_if_it_is_not_resized(client, original):
+    # Arrange
+    sut = handle
+    request = _request_of("/images/a.jpg", "w=1000")
+
+    # Act
+    actual = sut(client, "bucket", request)
+
+    # Assert
+    assert actual.status == HTTPStatus.OK
+    assert bytes(actual.body) == original
+
+
+def test_sut_returns_not_modified_for_etag_of_derivative(client, original):
+    # Arrange
+    sut = handle
+    etag = sut(client, "bucket", _request_of("/images/a.jpg", "w=100")).headers["ETag"]
+    request = _request_of("/images/a.jpg", "w=100", {"If-None-Match": etag})
+
+    # Act
+    actual = sut(client, "bucket", request)
+
+    # Assert
+    assert actual.status == HTTPStatus.NOT_MODIFIED
+    assert actual.headers["ETag"] == etag
+    assert not actual.body
+
+
+@pytest.mark.parametrize(
+    "uri,query_string,expected",
+    [
+        ("/images/none.jpg", "w=100", HTTPStatus.NOT_FOUND),
+        ("/images/a.jpg", "w=abc", HTTPStatus.BAD_REQUEST),
+        ("/images/a.jpg", "w=-100", HTTPStatus.BAD_REQUEST),
+        ("/images/a.jpg", "w=100&fmt=bmp", HTTPStatus.BAD_REQUEST),
+        ("/images/a.jpg", "w=1000&f=bogus", HTTPStatus.BAD_REQUEST),
+        ("/noext", "w=100", HTTPStatus.NOT_FOUND),
+        ("/images/a_t", "", HTTPStatus.NOT_FOUND),
+    ],
+)
+def test_sut_returns_error_status_for_invalid_request(
+    client, original, uri, query_string, expected
+):
+    # Arrange
+    sut = handle
+    request = _request_of(uri, query_string)
+
+    # Act
+    actual = sut(client, "bucket", request)
+
+    # Assert
+    assert actual.status == expected
+
+
+@pytest.fixture
+def client(tmp_path: Path) -> LocalClient:
+    return LocalClient(tmp_path / "root")
+
+
+@pytest.fixture
+def original(client: LocalClient) -> bytes:
+    stream = BytesIO()
+    Image.new("RGB", (400, 300), (255, 0, 0)).save(stream, "JPEG")
+    client.put_object(Bucket="bucket", Key="images/a.jpg", Body=stream.getvalue())
+    return stream.getvalue()
+
+
+def _request_of(uri: str, query_string: str, headers: dict | None = None) -> dict:
+    return {
+        "uri": uri,
+        "querystring": query_string,
+        "headers": {
+            name.lower(): [{"key": name, "value": value}]
+            for name, value in (headers or {}).items()
+        },
+        "origin": {"s3": {"domainName": "bucket"}},
+    }
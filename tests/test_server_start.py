@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from image_resizer.local import LocalClient
+from image_resizer.server import start
+
+
+def test_sut_serves_resized_images_over_keep_alive_connection(client):
+    # Arrange
+    sut = start
+
+    # Act
+    actual = asyncio.run(
+        _request_all(
+            sut, client, ["/a.png?w=100", "/a.png?w=200&fmt=webp", "/none.png?w=100"]
+        )
+    )
+
+    # Assert
+    assert [status for status, _, _ in actual] == [200, 200, 404]
+    assert Image.open(BytesIO(actual[0][2])).size == (100, 75)
+    assert actual[1][1]["Content-Type"] == "image/webp"
+    assert Image.open(BytesIO(actual[1][2])).size == (200, 150)
+
+
+def test_sut_rejects_method_other_than_get_and_head(client):
+    # Arrange
+    sut = start
+
+    # Act
+    actual = asyncio.run(_request_all(sut, client, ["/a.png?w=100"], method="POST"))
+
+    # Assert
+    assert actual[0][0] == 405
+
+
+async def _request_all(
+    sut, client: LocalClient, targets: list[str], method: str = "GET"
+) -> list[tuple[int, dict, bytes]]:
+    with ThreadPoolExecutor(2) as executor:
+        server = await sut(client, "bucket", executor, "127.0.0.1", 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = []
+            for target in targets:
+                writer.write(f"{method} {target} HTTP/1.1\r\nHost: a\r\n\r\n".encode())
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = dict(line.split(": ", 1) for line in lines[1:] if line)
+                body = await reader.readexactly(int(headers["Content-Length"]))
+                responses.append((int(lines[0].split(" ")[1]), headers, body))
+            writer.close()
+            return responses
+
+
+@pytest.fixture
+def client(tmp_path: Path) -> LocalClient:
+    client = LocalClient(tmp_path / "root")
+    stream = BytesIO()
+    Image.new("RGB", (400, 300), (255, 0, 0)).save(stream, "PNG")
+    client.put_object(Bucket="bucket", Key="a.png", Body=stream.getvalue())
+    return client
@@ -0,0 +1,129 @@
+from io import BytesIO
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from image_resizer import storage
+from image_resizer.image import ImageFormat
+from image_resizer.local import LocalClient, MemoryClient
+from image_resizer.storage import get_client, load, use_client
+
+
+def test_sut_returns_same_client_for_same_region():
+    # Arrange
+    sut = get_client
+
+    # Act
+    actual = sut("ap-northeast-2")
+
+    # Assert
+    assert actual is sut("ap-northeast-2")
+
+
+def test_sut_returns_different_client_for_different_region():
+    # Arrange
+    sut = get_client
+
+    # Act
+    actual = sut("ap-northeast-2")
+
+    # Assert
+    assert actual is not sut("us-east-1")
+    assert actual.meta.region_name == "ap-northeast-2"
+
+
+def test_sut_returns_client_having_tuned_config():
+    # Arrange
+    sut = get_client
+
+    # Act
+    actual = sut("ap-northeast-2")
+
+    # Assert
+    assert actual.meta.config.tcp_keepalive is True
+    assert actual.meta.config.connect_timeout == storage.config.S3_CONNECT_TIMEOUT
+    assert actual.meta.config.read_timeout == storage.config.S3_READ_TIMEOUT
+    assert (
+        actual.meta.config.max_pool_connections
+        == storage.config.S3_MAX_POOL_CONNECTIONS
+    )
+
+
+def test_sut_returns_client_reused_by_load_across_invocations():
+    # Arrange
+    sut = get_client
+    client = sut("ap-northeast-2")
+
+    # Act
+    with Stubber(client) as stubber:
+        for _ in range(2):
+            stubber.add_response(
+                "get_object",
+                {
+                    "ContentType": "image/png",
+                    "Body": StreamingBody(BytesIO(b"image"), len(b"image")),
+                },
+                {"Bucket": "bucket", "Key": "path/to/file"},
+            )
+        for _ in range(2):
+            _, fmt = load(sut("ap-northeast-2"), "bucket", "path/to/file")
+
+        # Assert
+        stubber.assert_no_pending_responses()
+        assert fmt == ImageFormat.PNG
+
+
+@pytest.mark.parametrize(
+    "backend,expected", [("local", LocalClient), ("memory", MemoryClient)]
+)
+def test_sut_returns_client_of_configured_backend_for_all_regions(
+    monkeypatch, tmp_path, backend, expected
+):
+    # Arrange
+    sut = get_client
+    monkeypatch.setattr(storage.config, "STORAGE_BACKEND", backend)
+    monkeypatch.setattr(storage.config, "STORAGE_LOCAL_ROOT", str(tmp_path))
+
+    # Act
+    actual = sut("ap-northeast-2")
+
+    # Assert
+    assert isinstance(actual, expected)
+    assert actual is sut("us-east-1")
+
+
+def test_sut_raises_value_error_for_unknown_backend(monkeypatch):
+    # Arrange
+    sut = get_client
+    monkeypatch.setattr(storage.config, "STORAGE_BACKEND", "ftp")
+
+    # Act & Assert
+    with pytest.raises(ValueError):
+        sut("ap-northeast-2")
+
+
+def test_sut_returns_used_client_for_all_regions(monkeypatch):
+    # Arrange
+    sut = get_client
+    monkeypatch.setattr(storage.config, "STORAGE_BACKEND", "local")
+    client = MemoryClient()
+    use_client(client)
+
+    # Act
+    actual = sut("ap-northeast-2")
+
+    # Assert
+    assert actual is client
+    assert actual is sut("us-east-1")
+
+
+@pytest.fixture(autouse=True)
+def clients(monkeypatch) -> dict:
+    # Isolate the registry in module scope from other tests
+    clients = {}
+    monkeypatch.setattr(storage, "_clients", clients)
+    monkeypatch.setattr(storage, "_used_client", None)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    return clients
@@ -1,3 +1,6 @@
+import threading
+import time
+from collections import deque
 from io import BytesIO
 from unittest.mock import MagicMock
 
@@ -7,8 +10,15 @@ from PIL import Image
 from botocore.exceptions import ClientError
 from botocore.response import StreamingBody
 
+from image_resizer import config, storage
 from image_resizer.image import ImageFormat, UnsupportedImageFormatError
-from image_resizer.storage import load, ObjectNotFoundError, StorageOperationError
+from image_resizer.storage import (
+    load,
+    DeadlineExceededError,
+    ObjectNotFoundError,
+    ObjectNotModifiedError,
+    StorageOperationError,
+)
 
 
 def test_sut_send_command_to_client_correctly():
@@ -26,6 +36,34 @@ def test_sut_send_command_to_client_correctly():
     client_spy.get_object.assert_called_once_with(Bucket=bucket, Key=path)
 
 
+def test_sut_sends_conditional_command_to_client_if_etag_is_given():
+    # Arrange
+    sut = load
+    client_spy = MagicMock()
+    client_spy.get_object.return_value = _client_normal_response("image/png", b"")
+
+    # Act
+    sut(client_spy, "bucket", "path/to/file", '"etag"')
+
+    # Assert
+    client_spy.get_object.assert_called_once_with(
+        Bucket="bucket", Key="path/to/file", IfNoneMatch='"etag"'
+    )
+
+
+def test_sut_raises_object_not_modified_error_if_object_is_not_modified():
+    # Arrange
+    sut = load
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ClientError(
+        {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"
+    )
+
+    # Act & Assert
+    with pytest.raises(ObjectNotModifiedError):
+        sut(client_stub, "bucket", "path/to/file", '"etag"')
+
+
 def test_sut_raises_object_not_found_error_if_the_requested_path_does_not_exist():
     # Arrange
     sut = load
@@ -92,6 +130,89 @@ def test_sut_raises_unsupported_image_format_error_if_image_format_is_unsupporte
         sut(client_stub, bucket, path)
 
 
+def test_sut_hedges_slow_read_and_closes_body_of_loser(hedging):
+    # Arrange
+    sut = load
+    client_stub = _SlowClient([1.0, 0.0])
+
+    # Act
+    started_at = time.monotonic()
+    stream, _ = sut(client_stub, "bucket", "path", deadline=time.monotonic() + 5)
+    elapsed = time.monotonic() - started_at
+
+    # Assert
+    assert stream.getvalue() == b"1"
+    assert elapsed < 0.5
+    assert client_stub.bodies[0].closed_event.wait(2)
+    assert not client_stub.bodies[1].closed
+
+
+def test_sut_does_not_hedge_read_responding_in_time(hedging):
+    # Arrange
+    sut = load
+    client_stub = _SlowClient([0.0])
+
+    # Act
+    stream, _ = sut(client_stub, "bucket", "path", deadline=time.monotonic() + 5)
+
+    # Assert
+    assert stream.getvalue() == b"0"
+    assert client_stub.calls == 1
+
+
+def test_sut_raises_deadline_exceeded_error_if_no_response_by_deadline(hedging):
+    # Arrange
+    sut = load
+    client_stub = _SlowClient([1.0, 1.0])
+
+    # Act & Assert
+    started_at = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        sut(client_stub, "bucket", "path", deadline=time.monotonic() + 0.2)
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_sut_raises_error_of_client_without_waiting_for_deadline(hedging):
+    # Arrange
+    sut = load
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = _client_no_suck_key_error_response("path")
+
+    # Act & Assert
+    with pytest.raises(ObjectNotFoundError):
+        sut(client_stub, "bucket", "path", deadline=time.monotonic() + 5)
+    client_stub.get_object.assert_called_once()
+
+
+def test_sut_raises_error_of_client_without_waiting_for_hedged_read(hedging):
+    # Arrange
+    sut = load
+    client_stub = _SlowClient(
+        [0.2, 1.0], [_client_no_suck_key_error_response("path"), None]
+    )
+
+    # Act & Assert
+    started_at = time.monotonic()
+    with pytest.raises(ObjectNotFoundError):
+        sut(client_stub, "bucket", "path", deadline=time.monotonic() + 5)
+    assert time.monotonic() - started_at < 0.5
+    assert client_stub.calls == 2
+
+
+def test_sut_hedges_read_at_highest_percentile(hedging, monkeypatch):
+    # Arrange
+    sut = load
+    monkeypatch.setattr(config, "S3_HEDGE_PERCENTILE", 100)
+    storage._latencies.extend([0.01] * storage.HEDGE_MIN_SAMPLES)
+    client_stub = _SlowClient([0.0])
+
+    # Act
+    stream, _ = sut(client_stub, "bucket", "path", deadline=time.monotonic() + 5)
+
+    # Assert
+    assert stream.getvalue() == b"0"
+
+
 @pytest.mark.skip(reason="DoC test with real AWS identity and S3")
 def test_sut_returns_io_stream_correctly():
     # Arrange
@@ -127,3 +248,47 @@ def _client_normal_response(content_type: str, raw_stream: bytes) -> dict:
         "ContentType": content_type,
         "Body": StreamingBody(BytesIO(raw_stream), len(raw_stream)),
     }
+
+
+class _ClosableBody(StreamingBody):
+    def __init__(self, data: bytes):
+        super().__init__(BytesIO(data), len(data))
+        self.closed_event = threading.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self.closed_event.is_set()
+
+    def close(self):
+        self.closed_event.set()
+        super().close()
+
+
+class _SlowClient:
+    # Responds to each call after its latency in seconds, with the index of the call
+    # or the error of the call if given
+    def __init__(self, latencies: list[float], errors: list | None = None):
+        self.latencies = latencies
+        self.errors = errors or [None] * len(latencies)
+        self.bodies = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_object(self, **params) -> dict:
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+            body = _ClosableBody(str(index).encode())
+            self.bodies.append(body)
+        time.sleep(self.latencies[index])
+        if self.errors[index] is not None:
+            raise self.errors[index]
+        return {"ContentType": "image/png", "Body": body}
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    # Hedged after 50 ms, without the latencies observed by the other tests
+    monkeypatch.setattr(config, "S3_HEDGE_INITIAL_DELAY", 0.05)
+    monkeypatch.setattr(config, "S3_HEDGE_PERCENTILE", 95)
+    monkeypatch.setattr(storage, "_latencies", deque(maxlen=storage.HEDGE_SAMPLES))
@@ -0,0 +1,111 @@
+import os
+import tracemalloc
+from io import BytesIO, RawIOBase
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from image_resizer.storage import StorageOperationError, load_remaining
+
+
+def test_sut_sends_ranged_command_from_end_of_stream_with_etag():
+    # Arrange
+    sut = load_remaining
+    client_spy = MagicMock()
+    client_spy.get_object.return_value = _client_normal_response(b"tail")
+
+    # Act
+    sut(client_spy, "bucket", "path/to/file", BytesIO(b"head"), 8, '"etag"')
+
+    # Assert
+    client_spy.get_object.assert_called_once_with(
+        Bucket="bucket", Key="path/to/file", Range="bytes=4-", IfMatch='"etag"'
+    )
+
+
+def test_sut_returns_stream_having_whole_object_from_beginning():
+    # Arrange
+    sut = load_remaining
+    client_stub = MagicMock()
+    client_stub.get_object.return_value = _client_normal_response(b"tail")
+
+    # Act
+    actual = sut(client_stub, "bucket", "path/to/file", BytesIO(b"head"), 8, "etag")
+
+    # Assert
+    assert actual.tell() == 0
+    assert actual.getvalue() == b"headtail"
+
+
+def test_sut_reads_rest_of_object_without_copying_it():
+    # Arrange
+    sut = load_remaining
+    body = os.urandom(3 * 1024 * 1024)
+    client_stub = MagicMock()
+    rest = _SocketLikeStream(body[16384:])
+    client_stub.get_object.return_value = {"Body": StreamingBody(rest, len(rest))}
+    stream = BytesIO(body[:16384])
+
+    # Act
+    tracemalloc.start()
+    try:
+        actual = sut(client_stub, "bucket", "path/to/file", stream, len(body), "etag")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Assert
+    # Only the buffer of the whole object should be allocated
+    assert actual.getvalue() == body
+    assert peak < 1.1 * len(body)
+
+
+def test_sut_does_not_send_command_if_stream_has_whole_object_already():
+    # Arrange
+    sut = load_remaining
+    client_spy = MagicMock()
+
+    # Act
+    actual = sut(client_spy, "bucket", "path/to/file", BytesIO(b"head"), 4, "etag")
+
+    # Assert
+    client_spy.get_object.assert_not_called()
+    assert actual.getvalue() == b"head"
+
+
+def test_sut_raises_storage_operation_error_if_object_changed_after_probing():
+    # Arrange
+    sut = load_remaining
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ClientError(
+        {"Error": {"Code": "PreconditionFailed"}}, "GetObject"
+    )
+
+    # Act & Assert
+    with pytest.raises(StorageOperationError):
+        sut(client_stub, "bucket", "path/to/file", BytesIO(b"head"), 8, "etag")
+
+
+def _client_normal_response(raw_stream: bytes) -> dict:
+    return {"Body": StreamingBody(BytesIO(raw_stream), len(raw_stream))}
+
+
+class _SocketLikeStream(RawIOBase):
+    # Reading makes new bytes like sockets, unlike BytesIO sharing its buffer
+    def __init__(self, raw_stream: bytes):
+        self._view = memoryview(raw_stream)
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        count = min(len(b), len(self._view) - self._offset)
+        b[:count] = self._view[self._offset : self._offset + count]
+        self._offset += count
+        return count
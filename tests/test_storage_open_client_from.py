@@ -0,0 +1,71 @@
+import argparse
+
+import pytest
+
+from image_resizer import config
+from image_resizer.local import LocalClient, MemoryClient
+from image_resizer.storage import add_client_arguments, open_client_from
+
+
+def test_sut_opens_client_of_given_backend():
+    # Arrange
+    sut = open_client_from
+
+    # Act
+    actual = sut(_parse(["--backend", "memory"]))
+
+    # Assert
+    assert isinstance(actual, MemoryClient)
+
+
+def test_sut_opens_local_client_if_only_local_root_is_given(tmp_path):
+    # Arrange
+    sut = open_client_from
+
+    # Act
+    actual = sut(_parse(["--local-root", str(tmp_path)]))
+
+    # Assert
+    assert isinstance(actual, LocalClient)
+
+
+def test_sut_opens_client_of_configured_backend_without_options(monkeypatch):
+    # Arrange
+    sut = open_client_from
+    monkeypatch.setattr(config, "STORAGE_BACKEND", "memory")
+
+    # Act
+    actual = sut(_parse([]))
+
+    # Assert
+    assert isinstance(actual, MemoryClient)
+
+
+def test_sut_opens_client_of_default_backend_of_tool_without_options(monkeypatch):
+    # Arrange
+    sut = open_client_from
+    monkeypatch.setattr(config, "STORAGE_BACKEND", "s3")
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser, default_backend="memory")
+
+    # Act
+    actual = sut(parser.parse_args([]))
+
+    # Assert
+    assert isinstance(actual, MemoryClient)
+
+
+def test_sut_rejects_unknown_backend_in_options():
+    # Arrange
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+
+    # Act & Assert
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--backend", "ftp"])
+
+
+def _parse(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    return parser.parse_args(argv)
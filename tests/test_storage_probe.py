@@ -0,0 +1,103 @@
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from image_resizer.image import ImageFormat, UnsupportedImageFormatError
+from image_resizer.storage import ObjectNotFoundError, StorageOperationError, probe
+
+
+def test_sut_sends_ranged_command_to_client_correctly():
+    # Arrange
+    sut = probe
+    client_spy = MagicMock()
+    client_spy.get_object.return_value = _client_ranged_response(b"", None)
+
+    # Act
+    sut(client_spy, "bucket", "path/to/file", 1024)
+
+    # Assert
+    client_spy.get_object.assert_called_once_with(
+        Bucket="bucket", Key="path/to/file", Range="bytes=0-1023"
+    )
+
+
+def test_sut_returns_head_format_size_and_etag_correctly():
+    # Arrange
+    sut = probe
+    client_stub = MagicMock()
+    client_stub.get_object.return_value = _client_ranged_response(
+        b"head", "bytes 0-3/727858"
+    )
+
+    # Act
+    stream, fmt, size, etag = sut(client_stub, "bucket", "path/to/file", 4)
+
+    # Assert
+    assert stream.getvalue() == b"head"
+    assert fmt == ImageFormat.JPEG
+    assert size == 727858
+    assert etag == '"etag"'
+
+
+def test_sut_returns_size_of_stream_if_range_is_not_applied():
+    # Arrange
+    sut = probe
+    client_stub = MagicMock()
+    client_stub.get_object.return_value = _client_ranged_response(b"small", None)
+
+    # Act
+    _, _, size, _ = sut(client_stub, "bucket", "path/to/file", 1024)
+
+    # Assert
+    assert size == 5
+
+
+def test_sut_raises_object_not_found_error_if_the_requested_path_does_not_exist():
+    # Arrange
+    sut = probe
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ClientError(
+        {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+    )
+
+    # Act & Assert
+    with pytest.raises(ObjectNotFoundError):
+        sut(client_stub, "bucket", "path/to/file", 1024)
+
+
+def test_sut_raises_storage_operation_error_if_client_error_happens():
+    # Arrange
+    sut = probe
+    client_stub = MagicMock()
+    client_stub.get_object.side_effect = ClientError({}, "GetObject")
+
+    # Act & Assert
+    with pytest.raises(StorageOperationError):
+        sut(client_stub, "bucket", "path/to/file", 1024)
+
+
+def test_sut_raises_unsupported_image_format_error_if_image_format_is_unsupported():
+    # Arrange
+    sut = probe
+    client_stub = MagicMock()
+    client_stub.get_object.return_value = _client_ranged_response(
+        b"", None, "text/plain"
+    )
+
+    # Act & Assert
+    with pytest.raises(UnsupportedImageFormatError):
+        sut(client_stub, "bucket", "path/to/file", 1024)
+
+
+def _client_ranged_response(
+    raw_stream: bytes, content_range: str | None, content_type: str = "image/jpeg"
+) -> dict:
+    return {
+        "ContentType": content_type,
+        "ContentRange": content_range,
+        "ETag": '"etag"',
+        "Body": StreamingBody(BytesIO(raw_stream), len(raw_stream)),
+    }
@@ -0,0 +1,85 @@
+import threading
+import time
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+
+from image_resizer.image import ImageFormat
+from image_resizer.storage import (
+    DeadlineExceededError,
+    StorageOperationError,
+    save_many,
+)
+
+
+def test_sut_saves_objects_concurrently():
+    # Arrange
+    sut = save_many
+    # Each save waits for the others, which never happens if they are sequential
+    barrier = threading.Barrier(3, timeout=1)
+    client_spy = MagicMock()
+    client_spy.put_object.side_effect = lambda **params: barrier.wait()
+
+    # Act
+    actual = sut(client_spy, _objects(3))
+
+    # Assert
+    assert actual == [None, None, None]
+    keys = sorted(c.kwargs["Key"] for c in client_spy.put_object.call_args_list)
+    assert keys == ["key0", "key1", "key2"]
+
+
+def test_sut_returns_error_of_each_object_in_order():
+    # Arrange
+    sut = save_many
+    client_stub = MagicMock()
+    client_stub.put_object.side_effect = lambda **params: _fail_on(params, "key1")
+
+    # Act
+    actual = sut(client_stub, _objects(3))
+
+    # Assert
+    assert actual[0] is None
+    assert isinstance(actual[1], StorageOperationError)
+    assert actual[2] is None
+
+
+def test_sut_skips_objects_not_saved_by_deadline():
+    # Arrange
+    sut = save_many
+    client_stub = MagicMock()
+    client_stub.put_object.side_effect = lambda **params: time.sleep(0.5)
+
+    # Act
+    started_at = time.monotonic()
+    actual = sut(client_stub, _objects(2), time.monotonic() + 0.1)
+
+    # Assert
+    assert time.monotonic() - started_at < 0.4
+    assert all(isinstance(error, DeadlineExceededError) for error in actual)
+
+
+def test_sut_does_not_save_objects_if_deadline_has_passed():
+    # Arrange
+    sut = save_many
+    client_spy = MagicMock()
+
+    # Act
+    actual = sut(client_spy, _objects(2), time.monotonic() - 1)
+
+    # Assert
+    assert all(isinstance(error, DeadlineExceededError) for error in actual)
+    client_spy.put_object.assert_not_called()
+
+
+def _objects(count: int) -> list[tuple[str, str, BytesIO, ImageFormat]]:
+    return [
+        ("bucket", f"key{index}", BytesIO(b"resized"), ImageFormat.JPEG)
+        for index in range(count)
+    ]
+
+
+def _fail_on(params: dict, key: str) -> None:
+    if params["Key"] == key:
+        raise ClientError({}, "PutObject")